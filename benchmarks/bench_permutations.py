@@ -0,0 +1,42 @@
+"""
+Micro-benchmark of spin permutations with the NumPy and Numba backends.
+
+Usage: python benchmarks/bench_permutations.py [n_rot]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from enigmatoolbox.permutation_testing import rotate_parcellation, set_backend
+from enigmatoolbox.permutation_testing import _kernels
+from enigmatoolbox.permutation_testing.permutation_testing import _spin_coordinates
+
+
+def _time_rotations(coords, n_rot, backend):
+    set_backend(backend)
+    rotate_parcellation(coords[0], coords[1], nrot=2, random_state=0)  # warm-up (compilation)
+    t0 = time.perf_counter()
+    perm_id = rotate_parcellation(coords[0], coords[1], nrot=n_rot, random_state=0)
+    return time.perf_counter() - t0, perm_id
+
+
+def main(n_rot=1000):
+    backends = ['numpy'] + (['numba'] if _kernels.has_numba else [])
+    print('{0:<16}{1:>8}'.format('parcellation', 'n_rot') + ''.join('{0:>10}'.format(b) for b in backends)
+          + ('{0:>10}{1:>10}'.format('speedup', 'same') if len(backends) > 1 else ''))
+
+    for parc in ['aparc', 'schaefer_400', 'schaefer_1000']:
+        coords = _spin_coordinates('fsa5', parc)
+        times, perms = zip(*[_time_rotations(coords, n_rot, b) for b in backends])
+        line = '{0:<16}{1:>8}'.format(parc, n_rot) + ''.join('{0:>9.2f}s'.format(t) for t in times)
+        if len(backends) > 1:
+            line += '{0:>9.1f}x{1:>10}'.format(times[0] / times[1], str(np.array_equal(*perms)))
+        print(line)
+
+    set_backend('auto')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
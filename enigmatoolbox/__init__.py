@@ -1,4 +1,9 @@
+import logging
+
 from enigmatoolbox._version import __version__
 
+# Progress of long computations is logged, silent unless configured by the user
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 # Default rendering
 OFF_SCREEN = False
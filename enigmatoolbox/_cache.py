@@ -0,0 +1,119 @@
+"""
+On-disk cache for derived data (e.g., permutations).
+"""
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+
+def get_cache_dir(*subdirs):
+    """Return (and create) the cache directory of the toolbox.
+
+    The location is taken from the ``ENIGMA_CACHE_DIR`` environment variable.
+    Otherwise, defaults to ``$XDG_CACHE_HOME/enigmatoolbox`` or
+    ``~/.cache/enigmatoolbox``.
+
+    Parameters
+    ----------
+    subdirs : str, optional
+        Subdirectories within the cache directory.
+
+    Returns
+    -------
+    cache_dir : str
+        Path to cache directory.
+    """
+    cache_dir = os.environ.get('ENIGMA_CACHE_DIR')
+    if cache_dir is None:
+        xdg = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+        cache_dir = os.path.join(xdg, 'enigmatoolbox')
+
+    cache_dir = os.path.join(cache_dir, *subdirs)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+_checksums = {}
+
+
+def file_checksum(*fnames):
+    """Checksum of the contents of one or more files.
+
+    Checksums are memoized per process, and recomputed if the size or
+    modification time of a file changes.
+
+    Parameters
+    ----------
+    fnames : str
+        Paths to files.
+
+    Returns
+    -------
+    checksum : str
+        Hexadecimal SHA1 digest.
+    """
+    sha = hashlib.sha1()
+    for fn in fnames:
+        st = os.stat(fn)
+        key = (os.path.abspath(fn), st.st_size, st.st_mtime_ns)
+        if key not in _checksums:
+            with open(fn, 'rb') as f:
+                _checksums[key] = hashlib.sha1(f.read()).hexdigest()
+        sha.update(_checksums[key].encode())
+    return sha.hexdigest()
+
+
+def array_checksum(*arrays):
+    """Checksum of the contents, shapes and data types of one or more arrays.
+
+    Parameters
+    ----------
+    arrays : ndarray
+        Arrays.
+
+    Returns
+    -------
+    checksum : str
+        Hexadecimal SHA1 digest.
+    """
+    sha = hashlib.sha1()
+    for x in arrays:
+        x = np.ascontiguousarray(x)
+        sha.update('{0}{1}'.format(x.dtype.str, x.shape).encode())
+        sha.update(x.data)
+    return sha.hexdigest()
+
+
+def _umask():
+    """Current file mode creation mask."""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def save_array(fname, x):
+    """Save array to ``.npy`` file atomically.
+
+    The array is first written to a temporary file in the same directory, so
+    concurrent readers never see partially written files.
+
+    Parameters
+    ----------
+    fname : str
+        Output file name.
+    x : ndarray
+        Array to save.
+    """
+    fd, tmp = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(fname))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, x)
+        # temporary files are private, stored files follow the umask
+        os.chmod(tmp, 0o666 & ~_umask())
+        os.replace(tmp, fname)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
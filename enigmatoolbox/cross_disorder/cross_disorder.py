@@ -1,12 +1,14 @@
 import numpy as np
 from sklearn.decomposition import PCA
 
-from enigmatoolbox.datasets.base import load_summary_stats
+from enigmatoolbox.datasets.base import query_summary_stats
+from enigmatoolbox.permutation_testing import spin_test_many, shuf_test_many
 
 
 def cross_disorder_effect(disorder='all_disorder', measure=None,
                           additional_data_cortex=None, additional_name_cortex=None, additional_data_subcortex=None,
-                          additional_name_subcortex=None, ignore=None, include=None, method='pca'):
+                          additional_name_subcortex=None, ignore=None, include=None, method='pca',
+                          spin_pvalues=False, n_rot=1000, random_state=None, n_jobs=1):
     """Cross-disorder effect (authors: @boyongpark, @saratheriver)
 
         Parameters
@@ -30,6 +32,17 @@ def cross_disorder_effect(disorder='all_disorder', measure=None,
             Include only summary statistics with these expressions. Default is empty, i.e., include everything.
         method : string, optional
             Analysis method {'pca', 'correlation'}. Default is 'pca'.
+        spin_pvalues : bool, optional
+            Whether to compute permutation p-values of the correlation matrices. Cortical maps are
+            permuted once with a shared set of spin rotations, and subcortical maps with a shared set
+            of shuffles. Only used if method is 'correlation'. Default is False.
+        n_rot : int, optional
+            Number of spin rotations (and shuffles). Only used if ``spin_pvalues is True``. Default is 1000.
+        random_state : int or None, optional
+            Random state. Only used if ``spin_pvalues is True``. Default is None.
+        n_jobs : int, optional
+            Number of parallel jobs used to generate permutations. Only used if ``spin_pvalues is True``.
+            Default is 1.
 
         Returns
         -------
@@ -40,6 +53,9 @@ def cross_disorder_effect(disorder='all_disorder', measure=None,
             Variance of components. Only is method is 'pca'.
         correlation_matrix : dict
             Correlation matrices of for every pair of shared effect maps. Only is method is 'correlation'.
+        pvalue_matrix : dict
+            Permutation p-values of correlation matrices. Only if method is 'correlation' and
+            ``spin_pvalues is True``.
         names : dict
             Names of disorder and case-control effect maps included in analysis.
     """
@@ -55,8 +71,11 @@ def cross_disorder_effect(disorder='all_disorder', measure=None,
     mat_d = {'cortex': [], 'subcortex': []}
     names = {'cortex': [], 'subcortex': []}
     for _, ii in enumerate(disorder):
-        # Load summary statistics
-        sum_stats = load_summary_stats(ii)
+        # Load effect sizes (Cohen's d) of cortical and subcortical summary statistics
+        d_ctx, tables_ctx, _ = query_summary_stats(disorder=ii, measure=['CortThick', 'CortSurf'])
+        d_sctx, tables_sctx, _ = query_summary_stats(disorder=ii, measure='SubVol')
+        sum_stats = dict(zip(tables_ctx['key'], d_ctx))
+        sum_stats.update(zip(tables_sctx['key'], d_sctx))
         fieldos = list(sum_stats.keys())
 
         # Loop through structure fields (case-control options)
@@ -64,25 +83,25 @@ def cross_disorder_effect(disorder='all_disorder', measure=None,
             if 'Cort' in jj:
                 if not include:
                     if not any(ig in jj for ig in ignore) and any(meas in jj for meas in measure):
-                        mat_d['cortex'].append(sum_stats[jj].iloc[:, 2])
+                        mat_d['cortex'].append(sum_stats[jj])
                         names['cortex'].append(ii + ': ' + jj)
 
                 elif include:
                     if any(inc in jj for inc in include) and not any(ig in jj for ig in ignore) \
                             and any(meas in jj for meas in measure):
-                        mat_d['cortex'].append(sum_stats[jj].iloc[:, 2])
+                        mat_d['cortex'].append(sum_stats[jj])
                         names['cortex'].append(ii + ': ' + jj)
 
             if 'Sub' in jj:
                 if not include:
                     if not any(ig in jj for ig in ignore) and any(meas in jj for meas in measure):
-                        mat_d['subcortex'].append(sum_stats[jj].iloc[:, 2])
+                        mat_d['subcortex'].append(sum_stats[jj])
                         names['subcortex'].append(ii + ': ' + jj)
 
                 elif include:
                     if any(inc in jj for inc in include) and not any(ig in jj for ig in ignore) \
                             and any(meas in jj for meas in measure):
-                        mat_d['subcortex'].append(sum_stats[jj].iloc[:, 2])
+                        mat_d['subcortex'].append(sum_stats[jj])
                         names['subcortex'].append(ii + ': ' + jj)
 
     for ii, jj in enumerate(mat_d):
@@ -90,12 +109,16 @@ def cross_disorder_effect(disorder='all_disorder', measure=None,
 
     # If additional data and name
     if additional_data_cortex is not None and additional_name_cortex is not None:
-        mat_d['cortex'] = np.append(mat_d['cortex'], additional_data_cortex)
-        names['cortex'] = np.append(names['cortex'], additional_name_cortex)
+        # one map per row, also for a single additional map
+        additional_data_cortex = np.atleast_2d(additional_data_cortex)
+        mat_d['cortex'] = np.vstack((mat_d['cortex'].reshape(-1, additional_data_cortex.shape[1]), additional_data_cortex))
+        names['cortex'] = np.hstack((names['cortex'], np.atleast_1d(additional_name_cortex)))
 
     if additional_data_subcortex is not None and additional_name_subcortex is not None:
-        mat_d['subcortex'] = np.append(mat_d['subcortex'], additional_data_subcortex)
-        names['subcortex'] = np.append(names['subcortex'], additional_name_subcortex)
+        # one map per row, also for a single additional map
+        additional_data_subcortex = np.atleast_2d(additional_data_subcortex)
+        mat_d['subcortex'] = np.vstack((mat_d['subcortex'].reshape(-1, additional_data_subcortex.shape[1]), additional_data_subcortex))
+        names['subcortex'] = np.hstack((names['subcortex'], np.atleast_1d(additional_name_subcortex)))
 
     if method == 'pca':
         components = {'cortex': [], 'subcortex': []}
@@ -116,5 +139,20 @@ def cross_disorder_effect(disorder='all_disorder', measure=None,
         correlation_matrix['cortex'] = np.corrcoef(mat_d['cortex'])
         correlation_matrix['subcortex'] = np.corrcoef(mat_d['subcortex'])
 
+        if spin_pvalues is True:
+            pvalue_matrix = {'cortex': [], 'subcortex': []}
+
+            # every map is permuted once, null correlations of all pairs are batched
+            _, pvalue_matrix['cortex'] = spin_test_many(np.transpose(mat_d['cortex']),
+                                                        np.transpose(mat_d['cortex']),
+                                                        surface_name='fsa5', parcellation_name='aparc',
+                                                        n_rot=n_rot, random_state=random_state, n_jobs=n_jobs)
+            _, pvalue_matrix['subcortex'] = shuf_test_many(np.transpose(mat_d['subcortex']),
+                                                           np.transpose(mat_d['subcortex']),
+                                                           n_rot=n_rot, random_state=random_state,
+                                                           n_jobs=n_jobs)
+
+            return correlation_matrix, pvalue_matrix, names
+
         return correlation_matrix, names
 
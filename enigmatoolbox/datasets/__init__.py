@@ -1,8 +1,8 @@
 from .base import (load_conte69, load_sc, load_fc, load_fsa,
                    load_fsa5, load_subcortical, structural_covariance,
                    fetch_ahba, risk_genes, load_example_data,
-                   load_summary_stats, load_fc_as_one, load_sc_as_one,
-                   nfaces, getaffine, load_mask, write_cifti)
+                   load_summary_stats, query_summary_stats, load_fc_as_one, load_sc_as_one,
+                   nfaces, getaffine, load_mask, write_cifti, write_ciftis, CiftiWriter)
 
 __all__ = ['load_conte69',
            'load_fsa',
@@ -15,9 +15,12 @@ __all__ = ['load_conte69',
            'risk_genes',
            'load_example_data',
            'load_summary_stats',
+           'query_summary_stats',
            'load_fc_as_one',
            'load_sc_as_one',
            'nfaces',
            'getaffine',
            'load_mask',
-           'write_cifti']
+           'write_cifti',
+           'write_ciftis',
+           'CiftiWriter']
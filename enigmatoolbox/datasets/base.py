@@ -1,13 +1,20 @@
 import os
+import warnings
+import tempfile
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
 import numpy as np
 import pandas as pd
 import nibabel as nib
+from joblib import Parallel, delayed
 
-from vtk import vtkPolyDataNormals
+from vtk import vtkPoints, vtkPolyData, vtkPolyDataNormals
 
 from ..mesh.mesh_io import read_surface
 from ..mesh.mesh_operations import combine_surfaces
 from ..vtk_interface import wrap_vtk, serial_connect
+from .._cache import get_cache_dir, file_checksum, save_array
 
 
 def load_mask(name='midline', surface_name="fsa5", join=False):
@@ -57,6 +64,52 @@ def load_mask(name='midline', surface_name="fsa5", join=False):
     return mask_lh, mask_rh
 
 
+_template_surfaces = {}
+
+
+def _load_template_surfaces(ipth, with_normals=True):
+    """Surfaces of left and right hemispheres, read once per process.
+
+    A pristine copy of each template is kept in memory. Callers receive copies
+    that only share the cells (topology) with the template; points and point
+    data (e.g., normals) are deep-copied, so modifying them in place does not
+    affect the template or surfaces loaded afterwards.
+
+    Parameters
+    ----------
+    ipth : str
+        Path to surfaces, formatted with 'lh' and 'rh'.
+    with_normals : bool, optional
+        Whether to compute surface normals. Default is True.
+
+    Returns
+    -------
+    surfs : list of BSPolyData
+        Surfaces for left and right hemispheres.
+    """
+    key = (ipth, with_normals)
+    if key not in _template_surfaces:
+        surfs = [None] * 2
+        for i, side in enumerate(['lh', 'rh']):
+            surfs[i] = read_surface(ipth.format(side))
+            if with_normals:
+                nf = wrap_vtk(vtkPolyDataNormals, splitting=False,
+                              featureAngle=0.1)
+                surfs[i] = serial_connect(surfs[i], nf)
+        _template_surfaces[key] = surfs
+
+    surfs = [None] * 2
+    for i, template in enumerate(_template_surfaces[key]):
+        surfs[i] = wrap_vtk(vtkPolyData)
+        surfs[i].ShallowCopy(template.VTKObject)
+
+        points = vtkPoints()
+        points.DeepCopy(template.VTKObject.GetPoints())
+        surfs[i].VTKObject.SetPoints(points)
+        surfs[i].VTKObject.GetPointData().DeepCopy(template.VTKObject.GetPointData())
+    return surfs
+
+
 def load_conte69(as_sphere=False, with_normals=True, join=False):
     """Load conte69 surfaces (author: @OualidBenkarim)
 
@@ -82,13 +135,7 @@ def load_conte69(as_sphere=False, with_normals=True, join=False):
         fname = 'conte69_32k_{}.gii'
 
     ipth = os.path.join(root_pth, 'surfaces', fname)
-    surfs = [None] * 2
-    for i, side in enumerate(['lh', 'rh']):
-        surfs[i] = read_surface(ipth.format(side))
-        if with_normals:
-            nf = wrap_vtk(vtkPolyDataNormals, splitting=False,
-                          featureAngle=0.1)
-            surfs[i] = serial_connect(surfs[i], nf)
+    surfs = _load_template_surfaces(ipth, with_normals=with_normals)
 
     if join:
         return combine_surfaces(*surfs)
@@ -128,13 +175,7 @@ def load_fsa5(as_sphere=False, with_normals=True, join=False, with_sctx=False):
         fname = 'fsa5_with_sctx_{}.gii'
 
     ipth = os.path.join(root_pth, 'surfaces', fname)
-    surfs = [None] * 2
-    for i, side in enumerate(['lh', 'rh']):
-        surfs[i] = read_surface(ipth.format(side))
-        if with_normals:
-            nf = wrap_vtk(vtkPolyDataNormals, splitting=False,
-                          featureAngle=0.1)
-            surfs[i] = serial_connect(surfs[i], nf)
+    surfs = _load_template_surfaces(ipth, with_normals=with_normals)
 
     if join:
         return combine_surfaces(*surfs)
@@ -167,13 +208,7 @@ def load_fsa(as_sphere=False, with_normals=True, join=False):
         fname = 'fsa_{}.gii'
 
     ipth = os.path.join(root_pth, 'surfaces', fname)
-    surfs = [None] * 2
-    for i, side in enumerate(['lh', 'rh']):
-        surfs[i] = read_surface(ipth.format(side))
-        if with_normals:
-            nf = wrap_vtk(vtkPolyDataNormals, splitting=False,
-                          featureAngle=0.1)
-            surfs[i] = serial_connect(surfs[i], nf)
+    surfs = _load_template_surfaces(ipth, with_normals=with_normals)
 
     if join:
         return combine_surfaces(*surfs)
@@ -201,19 +236,59 @@ def load_subcortical(with_normals=False, join=False):
     fname = 'sctx_{}.gii'
 
     ipth = os.path.join(root_pth, 'surfaces', fname)
-    surfs = [None] * 2
-    for i, side in enumerate(['lh', 'rh']):
-        surfs[i] = read_surface(ipth.format(side))
-        if with_normals:
-            nf = wrap_vtk(vtkPolyDataNormals, splitting=False,
-                          featureAngle=0.1)
-            surfs[i] = serial_connect(surfs[i], nf)
+    surfs = _load_template_surfaces(ipth, with_normals=with_normals)
 
     if join:
         return combine_surfaces(*surfs)
     return surfs[0], surfs[1]
 
 
+# Maximum number of connectivity arrays kept in memory per process
+_CONNECTIVITY_CACHE_SIZE = 32
+
+_connectivity_arrays = OrderedDict()
+
+
+def _load_connectivity_csv(fname, dtype=float):
+    """Load connectivity matrix or labels from a csv file, cached in binary form.
+
+    The array is parsed once and stored as ``.npy`` in the cache directory (see
+    :func:`enigmatoolbox._cache.get_cache_dir`), identified by a checksum of the
+    csv file. Later calls memory-map the stored array, and the most recently used
+    arrays are also kept in memory.
+
+    Returns
+    -------
+    x : ndarray
+        Read-only array. Memory-mapped arrays are shared between processes.
+    """
+    checksum = file_checksum(fname)
+    key = (checksum, np.dtype(dtype).str)
+    if key in _connectivity_arrays:
+        _connectivity_arrays.move_to_end(key)
+        return _connectivity_arrays[key]
+
+    name = '{0}_{1}_{2}.npy'.format(os.path.splitext(os.path.basename(fname))[0], np.dtype(dtype).kind,
+                                   checksum[:16])
+    cache_fname = os.path.join(get_cache_dir('hcp_connectivity'), name)
+    if not os.path.isfile(cache_fname):
+        x = np.loadtxt(fname, dtype=dtype, delimiter=',')
+        try:
+            save_array(cache_fname, x)
+        except OSError as e:
+            warnings.warn('Could not store connectivity data: {0}'.format(e))
+            cache_fname = None
+
+    if cache_fname is not None:
+        x = np.load(cache_fname, mmap_mode='r')
+    x.flags.writeable = False
+
+    _connectivity_arrays[key] = x
+    if len(_connectivity_arrays) > _CONNECTIVITY_CACHE_SIZE:
+        _connectivity_arrays.popitem(last=False)
+    return x
+
+
 def load_sc(parcellation='aparc'):
     """Load structural connectivity data (author: @saratheriver)
 
@@ -233,6 +308,9 @@ def load_sc(parcellation='aparc'):
             Subcortico-cortical connectivity, shape = (14, n)
         strucLabels_sctx : 1D ndarray
             Subcortical labels, shape = (14,)
+        Notes
+        -----
+        Arrays are read-only and cached between calls. Use ``np.array(x)`` for a writable copy.
     """
     root_pth = os.path.dirname(__file__)
 
@@ -262,10 +340,10 @@ def load_sc(parcellation='aparc'):
         sctxL = 'strucLabels_sctx_' + parcellation + '.csv'
         sctxL_ipth = os.path.join(root_pth, 'matrices', 'hcp_connectivity', sctxL)
 
-    return np.loadtxt(ctx_ipth, dtype=float, delimiter=','), \
-           np.loadtxt(ctxL_ipth, dtype=str, delimiter=','), \
-           np.loadtxt(sctx_ipth, dtype=float, delimiter=','), \
-           np.loadtxt(sctxL_ipth, dtype=str, delimiter=',')
+    return _load_connectivity_csv(ctx_ipth), \
+           _load_connectivity_csv(ctxL_ipth, dtype=str), \
+           _load_connectivity_csv(sctx_ipth), \
+           _load_connectivity_csv(sctxL_ipth, dtype=str)
 
 
 def load_fc(parcellation='aparc'):
@@ -287,6 +365,9 @@ def load_fc(parcellation='aparc'):
             Subcortico-cortical connectivity, shape = (14, n)
         funcLabels_sctx : 1D ndarray
             Subcortical labels, shape = (14,)
+        Notes
+        -----
+        Arrays are read-only and cached between calls. Use ``np.array(x)`` for a writable copy.
     """
     root_pth = os.path.dirname(__file__)
 
@@ -316,10 +397,10 @@ def load_fc(parcellation='aparc'):
         sctxL = 'funcLabels_sctx_' + parcellation + '.csv'
         sctxL_ipth = os.path.join(root_pth, 'matrices', 'hcp_connectivity', sctxL)
 
-    return np.loadtxt(ctx_ipth, dtype=float, delimiter=','), \
-           np.loadtxt(ctxL_ipth, dtype=str, delimiter=','), \
-           np.loadtxt(sctx_ipth, dtype=float, delimiter=','), \
-           np.loadtxt(sctxL_ipth, dtype=str, delimiter=',')
+    return _load_connectivity_csv(ctx_ipth), \
+           _load_connectivity_csv(ctxL_ipth, dtype=str), \
+           _load_connectivity_csv(sctx_ipth), \
+           _load_connectivity_csv(sctxL_ipth, dtype=str)
 
 
 def load_sc_as_one(parcellation='aparc'):
@@ -337,6 +418,9 @@ def load_sc_as_one(parcellation='aparc'):
             Structural connectivity, shape = (n+14, n+14)
         strucLabels_ctx : 1D ndarray
             Region labels, shape = (n+14,)
+        Notes
+        -----
+        Arrays are read-only and cached between calls. Use ``np.array(x)`` for a writable copy.
     """
     root_pth = os.path.dirname(__file__)
     if parcellation == 'aparc':
@@ -353,8 +437,8 @@ def load_sc_as_one(parcellation='aparc'):
         ctxL = 'strucLabels_with_sctx_' + parcellation + '.csv'
         ctxL_ipth = os.path.join(root_pth, 'matrices', 'hcp_connectivity', ctxL)
 
-    return np.loadtxt(ctx_ipth, dtype=float, delimiter=','), \
-           np.loadtxt(ctxL_ipth, dtype=str, delimiter=','), \
+    return _load_connectivity_csv(ctx_ipth), \
+           _load_connectivity_csv(ctxL_ipth, dtype=str), \
 
 
 def load_fc_as_one(parcellation='aparc'):
@@ -372,6 +456,9 @@ def load_fc_as_one(parcellation='aparc'):
             Functional connectivity, shape = (n+14, n+14)
         funcLabels_ctx : 1D ndarray
             Region labels, shape = (n+14,)
+        Notes
+        -----
+        Arrays are read-only and cached between calls. Use ``np.array(x)`` for a writable copy.
     """
     root_pth = os.path.dirname(__file__)
 
@@ -389,31 +476,90 @@ def load_fc_as_one(parcellation='aparc'):
         ctxL = 'funcLabels_with_sctx_' + parcellation + '.csv'
         ctxL_ipth = os.path.join(root_pth, 'matrices', 'hcp_connectivity', ctxL)
 
-    return np.loadtxt(ctx_ipth, dtype=float, delimiter=','), \
-           np.loadtxt(ctxL_ipth, dtype=str, delimiter=','), \
+    return _load_connectivity_csv(ctx_ipth), \
+           _load_connectivity_csv(ctxL_ipth, dtype=str), \
+
 
+# Maximum number of elements of the blocks of networks computed at once
+_MAX_BLOCK_ELEMENTS = 2 ** 23
 
-def structural_covariance(zdata):
+
+def structural_covariance(zdata, dtype=float, triu=False, out=None):
     """Construction of intra-individual brain structural covariance networks
 
         Parameters
         ----------
         zdata : z-scored matrix (#subjects x #features) of morphological features
                 (e.g., cortical thickness + subcortical volume)
+        dtype : data-type, optional
+            Data type of the networks, e.g., np.float32 to halve memory. Default is float.
+        triu : bool, optional
+            If True, return only the upper triangle (without the diagonal, which is always 1)
+            of the networks, ordered as in ``np.triu_indices(#features, k=1)``. Default is False.
+        out : str or ndarray, optional
+            If str, networks are written in blocks of subjects to a ``.npy`` file with this
+            name, and returned memory-mapped. If ndarray (e.g., a memory-mapped array), networks
+            are written to it. Default is None.
 
         Returns
         -------
         joint_var_matrix : ndarray #features x #features x #subjects
+            Networks of all subjects. If ``triu == True``, ndarray #pairs x #subjects.
     """
-    joint_var_matrix = np.zeros((zdata.shape[1], zdata.shape[1], zdata.shape[0]))
-    for kk in range(zdata.shape[0]):
-        for ii in range(zdata.shape[1]):
-            for jj in range(zdata.shape[1]):
-                joint_var_matrix[ii, jj, kk] = 1 / np.exp(np.square(zdata[kk, ii] - zdata[kk, jj]))
+    zdata = np.asarray(zdata, dtype=dtype)
+    n_subjects, n_features = zdata.shape
+    if triu:
+        idx_i, idx_j = np.triu_indices(n_features, k=1)
+        shape = (idx_i.size, n_subjects)
+    else:
+        shape = (n_features, n_features, n_subjects)
+
+    if out is None:
+        joint_var_matrix = np.empty(shape, dtype=dtype)
+    elif isinstance(out, str):
+        joint_var_matrix = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+    else:
+        if out.shape != shape:
+            raise ValueError("Output must have shape {0}.".format(shape))
+        joint_var_matrix = out
+
+    # subjects in blocks, each a broadcast over pairs of features
+    block_size = max(1, _MAX_BLOCK_ELEMENTS // max(1, np.prod(shape[:-1])))
+    for k in range(0, n_subjects, block_size):
+        z = zdata[k:k + block_size].T
+        if triu:
+            diff = z[idx_i] - z[idx_j]
+        else:
+            diff = z[:, None] - z[None]
+        np.square(diff, out=diff)
+        np.exp(diff, out=diff)
+        joint_var_matrix[..., k:k + block_size] = np.reciprocal(diff, out=diff)
+
+    if isinstance(joint_var_matrix, np.memmap):
+        joint_var_matrix.flush()
     return joint_var_matrix
 
 
-def fetch_ahba(csvfile=None):
+_AHBA_URL = 'https://raw.githubusercontent.com/saratheriver/enigma-extra/master/ahba/allgenes_stable_r0.2.csv'
+
+
+def _import_ahba(df, fname):
+    """Store gene expression table as arrays of labels, gene names and values.
+
+    Values are stored as float32 with one row per gene, so the expression of a
+    gene is contiguous on disk and can be read without the other genes.
+    """
+    labels = df.iloc[:, 0].to_numpy(dtype=str)
+    genes = df.columns[1:].to_numpy(dtype=str)
+    values = np.ascontiguousarray(df.iloc[:, 1:].to_numpy(dtype=np.float32).T)
+
+    # values last, written once the others exist
+    for k, x in [('columns', df.columns[:1].to_numpy(dtype=str)), ('labels', labels), ('genes', genes),
+                 ('values', values)]:
+        save_array(fname.format(k), x)
+
+
+def fetch_ahba(csvfile=None, genes=None, offline=False):
     """Fetch Allen Human Brain Atlas microarray expression data from all donors and all genes (author: @saratheriver)
 
         Parameters
@@ -422,17 +568,47 @@ def fetch_ahba(csvfile=None):
             Path to downloaded csvfile. For more threshold and parcellation options, download csvfile from here:
             https://github.com/saratheriver/enigma-extra/tree/master/ahba
             If None (default), fetches microarray expression data from the internet (aparc and stable r > 0.2).
+        genes : list, optional
+            Names of genes to load. Default is None, i.e., load all genes.
+        offline : bool, optional
+            If True, never fetch data from the internet, and raise an error if they were
+            not fetched before. Only used if csvfile is None. Default is False.
 
         Returns
         -------
         genes : pandas.DataFrame
             Table of gene co-expression data, shape = (82, 15633)
-     """
+
+        Notes
+        -----
+        Data are imported once into the cache directory (see :func:`enigmatoolbox._cache.get_cache_dir`)
+        as float32, and are memory-mapped in later calls, so only the requested genes are read.
+    """
     if csvfile is None:
-        url = 'https://raw.githubusercontent.com/saratheriver/enigma-extra/master/ahba/allgenes_stable_r0.2.csv'
-        return pd.read_csv(url, error_bad_lines=False)
+        name = os.path.splitext(os.path.basename(_AHBA_URL))[0]
     else:
-        return pd.read_csv(csvfile, error_bad_lines=False)
+        name = '{0}_{1}'.format(os.path.splitext(os.path.basename(csvfile))[0], file_checksum(csvfile)[:16])
+    fname = os.path.join(get_cache_dir('ahba'), name + '_{0}.npy')
+
+    if not os.path.isfile(fname.format('values')):
+        if csvfile is None and offline:
+            raise FileNotFoundError("Gene expression data not found in '{0}', fetch them once without "
+                                    "offline or provide csvfile.".format(os.path.dirname(fname)))
+        _import_ahba(pd.read_csv(_AHBA_URL if csvfile is None else csvfile, error_bad_lines=False), fname)
+
+    values = np.load(fname.format('values'), mmap_mode='r')
+    gene_names = np.load(fname.format('genes'))
+    if genes is None:
+        idx = np.arange(gene_names.size)
+    else:
+        pos = pd.Index(gene_names).get_indexer(genes)
+        if np.any(pos < 0):
+            raise ValueError("Unknown genes: {0}.".format(', '.join(np.asarray(genes)[pos < 0])))
+        idx = pos
+
+    expression = pd.DataFrame(values[idx].T, columns=gene_names[idx])
+    expression.insert(0, str(np.load(fname.format('columns'))[0]), np.load(fname.format('labels')))
+    return expression
 
 
 def risk_genes(disorder=None):
@@ -568,6 +744,125 @@ def load_example_data():
            pd.read_csv(metr3, error_bad_lines=False)
 
 
+# Disorder of each cohort in the file names of summary_statistics, and the cohort
+# suffix of their keys (e.g., 'mddadult' tables are 'depression' keys ending in 'adult')
+_SUMMARY_STATS_COHORTS = {
+    '22q': ('22q', None),
+    'adhdallages': ('adhd', 'allages'),
+    'adhdadult': ('adhd', 'adult'),
+    'adhdadolescent': ('adhd', 'adolescent'),
+    'adhdpediatric': ('adhd', 'pediatric'),
+    'asd': ('asd', None),
+    'bd': ('bipolar', None),
+    'mdd': ('depression', None),
+    'mddadult': ('depression', 'adult'),
+    'mddadolescent': ('depression', 'adolescent'),
+    'mddearly': ('depression', 'early'),
+    'mddlate': ('depression', 'late'),
+    'mddfirstepisode': ('depression', 'firstepisode'),
+    'mddrecurrent': ('depression', 'recurrent'),
+    'allepi': ('epilepsy', 'allepilepsy'),
+    'allotherepi': ('epilepsy', 'allotherepilepsy'),
+    'gge': ('epilepsy', 'gge'),
+    'tlemtsl': ('epilepsy', 'ltle'),
+    'tlemtsr': ('epilepsy', 'rtle'),
+    'ocdadult': ('ocd', 'adult'),
+    'ocdadults': ('ocd', 'adult'),
+    'ocdpediatric': ('ocd', 'pediatric'),
+    'scz': ('schizophrenia', None),
+}
+
+# Contrasts whose keys are not of the form 'a_vs_b', kept as in earlier releases
+_SUMMARY_STATS_CONTRASTS = {
+    'psych+-psych-': 'psychP_vs_psychN',
+    'recurrent-firstepisode': 'recurrrent_vs_firstepisode',
+    'medicatedcase-unmedicatedcase': 'medicatedcase_vs_unmedicated',
+}
+
+
+_SUMMARY_STATS_MEASURES = ['CortThick', 'CortSurf', 'SubVol']
+
+
+def _parse_summary_stats_name(fname):
+    """Cohort, contrast, measure and subgroup of a summary statistics file name,
+    e.g., 'mddadult_case-controls_CortThick_early.csv' gives
+    ('mddadult', 'case-controls', 'CortThick', 'early'). Subgroup is None if absent.
+    """
+    parts = os.path.splitext(os.path.basename(fname))[0].split('_')
+    im = next(i for i, p in enumerate(parts) if p in _SUMMARY_STATS_MEASURES)
+
+    # analyses (e.g., meta-analysis) are subgroups too
+    subgroup = '_'.join(parts[1:im - 1] + parts[im + 1:]) or None
+    return parts[0], parts[im - 1], parts[im], subgroup
+
+
+_summary_stats_index = None
+
+
+def _summary_stats_key(cohort, contrast, measure, subgroup):
+    """Key of a summary statistics table, e.g., 'CortThick_case_vs_controls_adult_early'."""
+    contrast = _SUMMARY_STATS_CONTRASTS.get(contrast, contrast.replace('-', '_vs_'))
+    suffixes = [_SUMMARY_STATS_COHORTS[cohort][1], subgroup and subgroup.replace('-', '_')]
+    return '_'.join([measure, contrast] + [s for s in suffixes if s])
+
+
+def _get_summary_stats_index():
+    """Index of the summary statistics of all disorders, parsed from the names of
+    the files in ``summary_statistics``.
+
+    Returns
+    -------
+    index : pandas.DataFrame
+        One row per table, with columns 'disorder', 'key', 'file', 'cohort',
+        'contrast', 'measure' and 'subgroup'.
+    """
+    global _summary_stats_index
+    if _summary_stats_index is None:
+        root_pth = os.path.join(os.path.dirname(__file__), 'summary_statistics')
+        rows = []
+        for fname in sorted(os.listdir(root_pth)):
+            if not fname.endswith('.csv'):
+                continue
+            cohort, contrast, measure, subgroup = _parse_summary_stats_name(fname)
+            if cohort not in _SUMMARY_STATS_COHORTS:
+                raise ValueError("Unknown cohort '{0}'.".format(cohort))
+            rows.append((_SUMMARY_STATS_COHORTS[cohort][0], _summary_stats_key(cohort, contrast, measure, subgroup),
+                         fname, cohort, contrast, measure, subgroup))
+        _summary_stats_index = pd.DataFrame(rows, columns=['disorder', 'key', 'file', 'cohort', 'contrast',
+                                                           'measure', 'subgroup'])
+    return _summary_stats_index.copy()
+
+
+class _LazySummaryStats(MutableMapping):
+    """Mapping of summary statistics tables, each read on first access."""
+
+    def __init__(self, files):
+        self._files = OrderedDict(files)
+        self._tables = {}
+
+    def __getitem__(self, key):
+        if key not in self._tables:
+            self._tables[key] = pd.read_csv(self._files[key], error_bad_lines=False)
+        return self._tables[key]
+
+    def __setitem__(self, key, value):
+        self._files[key] = None
+        self._tables[key] = value
+
+    def __delitem__(self, key):
+        del self._files[key]
+        self._tables.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, list(self._files))
+
+
 def load_summary_stats(disorder=None):
     """Outputs summary statistics for a given disorder (author: @saratheriver)
 
@@ -578,440 +873,155 @@ def load_summary_stats(disorder=None):
 
         Returns
         -------
-        summary_stats : pandas.DataFrame
-            Available summary statistics
+        summary_stats : dict-like
+            Available summary statistics (pandas.DataFrame). Tables are only read
+            from disk when first accessed.
     """
-    root_pth = os.path.dirname(__file__)
+    index = _get_summary_stats_index()
+    if disorder not in index['disorder'].values:
+        raise ValueError("must specify a valid disorder...!")
 
-    if disorder == "22q":
-        CortThick_case_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                             '22q_case-controls_CortThick.csv'), error_bad_lines=False)
-        CortSurf_case_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                         '22q_case-controls_CortSurf.csv'), error_bad_lines=False)
-        CortThick_psychP_psychN = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                           '22q_psych+-psych-_CortThick.csv'), error_bad_lines=False)
-        CortSurf_psychP_psychN = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                          '22q_psych+-psych-_CortSurf.csv'), error_bad_lines=False)
-        SubVol_case_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                           '22q_case-controls_SubVol.csv'), error_bad_lines=False)
-        SubVol_case_controls_AB = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                        '22q_case-controls_SubVol_AB.csv'), error_bad_lines=False)
-        SubVol_case_controls_AD = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                        '22q_case-controls_SubVol_AD.csv'), error_bad_lines=False)
-        SubVol_AB_AD = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                        '22q_AB-AD_SubVol.csv'), error_bad_lines=False)
-        SubVol_psychP_psychN = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                          '22q_psych+-psych-_SubVol.csv'), error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls': CortThick_case_controls,
-                'CortSurf_case_vs_controls': CortSurf_case_controls,
-                'CortThick_psychP_vs_psychN': CortThick_psychP_psychN,
-                'CortSurf_psychP_vs_psychN': CortSurf_psychP_psychN,
-                'SubVol_case_vs_controls': SubVol_case_controls,
-                'SubVol_case_vs_controls_AD': SubVol_case_controls_AD,
-                'SubVol_case_vs_controls_AB': SubVol_case_controls_AB,
-                'SubVol_AB_vs_AD': SubVol_AB_AD,
-                'SubVol_psychP_vs_psychN': SubVol_psychP_psychN}
-
-    elif disorder == "adhd":
-        CortThick_case_controls_allages = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'adhdallages_case-controls_CortThick.csv'),
-            error_bad_lines=False)
-        CortSurf_case_controls_allages = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                  'adhdallages_case-controls_CortSurf.csv'),
-                                                     error_bad_lines=False)
-        CortThick_case_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                 'adhdadult_case-controls_CortThick.csv'),
-                                                    error_bad_lines=False)
-        CortSurf_case_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                'adhdadult_case-controls_CortSurf.csv'),
-                                                   error_bad_lines=False)
-        CortThick_case_controls_adolescent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                      'adhdadolescent_case-controls_CortThick.csv'),
-                                                         error_bad_lines=False)
-        CortSurf_case_controls_adolescent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                     'adhdadolescent_case-controls_CortSurf.csv'),
-                                                        error_bad_lines=False)
-        CortThick_case_controls_pediatric = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                     'adhdpediatric_case-controls_CortThick.csv'),
-                                                        error_bad_lines=False)
-        CortSurf_case_controls_pediatric = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                    'adhdpediatric_case-controls_CortSurf.csv'),
-                                                       error_bad_lines=False)
-        SubVol_case_controls_allages = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'adhdallages_case-controls_SubVol.csv'),
-            error_bad_lines=False)
-        SubVol_case_controls_adult = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'adhdadult_case-controls_SubVol.csv'),
-            error_bad_lines=False)
-        SubVol_case_controls_adolescent = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'adhdadolescent_case-controls_SubVol.csv'),
-            error_bad_lines=False)
-        SubVol_case_controls_pediatric = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'adhdpediatric_case-controls_SubVol.csv'),
-            error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls_allages': CortThick_case_controls_allages,
-                'CortSurf_case_vs_controls_allages': CortSurf_case_controls_allages,
-                'CortThick_case_vs_controls_adult': CortThick_case_controls_adult,
-                'CortSurf_case_vs_controls_adult': CortSurf_case_controls_adult,
-                'CortThick_case_vs_controls_adolescent': CortThick_case_controls_adolescent,
-                'CortSurf_case_vs_controls_adolescent': CortSurf_case_controls_adolescent,
-                'CortThick_case_vs_controls_pediatric': CortThick_case_controls_pediatric,
-                'CortSurf_case_vs_controls_pediatric': CortSurf_case_controls_pediatric,
-                'SubVol_case_vs_controls_allages':SubVol_case_controls_allages,
-                'SubVol_case_vs_controls_adult':SubVol_case_controls_adult,
-                'SubVol_case_vs_controls_adolescent':SubVol_case_controls_adolescent,
-                'SubVol_case_vs_controls_pediatric':SubVol_case_controls_pediatric}
+    root_pth = os.path.join(os.path.dirname(__file__), 'summary_statistics')
+    index = index[index['disorder'] == disorder]
+    return _LazySummaryStats((key, os.path.join(root_pth, fname)) for key, fname in zip(index['key'], index['file']))
 
-    elif disorder == "asd":
-        CortThick_case_controls_meta_analysis = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'asd_meta-analysis_case-controls_CortThick.csv'),
-            error_bad_lines=False)
-        CortThick_case_controls_mega_analysis = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'asd_mega-analysis_case-controls_CortThick.csv'),
-            error_bad_lines=False)
-        SubVol_case_controls_meta_analysis = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'asd_meta-analysis_case-controls_SubVol.csv'),
-            error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls_meta_analysis': CortThick_case_controls_meta_analysis,
-                'CortThick_case_vs_controls_mega_analysis': CortThick_case_controls_mega_analysis,
-                'SubVol_case_vs_controls_meta_analysis': SubVol_case_controls_meta_analysis}
 
-    elif disorder == "bipolar":
-        CortThick_case_controls_adult = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_case-controls_CortThick_adult.csv'), error_bad_lines=False)
-        CortSurf_case_controls_adult = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_case-controls_CortSurf_adult.csv'), error_bad_lines=False)
-        CortThick_typeI_typeII_adult = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_typeI-typeII_CortThick_adult.csv'), error_bad_lines=False)
-        CortSurf_typeI_typeII_adult = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_typeI-typeII_CortSurf_adult.csv'), error_bad_lines=False)
-        CortThick_case_controls_adolescent = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_case-controls_CortThick_adolescent.csv'), error_bad_lines=False)
-        CortSurf_case_controls_adolescent = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_case-controls_CortSurf_adolescent.csv'), error_bad_lines=False)
-        CortThick_typeI_typeII_adolescent = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_typeI-typeII_CortThick_adolescent.csv'), error_bad_lines=False)
-        CortSurf_typeI_typeII_adolescent = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_typeI-typeII_CortSurf_adolescent.csv'), error_bad_lines=False)
-        SubVol_case_controls_typeI = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_case-controls_SubVol_typeI.csv'), error_bad_lines=False)
-        SubVol_case_controls_typeII = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_case-controls_SubVol_typeII.csv'), error_bad_lines=False)
-        SubVol_typeII_typeI = pd.read_csv(
-            os.path.join(root_pth, 'summary_statistics', 'bd_typeII-typeI_SubVol.csv'), error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls_adult': CortThick_case_controls_adult,
-                'CortSurf_case_vs_controls_adult': CortSurf_case_controls_adult,
-                'CortThick_typeI_vs_typeII_adult': CortThick_typeI_typeII_adult,
-                'CortSurf_typeI_vs_typeII_adult': CortSurf_typeI_typeII_adult,
-                'CortThick_case_vs_controls_adolescent': CortThick_case_controls_adolescent,
-                'CortSurf_case_vs_controls_adolescent': CortSurf_case_controls_adolescent,
-                'CortThick_typeI_vs_typeII_adolescent': CortThick_typeI_typeII_adolescent,
-                'CortSurf_typeI_vs_typeII_adolescent': CortSurf_typeI_typeII_adolescent,
-                'SubVol_case_vs_controls_typeI': SubVol_case_controls_typeI,
-                'SubVol_case_vs_controls_typeII': SubVol_case_controls_typeII,
-                'SubVol_typeII_vs_typeI': SubVol_typeII_typeI}
+# Version of the consolidated summary statistics store, bump when its layout changes
+_SUMMARY_STATS_STORE_VERSION = 1
 
-    elif disorder == "depression":
-        CortThick_case_vs_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                 'mddadult_case-controls_CortThick.csv'),
-                                                    error_bad_lines=False)
-        CortSurf_case_vs_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                'mddadult_case-controls_CortSurf.csv'),
-                                                   error_bad_lines=False)
-        CortThick_case_vs_controls_adult_firstepisode = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                 'mddadult_case-controls_CortThick_firstepisode.csv'),
-                                                                    error_bad_lines=False)
-        CortSurf_case_vs_controls_adult_firstepisode = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                'mddadult_case-controls_CortSurf_firstepisode.csv'),
-                                                                   error_bad_lines=False)
-        CortThick_case_vs_controls_adult_recurrent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                              'mddadult_case-controls_CortThick_recurrent.csv'),
-                                                                 error_bad_lines=False)
-        CortSurf_case_vs_controls_adult_recurrent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                             'mddadult_case-controls_CortSurf_recurrent.csv'),
-                                                                error_bad_lines=False)
-        CortThick_firstepisode_vs_recurrent_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                             'mddadult_firstepisode-recurrent_CortThick.csv'),
-                                                                error_bad_lines=False)
-        CortSurf_firstepisode_vs_recurrent_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                            'mddadult_firstepisode-recurrent_CortSurf.csv'),
-                                                               error_bad_lines=False)
-        CortThick_case_vs_controls_adult_early = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                          'mddadult_case-controls_CortThick_early.csv'),
-                                                             error_bad_lines=False)
-        CortSurf_case_vs_controls_adult_early = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                         'mddadult_case-controls_CortSurf_early.csv'),
-                                                            error_bad_lines=False)
-        CortThick_case_vs_controls_adult_late = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                         'mddadult_case-controls_CortThick_late.csv'),
-                                                            error_bad_lines=False)
-        CortSurf_case_vs_controls_adult_late = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                        'mddadult_case-controls_CortSurf_late.csv'),
-                                                           error_bad_lines=False)
-        CortThick_early_vs_late_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                 'mddadult_early-late_CortThick.csv'),
-                                                    error_bad_lines=False)
-        CortSurf_early_vs_late_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                'mddadult_early-late_CortSurf.csv'),
-                                                   error_bad_lines=False)
-        CortThick_case_vs_controls_adolescent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                      'mddadolescent_case-controls_CortThick.csv'),
-                                                         error_bad_lines=False)
-        CortSurf_case_vs_controls_adolescent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                     'mddadolescent_case-controls_CortSurf.csv'),
-                                                        error_bad_lines=False)
-        CortThick_case_vs_controls_adolescent_firstepisode = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                      'mddadolescent_case-controls_CortThick_firstepisode.csv'),
-                                                                         error_bad_lines=False)
-        CortSurf_case_vs_controls_adolescent_firstepisode = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                     'mddadolescent_case-controls_CortSurf_firstepisode.csv'),
-                                                                        error_bad_lines=False)
-        CortThick_case_vs_controls_adolescent_recurrent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                   'mddadolescent_case-controls_CortThick_recurrent.csv'),
-                                                                      error_bad_lines=False)
-        CortSurf_case_vs_controls_adolescent_recurrent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                  'mddadolescent_case-controls_CortSurf_recurrent.csv'),
-                                                                     error_bad_lines=False)
-        CortThick_firstepisode_vs_recurrent_adolescent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                  'mddadolescent_firstepisode-recurrent_CortThick.csv'),
-                                                                     error_bad_lines=False)
-        CortSurf_firstepisode_vs_recurrent_adolescent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                                 'mddadolescent_firstepisode-recurrent_CortSurf.csv'),
-                                                                    error_bad_lines=False)
-        SubVol_case_vs_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                           'mdd_case-controls_SubVol.csv'), error_bad_lines=False)
-        SubVol_case_vs_controls_late = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                'mddlate_case-controls_SubVol.csv'),
-                                                   error_bad_lines=False)
-        SubVol_case_vs_controls_early = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                 'mddearly_case-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_late_vs_early = pd.read_csv(os.path.join(root_pth, 'summary_statistics', 'mdd_late-early_SubVol.csv'),
-                                           error_bad_lines=False)
-        SubVol_case_vs_controls_firstepisode = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                        'mddfirstepisode_case-controls_SubVol.csv'),
-                                                           error_bad_lines=False)
-        SubVol_case_vs_controls_recurrent = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                     'mddrecurrent_case-controls_SubVol.csv'),
-                                                        error_bad_lines=False)
-        SubVol_recurrrent_vs_firstepisode = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                     'mdd_recurrent-firstepisode_SubVol.csv'),
-                                                        error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls_adult': CortThick_case_vs_controls_adult,
-                'CortSurf_case_vs_controls_adult': CortSurf_case_vs_controls_adult,
-                'CortThick_case_vs_controls_adult_firstepisode': CortThick_case_vs_controls_adult_firstepisode,
-                'CortSurf_case_vs_controls_adult_firstepisode': CortSurf_case_vs_controls_adult_firstepisode,
-                'CortThick_case_vs_controls_adult_recurrent': CortThick_case_vs_controls_adult_recurrent,
-                'CortSurf_case_vs_controls_adult_recurrent': CortSurf_case_vs_controls_adult_recurrent,
-                'CortThick_firstepisode_vs_recurrent_adult': CortThick_firstepisode_vs_recurrent_adult,
-                'CortSurf_firstepisode_vs_recurrent_adult': CortSurf_firstepisode_vs_recurrent_adult,
-                'CortThick_case_vs_controls_adult_early': CortThick_case_vs_controls_adult_early,
-                'CortSurf_case_vs_controls_adult_early': CortSurf_case_vs_controls_adult_early,
-                'CortThick_case_vs_controls_adult_late': CortThick_case_vs_controls_adult_late,
-                'CortSurf_case_vs_controls_adult_late': CortSurf_case_vs_controls_adult_late,
-                'CortThick_early_vs_late_adult': CortThick_early_vs_late_adult,
-                'CortSurf_early_vs_late_adult': CortSurf_early_vs_late_adult,
-                'CortThick_case_vs_controls_adolescent': CortThick_case_vs_controls_adolescent,
-                'CortSurf_case_vs_controls_adolescent': CortSurf_case_vs_controls_adolescent,
-                'CortThick_case_vs_controls_adolescent_firstepisode': CortThick_case_vs_controls_adolescent_firstepisode,
-                'CortSurf_case_vs_controls_adolescent_firstepisode': CortSurf_case_vs_controls_adolescent_firstepisode,
-                'CortThick_case_vs_controls_adolescent_recurrent': CortThick_case_vs_controls_adolescent_recurrent,
-                'CortSurf_case_vs_controls_adolescent_recurrent': CortSurf_case_vs_controls_adolescent_recurrent,
-                'CortThick_firstepisode_vs_recurrent_adolescent': CortThick_firstepisode_vs_recurrent_adolescent,
-                'CortSurf_firstepisode_vs_recurrent_adolescent': CortSurf_firstepisode_vs_recurrent_adolescent,
-                'SubVol_case_vs_controls': SubVol_case_vs_controls,
-                'SubVol_case_vs_controls_late': SubVol_case_vs_controls_late,
-                'SubVol_case_vs_controls_early': SubVol_case_vs_controls_early,
-                'SubVol_late_vs_early': SubVol_late_vs_early,
-                'SubVol_case_vs_controls_firstepisode': SubVol_case_vs_controls_firstepisode,
-                'SubVol_case_vs_controls_recurrent': SubVol_case_vs_controls_recurrent,
-                'SubVol_recurrrent_vs_firstepisode': SubVol_recurrrent_vs_firstepisode}
+# Statistics of the consolidated store, as in the columns of the tables. Group sizes
+# are 'n_1' and 'n_2', as group names differ between tables (e.g., n_controls, n_patients)
+_SUMMARY_STATS_COLUMNS = ['d_icv', 'se_icv', 'low_ci_icv', 'up_ci_icv', 'n_1', 'n_2', 'pobs', 'fdr_p']
 
-    elif disorder == "epilepsy":
-        CortThick_case_controls_allepilepsy = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                       'allepi_case-controls_CortThick.csv'),
-                                                          error_bad_lines=False)
-        SubVol_case_controls_allepilepsy = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                    'allepi_case-controls_SubVol.csv'),
-                                                       error_bad_lines=False)
-        CortThick_case_controls_gge = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                               'gge_case-controls_CortThick.csv'),
-                                                  error_bad_lines=False)
-        SubVol_case_controls_gge = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                            'gge_case-controls_SubVol.csv'),
-                                               error_bad_lines=False)
-        CortThick_case_controls_ltle = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                'tlemtsl_case-controls_CortThick.csv'),
-                                                   error_bad_lines=False)
-        SubVol_case_controls_ltle = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                             'tlemtsl_case-controls_SubVol.csv'),
-                                                error_bad_lines=False)
-        CortThick_case_controls_rtle = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                'tlemtsr_case-controls_CortThick.csv'),
-                                                   error_bad_lines=False)
-        SubVol_case_controls_rtle = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                             'tlemtsr_case-controls_SubVol.csv'),
-                                                error_bad_lines=False)
-        CortThick_case_controls_allotherepilepsy = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                       'allotherepi_case-controls_CortThick.csv'),
-                                                          error_bad_lines=False)
-        SubVol_case_controls_allotherepilepsy = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                    'allotherepi_case-controls_SubVol.csv'),
-                                                       error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls_allepilepsy': CortThick_case_controls_allepilepsy,
-                'SubVol_case_vs_controls_allepilepsy': SubVol_case_controls_allepilepsy,
-                'CortThick_case_vs_controls_gge': CortThick_case_controls_gge,
-                'SubVol_case_vs_controls_gge': SubVol_case_controls_gge,
-                'CortThick_case_vs_controls_ltle': CortThick_case_controls_ltle,
-                'SubVol_case_vs_controls_ltle': SubVol_case_controls_ltle,
-                'CortThick_case_vs_controls_rtle': CortThick_case_controls_rtle,
-                'SubVol_case_vs_controls_rtle': SubVol_case_controls_rtle,
-                'CortThick_case_vs_controls_allotherepilepsy': CortThick_case_controls_allotherepilepsy,
-                'SubVol_case_vs_controls_allotherepilepsy': SubVol_case_controls_allotherepilepsy}
+_summary_stats_store = {}
 
-    elif disorder == "ocd":
-        CortThick_case_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                 'ocdadults_case-controls_CortThick.csv'),
-                                                    error_bad_lines=False)
-        CortSurf_case_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                 'ocdadults_case-controls_CortSurf.csv'),
-                                                    error_bad_lines=False)
-        CortThick_medicatedcase_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                          'ocdadults_medicatedcase-controls_CortThick.csv'),
-                                                             error_bad_lines=False)
-        CortSurf_medicatedcase_controls_adult = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                         'ocdadults_medicatedcase-controls_CortSurf.csv'),
-                                                            error_bad_lines=False)
-        CortThick_case_controls_pediatric = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                     'ocdpediatric_case-controls_CortThick.csv'),
-                                                        error_bad_lines=False)
-        CortSurf_case_controls_pediatric = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                    'ocdpediatric_case-controls_CortSurf.csv'),
-                                                       error_bad_lines=False)
-        CortThick_medicatedcase_controls_pediatric = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                              'ocdpediatric_medicatedcase-controls_CortThick.csv'),
-                                                                 error_bad_lines=False)
-        CortSurf_medicatedcase_controls_pediatric = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                                             'ocdpediatric_medicatedcase-controls_CortSurf.csv'),
-                                                                error_bad_lines=False)
-        SubVol_case_vs_controls_adult = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_medicatedcase_vs_controls_adult = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_medicatedcase-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_unmedicatedcase_vs_controls_adult = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_unmedicatedcase-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_medicatedcase_vs_unmedicated_adult = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_medicatedcase-unmedicatedcase_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_case_vs_controls_adult_late = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol_late.csv'),
-                                                    error_bad_lines=False)
-        SubVol_case_vs_controls_adult_early = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol_early.csv'),
-                                                    error_bad_lines=False)
-        SubVol_late_vs_early_adult = pd.read_csv(os.path.join(root_pth,
-                                                                       'summary_statistics',
-                                                                       'ocdadult_late-early_SubVol.csv'),
-                                                          error_bad_lines=False)
-        SubVol_case_vs_controls_adult_depression = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol_depression.csv'),
-                                                    error_bad_lines=False)
-        SubVol_case_vs_controls_adult_nodepression = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol_nodepression.csv'),
-                                                    error_bad_lines=False)
-        SubVol_depression_vs_nodepression_adult = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_depression-nodepression_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_case_vs_controls_adult_anxiety = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol_anxiety.csv'),
-                                                    error_bad_lines=False)
-        SubVol_case_vs_controls_adult_noanxiety = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_case-controls_SubVol_noanxiety.csv'),
-                                                    error_bad_lines=False)
-        SubVol_anxiety_vs_noanxiety_adult = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdadult_anxiety-noanxiety_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_case_vs_controls_pediatric = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdpediatric_case-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_medicatedcase_vs_controls_pediatric = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdpediatric_medicatedcase-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_unmedicatedcase_vs_controls_pediatric = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdpediatric_unmedicatedcase-controls_SubVol.csv'),
-                                                    error_bad_lines=False)
-        SubVol_medicatedcase_vs_unmedicated_pediatric = pd.read_csv(os.path.join(root_pth,
-                                                                 'summary_statistics',
-                                                                 'ocdpediatric_medicatedcase-unmedicatedcase_SubVol.csv'),
-                                                    error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls_adult': CortThick_case_controls_adult,
-                'CortSurf_case_vs_controls_adult': CortSurf_case_controls_adult,
-                'CortThick_medicatedcase_vs_controls_adult': CortThick_medicatedcase_controls_adult,
-                'CortSurf_medicatedcase_vs_controls_adult': CortSurf_medicatedcase_controls_adult,
-                'CortThick_case_vs_controls_pediatric': CortThick_case_controls_pediatric,
-                'CortSurf_case_vs_controls_pediatric': CortSurf_case_controls_pediatric,
-                'CortThick_medicatedcase_vs_controls_pediatric': CortThick_medicatedcase_controls_pediatric,
-                'CortSurf_medicatedcase_vs_controls_pediatric': CortSurf_medicatedcase_controls_pediatric,
-                'SubVol_case_vs_controls_adult': SubVol_case_vs_controls_adult,
-                'SubVol_medicatedcase_vs_controls_adult': SubVol_medicatedcase_vs_controls_adult,
-                'SubVol_unmedicatedcase_vs_controls_adult': SubVol_unmedicatedcase_vs_controls_adult,
-                'SubVol_medicatedcase_vs_unmedicated_adult': SubVol_medicatedcase_vs_unmedicated_adult,
-                'SubVol_case_vs_controls_adult_late': SubVol_case_vs_controls_adult_late,
-                'SubVol_case_vs_controls_adult_early': SubVol_case_vs_controls_adult_early,
-                'SubVol_late_vs_early_adult': SubVol_late_vs_early_adult,
-                'SubVol_case_vs_controls_adult_depression': SubVol_case_vs_controls_adult_depression,
-                'SubVol_case_vs_controls_adult_nodepression': SubVol_case_vs_controls_adult_nodepression,
-                'SubVol_depression_vs_nodepression_adult': SubVol_depression_vs_nodepression_adult,
-                'SubVol_case_vs_controls_adult_anxiety': SubVol_case_vs_controls_adult_anxiety,
-                'SubVol_case_vs_controls_adult_noanxiety': SubVol_case_vs_controls_adult_noanxiety,
-                'SubVol_anxiety_vs_noanxiety_adult': SubVol_anxiety_vs_noanxiety_adult,
-                'SubVol_case_vs_controls_pediatric': SubVol_case_vs_controls_pediatric,
-                'SubVol_medicatedcase_vs_controls_pediatric': SubVol_medicatedcase_vs_controls_pediatric,
-                'SubVol_unmedicatedcase_vs_controls_pediatric': SubVol_unmedicatedcase_vs_controls_pediatric,
-                'SubVol_medicatedcase_vs_unmedicated_pediatric': SubVol_medicatedcase_vs_unmedicated_pediatric}
 
-    elif disorder == "schizophrenia":
-        CortThick_case_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                          'scz_case-controls_CortThick.csv'), error_bad_lines=False)
-        CortSurf_case_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                          'scz_case-controls_CortSurf.csv'), error_bad_lines=False)
-        SubVol_case_controls = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                           'scz_case-controls_SubVol.csv'), error_bad_lines=False)
-        SubVol_case_controls_mean = pd.read_csv(os.path.join(root_pth, 'summary_statistics',
-                                                          'scz_case-controls_SubVol_mean.csv'), error_bad_lines=False)
-
-        return {'CortThick_case_vs_controls': CortThick_case_controls,
-                'CortSurf_case_vs_controls': CortSurf_case_controls,
-                'SubVol_case_vs_controls': SubVol_case_controls,
-                'SubVol_case_vs_controls_mean': SubVol_case_controls_mean}
+def _as_float(col, thousands=False):
+    """Column of a summary statistics table as float.
+
+    A few tables have values with thousands separators (group sizes, e.g., '1,446'),
+    decimal commas (e.g., '0,21') or upper bounds (e.g., '<0.001', stored as 0.001).
+    """
+    if col.dtype != object:
+        return col.to_numpy(dtype=float)
+    col = col.str.replace('<', '', regex=False).str.replace(',', '' if thousands else '.', regex=False)
+    return pd.to_numeric(col).to_numpy(dtype=float)
 
+
+def _build_summary_stats_store(fnames):
+    """Summary statistics tables in tidy form, i.e., one row per table and structure."""
+    values, table_id, structure, groups = [], [], [], []
+    for i, fn in enumerate(fnames):
+        t = pd.read_csv(fn, error_bad_lines=False)
+        values.append(np.column_stack([_as_float(t[c], thousands=c.startswith('n_')) for c in t.columns[2:10]]))
+        table_id.append(np.full(t.shape[0], i, dtype=np.int16))
+        structure.append(t['Structure'].to_numpy(dtype=str))
+        groups.append([c[len('n_'):] for c in t.columns[6:8]])
+
+    return {'values': np.vstack(values), 'table_id': np.concatenate(table_id),
+            'structure': np.concatenate(structure), 'groups': np.array(groups)}
+
+
+def _load_summary_stats_store():
+    """Consolidated store of the summary statistics of all disorders.
+
+    The store is built once from the tables in ``summary_statistics`` and saved
+    to the cache directory (see :func:`enigmatoolbox._cache.get_cache_dir`),
+    identified by a checksum of the tables. Arrays are memory-mapped when read
+    from the store.
+    """
+    index = _get_summary_stats_index()
+    root_pth = os.path.join(os.path.dirname(__file__), 'summary_statistics')
+    fnames = [os.path.join(root_pth, fn) for fn in index['file']]
+
+    checksum = file_checksum(*fnames)
+    if checksum in _summary_stats_store:
+        return _summary_stats_store[checksum]
+
+    fname = os.path.join(get_cache_dir('summary_stats'), 'summary_stats_v{0}_{1}_{{0}}.npy'.format(
+        _SUMMARY_STATS_STORE_VERSION, checksum[:16]))
+    names = ['table_id', 'structure', 'groups', 'values']  # values last, written once the others exist
+
+    if os.path.isfile(fname.format('values')):
+        store = {k: np.load(fname.format(k), mmap_mode='r') for k in names}
     else:
-        raise ValueError("must specify a valid disorder...!")
+        store = _build_summary_stats_store(fnames)
+        try:
+            for k in names:
+                save_array(fname.format(k), store[k])
+        except OSError as e:
+            warnings.warn('Could not store summary statistics: {0}'.format(e))
+
+    index['group_1'], index['group_2'] = store['groups'][:, 0], store['groups'][:, 1]
+    store['index'] = index
+    _summary_stats_store[checksum] = store
+    return store
+
+
+def query_summary_stats(disorder=None, measure=None, contrast=None, cohort=None, subgroup=None, key=None,
+                        stat='d_icv'):
+    """Query summary statistics of all disorders as one array
+
+    Summary statistics are read from a consolidated store, built once from all
+    tables (see :func:`load_summary_stats`). Each criterion can be a string or a
+    list of strings, and is ignored if None.
+
+    Parameters
+    ----------
+    disorder : str or list, optional
+        Disorder names, as in :func:`load_summary_stats` (e.g., 'depression').
+    measure : str or list, optional
+        Measures {'CortThick', 'CortSurf', 'SubVol'}.
+    contrast : str or list, optional
+        Contrasts, as in table file names (e.g., 'case-controls', 'typeI-typeII').
+    cohort : str or list, optional
+        Cohorts, as in table file names (e.g., 'mddadult', 'ocdpediatric').
+    subgroup : str or list, optional
+        Subgroups, as in table file names (e.g., 'adult', 'firstepisode', 'meta-analysis').
+    key : str or list, optional
+        Keys of the tables, as returned by :func:`load_summary_stats`.
+    stat : str, optional
+        Statistic {'d_icv', 'se_icv', 'low_ci_icv', 'up_ci_icv', 'n_1', 'n_2', 'pobs', 'fdr_p'},
+        where 'n_1' and 'n_2' are the sizes of the groups (see `group_1` and `group_2`
+        of `tables`). Default is 'd_icv'.
+
+    Returns
+    -------
+    values : 2D ndarray
+        Statistic of every selected table (maps) and structure (regions), shape = (n_maps, n_regions).
+        Structures missing from a table are NaN.
+    tables : pandas.DataFrame
+        Metadata of maps, with columns 'disorder', 'key', 'file', 'cohort', 'contrast',
+        'measure', 'subgroup', 'group_1' and 'group_2'.
+    regions : 1D ndarray
+        Names of structures.
+    """
+    if stat not in _SUMMARY_STATS_COLUMNS:
+        raise ValueError("Unknown stat '{0}'.".format(stat))
+
+    store = _load_summary_stats_store()
+    index = store['index']
+
+    mask = np.ones(index.shape[0], dtype=bool)
+    for col, val in [('disorder', disorder), ('measure', measure), ('contrast', contrast), ('cohort', cohort),
+                     ('subgroup', subgroup), ('key', key)]:
+        if val is not None:
+            mask &= index[col].isin([val] if isinstance(val, str) else val).to_numpy()
+    selected = np.flatnonzero(mask)
+
+    # one row per map, one column per structure in order of appearance
+    table_id = np.asarray(store['table_id'])
+    rows = np.flatnonzero(np.isin(table_id, selected))
+    structure = np.asarray(store['structure'][rows])
+    regions = pd.unique(structure)
+
+    pos = np.full(index.shape[0], -1)
+    pos[selected] = np.arange(selected.size)
+    values = np.full((selected.size, regions.size), np.nan)
+    values[pos[table_id[rows]], pd.Index(regions).get_indexer(structure)] = \
+        store['values'][rows, _SUMMARY_STATS_COLUMNS.index(stat)]
+
+    return values, index.iloc[selected].reset_index(drop=True), regions
 
 
 def reorder_sum_stats(in_file, out_file):
@@ -1056,19 +1066,18 @@ def nfaces(surface_name, hemisphere):
             number of faces/triangles
      """
     if surface_name == 'fsa5':
-        if hemisphere == 'lh':
-            return load_fsa5()[0].GetPolys2D().shape[0]
-        elif hemisphere == 'rh':
-            return load_fsa5()[1].GetPolys2D().shape[0]
-        elif hemisphere == 'both':
-            return load_fsa5()[0].GetPolys2D().shape[0] + load_fsa5()[1].GetPolys2D().shape[0]
+        surf_lh, surf_rh = load_fsa5()
     elif surface_name == 'conte69':
-        if hemisphere == 'lh':
-            return load_conte69()[0].GetPolys2D().shape[0]
-        elif hemisphere == 'rh':
-            return load_conte69()[1].GetPolys2D().shape[0]
-        elif hemisphere == 'both':
-            return load_conte69()[0].GetPolys2D().shape[0] + load_conte69()[1].GetPolys2D().shape[0]
+        surf_lh, surf_rh = load_conte69()
+    else:
+        return None
+
+    if hemisphere == 'lh':
+        return surf_lh.GetPolys2D().shape[0]
+    elif hemisphere == 'rh':
+        return surf_rh.GetPolys2D().shape[0]
+    elif hemisphere == 'both':
+        return surf_lh.GetPolys2D().shape[0] + surf_rh.GetPolys2D().shape[0]
 
 
 def getaffine(surface_name, hemisphere):
@@ -1110,6 +1119,56 @@ def getaffine(surface_name, hemisphere):
                                [0.0000e+00,  0.0000e+00,  0.0000e+00,  1.0000e+00]])
 
 
+_brain_models = {}
+
+
+def _brain_model_mapping(surface_name='conte69', hemi='lh'):
+    """Brain model axis of a surface as a cifti index mapping, read once per process
+    from the reference files.
+
+    If ``hemi == 'both'``, left and right hemispheres are concatenated (left first).
+    """
+    if hemi not in ['lh', 'rh', 'both']:
+        raise ValueError("Unknown hemisphere '{0}'.".format(hemi))
+
+    key = (surface_name, hemi)
+    if key not in _brain_models:
+        if hemi == 'both':
+            bm = _brain_model_axis(surface_name, 'lh') + _brain_model_axis(surface_name, 'rh')
+        else:
+            root_pth = os.path.dirname(__file__)
+            ref_ds = nib.load(os.path.join(root_pth, 'import_export', hemi + '.' + surface_name + '_ref.dscalar.nii'))
+            bm = ref_ds.header.get_axis(1)
+        # conversion to index mapping is costly for large surfaces, done only once
+        _brain_models[key] = bm, bm.to_mapping(1)
+    return _brain_models[key][1]
+
+
+def _brain_model_axis(surface_name='conte69', hemi='lh'):
+    """Brain model axis of a surface, see :func:`_brain_model_mapping`."""
+    _brain_model_mapping(surface_name, hemi)
+    return _brain_models[(surface_name, hemi)][0]
+
+
+def _save_cifti(data, fname, labels, bm_mapping):
+    """Save maps (rows of data) as a dscalar cifti file."""
+    if data.ndim == 1:
+        data = np.expand_dims(data, axis=0)
+    if labels is None:
+        labels = ['map ' + str(dim) for dim in np.arange(0, data.shape[0])]
+
+    sa = nib.cifti2.cifti2_axes.ScalarAxis(labels)
+    matrix = nib.cifti2.Cifti2Matrix()
+    matrix.append(sa.to_mapping(0))
+    matrix.append(bm_mapping)
+    out_img = nib.cifti2.cifti2.Cifti2Image(dataobj=data, header=nib.cifti2.Cifti2Header(matrix))
+    nib.save(out_img, fname)
+
+
+def _write_cifti(data, fname, labels, surface_name, hemi):
+    _save_cifti(data, fname, labels, _brain_model_mapping(surface_name, hemi))
+
+
 def write_cifti(data, dpath=None, fname=None, labels=None, surface_name='conte69', hemi='lh'):
     """Writes cifti file (authors: @NicoleEic, @saratheriver)
 
@@ -1127,28 +1186,149 @@ def write_cifti(data, dpath=None, fname=None, labels=None, surface_name='conte69
             Name of surface {'fsa5', 'conte69'}
             Default is 'conte69'
         hemi : string
-           Name of hemisphere {'lh', 'rh'}
+           Name of hemisphere {'lh', 'rh', 'both'}. If 'both', data of left and right
+           hemispheres are concatenated (left first).
            Default is 'lh'
     """
     if dpath is None or fname is None:
         print("ey ey ya gotta specify the path and the filename :)")
-    if data.ndim == 1:
-        data = np.expand_dims(data, axis=0)
+
+    # Save cifti, woohoo!
+    _write_cifti(np.asarray(data), os.path.join(dpath, fname), labels, surface_name, hemi)
+    print(f'file saved as: {os.path.join(dpath, fname)} .... #yolo')
+
+
+def write_ciftis(data, fnames, dpath='', labels=None, surface_name='conte69', hemi='lh', n_jobs=1):
+    """Writes many cifti files in parallel
+
+        Parameters
+        ----------
+        data : list of ndarray
+            Maps of each file, each of shape = (n_vertices,) or (n_maps, n_vertices)
+        fnames : list of string
+            Name of each file (e.g., 'ello.dscalar.nii')
+        dpath : string, optional
+            Path to location for saving files (e.g., '/Users/bonjour/')
+            Default is current directory
+        labels : list of list, optional
+            List of map labels of each file
+            Default is None
+        surface_name : string, optional
+            Name of surface {'fsa5', 'conte69'}
+            Default is 'conte69'
+        hemi : string, optional
+           Name of hemisphere {'lh', 'rh', 'both'}
+           Default is 'lh'
+        n_jobs : int, optional
+            Number of parallel jobs used to write files. If -1, all CPUs are used.
+            Default is 1
+    """
+    if len(data) != len(fnames):
+        raise ValueError("Number of files and data must be the same.")
     if labels is None:
-        labels = ['map ' + str(dim) for dim in np.arange(0, data.shape[0])]
+        labels = [None] * len(fnames)
 
-    # Load reference file
-    root_pth = os.path.dirname(__file__)
-    ref_ds = nib.load(os.path.join(root_pth, 'import_export', hemi + '.' + surface_name + '_ref.dscalar.nii'))
+    # brain models are passed by name, each worker reads them once
+    Parallel(n_jobs=n_jobs)(delayed(_write_cifti)(np.asarray(x), os.path.join(dpath, fn), lab, surface_name, hemi)
+                            for x, fn, lab in zip(data, fnames, labels))
 
-    # Get axis
-    sa = nib.cifti2.cifti2_axes.ScalarAxis(labels)
-    bm = ref_ds.header.get_axis(1)
-    out_img = nib.cifti2.cifti2.Cifti2Image(dataobj=data, header=(sa, bm))
 
-    # Save cifti, woohoo!
-    nib.save(out_img, dpath + fname)
-    print(f'file saved as: {dpath + fname} .... #yolo')
+def _discard_buffer(buffer, fname):
+    """Close and remove the temporary buffer of a :class:`CiftiWriter`."""
+    buffer.close()
+    if os.path.exists(fname):
+        os.remove(fname)
+
+
+class CiftiWriter:
+    """Writes maps appended incrementally to one cifti file
+
+    Maps are buffered in a temporary file next to the output file, so memory
+    usage does not grow with the number of maps, and the cifti file is written
+    on :meth:`close`. Can be used as a context manager. The temporary file is
+    also removed if the writer is garbage collected without being closed, in
+    which case no cifti file is written.
+
+    Parameters
+    ----------
+    fname : string
+        Path to file (e.g., '/Users/bonjour/ello.dscalar.nii')
+    surface_name : string, optional
+        Name of surface {'fsa5', 'conte69'}. Default is 'conte69'.
+    hemi : string, optional
+        Name of hemisphere {'lh', 'rh', 'both'}. If 'both', data of left and right
+        hemispheres are concatenated (left first). Default is 'lh'.
+    dtype : data-type, optional
+        Data type of the maps. Default is np.float32.
+
+    Attributes
+    ----------
+    labels : list
+        Labels of the maps appended so far.
+    """
+
+    def __init__(self, fname, surface_name='conte69', hemi='lh', dtype=np.float32):
+        self.fname = fname
+        self.surface_name = surface_name
+        self.hemi = hemi
+        self.dtype = dtype
+
+        self._bm = _brain_model_axis(surface_name, hemi)
+        self._bm_mapping = _brain_model_mapping(surface_name, hemi)
+        self.labels = []
+        fd, self._buffer_name = tempfile.mkstemp(suffix='.raw', dir=os.path.dirname(os.path.abspath(fname)))
+        self._buffer = os.fdopen(fd, 'wb')
+        self._finalizer = weakref.finalize(self, _discard_buffer, self._buffer, self._buffer_name)
+
+    def append(self, data, labels=None):
+        """Append maps.
+
+        Parameters
+        ----------
+        data : ndarray
+            Maps, shape = (n_vertices,) or (n_maps, n_vertices)
+        labels : string or list, optional
+            Labels of the maps, one per map. Default is None, i.e., 'map i' with
+            i the index of the map in the file.
+        """
+        data = np.asarray(data, dtype=self.dtype)
+        if data.ndim == 1:
+            data = np.expand_dims(data, axis=0)
+        if data.shape[1] != self._bm.size:
+            raise ValueError("Data must have {0} vertices.".format(self._bm.size))
+        if labels is None:
+            labels = ['map ' + str(dim) for dim in np.arange(len(self.labels), len(self.labels) + data.shape[0])]
+        elif isinstance(labels, str):
+            labels = [labels]
+        if len(labels) != data.shape[0]:
+            raise ValueError("Number of labels ({0}) does not match number of maps ({1})."
+                             .format(len(labels), data.shape[0]))
+
+        self._buffer.write(data.tobytes())
+        self.labels.extend(labels)
+
+    def close(self):
+        """Write cifti file with all appended maps."""
+        if not self._finalizer.alive:
+            return
+        self._buffer.close()
+        try:
+            if len(self.labels) > 0:
+                data = np.memmap(self._buffer_name, dtype=self.dtype, mode='r',
+                                 shape=(len(self.labels), self._bm.size))
+                _save_cifti(data, self.fname, self.labels, self._bm_mapping)
+                del data
+        finally:
+            self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # discard maps, do not write partial files
+            self.labels = []
+        self.close()
 
 
 # For every new summary statistic file, run the following command to reorder
@@ -1,8 +1,13 @@
 from .permutation_testing import (spin_test, shuf_test, centroid_extraction_sphere,
-                                  rotate_parcellation, perm_sphere_p, get_subcortical_distance,
-                                  MoranRandomization)
+                                  rotate_parcellation, rotate_vertices, perm_sphere_p,
+                                  get_subcortical_distance, get_cortical_distance,
+                                  MoranRandomization, VariogramRandomization,
+                                  precompute_spins, spin_test_many, shuf_test_many,
+                                  spin_test_genes, gene_set_test, set_backend)
 
 __all__ = ['spin_test', 'shuf_test',
            'centroid_extraction_sphere',
-           'rotate_parcellation', 'perm_sphere_p',
-           'get_subcortical_distance', 'MoranRandomization']
+           'rotate_parcellation', 'rotate_vertices', 'perm_sphere_p',
+           'get_subcortical_distance', 'get_cortical_distance', 'MoranRandomization', 'VariogramRandomization',
+           'precompute_spins', 'spin_test_many', 'shuf_test_many',
+           'spin_test_genes', 'gene_set_test', 'set_backend']
@@ -0,0 +1,78 @@
+"""
+Compiled kernels for permutation hot loops, only available if Numba is installed.
+
+Only greedy matching of rotated regions is compiled. Other loops are either
+vectorized with NumPy (e.g., gathering permuted maps, null correlations) or only
+draw random numbers from NumPy generators (e.g., pair Moran randomization), whose
+streams compiled code cannot reproduce.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    has_numba = True
+except ImportError:
+    has_numba = False
+
+
+def _rotate_greedy(coord, coord_rot):
+    """Greedy matching of rotated to unrotated regions for a batch of rotations.
+
+    Same algorithm as the NumPy implementation, one rotation at a time, with
+    distances computed in the same order of operations.
+
+    Parameters
+    ----------
+    coord : ndarray
+        Coordinates on the sphere, shape = (m, 3)
+    coord_rot : ndarray
+        Rotated coordinates, shape = (n, m, 3)
+
+    Returns
+    -------
+    rot_ix : ndarray
+        Rotated region assigned to each unrotated region, shape = (n, m)
+    """
+    n, m, _ = coord_rot.shape
+    rot_ix = np.empty((n, m), dtype=np.int64)
+    dist = np.empty((m, m))
+    assigned = np.empty(m, dtype=np.bool_)
+    row_argmin = np.empty(m, dtype=np.int64)
+    row_min = np.empty(m)
+
+    for b in range(n):
+        for i in range(m):
+            for j in range(m):
+                d0 = coord[i, 0] - coord_rot[b, j, 0]
+                d1 = coord[i, 1] - coord_rot[b, j, 1]
+                d2 = coord[i, 2] - coord_rot[b, j, 2]
+                dist[i, j] = np.sqrt(d0 * d0 + d1 * d1 + d2 * d2)
+            row_argmin[i] = np.argmin(dist[i])
+            row_min[i] = dist[i, row_argmin[i]]
+        assigned[:] = False
+
+        for _ in range(m):
+            # max(min), ties go to the first region
+            ref = np.argmax(row_min)
+            rot = row_argmin[ref]
+            rot_ix[b, ref] = rot
+
+            # disregard assigned regions in next iterations
+            row_min[ref] = -np.inf
+            assigned[rot] = True
+
+            # update minima of the rows that were closest to the assigned column
+            for i in range(m):
+                if row_argmin[i] == rot and row_min[i] > -np.inf:
+                    row_min[i] = np.inf
+                    for j in range(m):
+                        if not assigned[j] and dist[i, j] < row_min[i]:
+                            row_argmin[i] = j
+                            row_min[i] = dist[i, j]
+
+    return rot_ix
+
+
+if has_numba:
+    rotate_greedy = njit(cache=True)(_rotate_greedy)
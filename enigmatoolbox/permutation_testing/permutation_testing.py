@@ -1,19 +1,124 @@
 """
 Permutation functions
+
+Progress and timings are reported through the ``enigmatoolbox.permutation_testing``
+logger: permutation counts at DEBUG level, and wall time of each phase at INFO
+level. Records carry their counters as attributes (e.g., ``n_done``, ``n_self``,
+``rate``, ``elapsed``), so they can be consumed by a custom handler.
 """
 
 import os
+import time
+import logging
+import numbers
+import contextlib
 import nibabel as nb
 import numpy as np
 import pandas as pd
 import warnings
-from ..datasets import load_fsa5
+from ..datasets import load_fsa5, load_conte69, load_mask
+from .._cache import get_cache_dir, file_checksum, array_checksum, save_array
 from sklearn.utils import check_random_state
+from joblib import Parallel, delayed, effective_n_jobs
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
+from scipy.optimize import linear_sum_assignment
+from scipy.stats import rankdata, beta
 from sklearn.base import BaseEstimator
 from ..mesh import mesh_elements as me
+from . import _kernels
 import scipy.sparse as ssp
+from scipy.sparse.linalg import LinearOperator, eigsh, lobpcg
+
+
+logger = logging.getLogger(__name__)
+
+
+# Tolerance below which null and empirical correlations are considered tied
+_TIE_TOL = 1e-12
+
+# Maximum number of elements of the distance tensors used to match rotated regions
+_MAX_BATCH_ELEMENTS = 2 ** 23
+
+# Version of stored spin permutations, bump when their generation changes
+_SPIN_CACHE_VERSION = 2
+
+# Number of permutations per chunk, each chunk has its own random stream
+_PERM_CHUNK_SIZE = 100
+
+# Confidence level of the p-value interval used to stop adaptive permutation tests
+_ADAPTIVE_CONFIDENCE = 0.99
+
+# Version of stored Moran eigenvectors, bump when their computation changes
+_MEM_CACHE_VERSION = 2
+
+# Maximum number of iterations and tolerance (relative to the largest eigenvalue)
+# of the randomized eigensolver
+_RANDOMIZED_MAX_ITER = 200
+_RANDOMIZED_TOL = 1e-12
+
+# Moran eigenvectors shipped with the toolbox, looked up before the on-disk store
+_PREBUILT_MEM_DIR = os.path.join(os.path.dirname(__file__), 'mem')
+
+# Reflection across the Y-Z plane, applied elementwise to left hemisphere rotations
+_REFLECT_YZ = np.array([[1, -1, -1], [-1, 1, 1], [-1, 1, 1]])
+
+# Regions of cortical annotations without centroids
+_EXCLUDED_REGIONS = ['unknown', 'corpus', 'corpuscallosum', 'medialwall',
+                     'Background+FreeSurfer_Defined_Medial_Wall']
+
+# Memoized centroids, sphere coordinates used by spin permutations and subcortical distances
+_centroids = {}
+_spin_coords = {}
+_subcortical_distances = {}
+_cortical_distances = {}
+
 
+def _label_centroids(coords, labels, label_ids):
+    """Centroids of the vertices of each label, computed for all labels at once.
+
+    Parameters
+    ----------
+    coords : ndarray
+        Vertex coordinates, shape = (n, 3)
+    labels : ndarray
+        Label of each vertex, shape = (n,)
+    label_ids : ndarray
+        Labels whose centroids to compute, shape = (m,)
+
+    Returns
+    -------
+    centroid : ndarray
+        Centroids, shape = (m, 3). NaN for labels without vertices.
+    """
+    label_ids = np.asarray(label_ids)
+    uniq, inv = np.unique(labels, return_inverse=True)
+    count = np.bincount(inv, minlength=uniq.size).astype(coords.dtype)
+
+    # accumulate in vertex order and in the precision of the coordinates, as np.mean
+    total = np.zeros((uniq.size, coords.shape[1]), dtype=coords.dtype)
+    np.add.at(total, inv, coords)
+
+    pos = np.searchsorted(uniq, label_ids).clip(max=uniq.size - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroid = (total[pos] / count[pos, None]).astype(float)
+    centroid[uniq[pos] != label_ids] = np.nan
+    return centroid
+
+
+def _annot_labels(annotfile, ventricles=False):
+    """Vertex labels, and labels of the regions with centroids, of an annotation file."""
+    if "aparc_aseg" not in annotfile:
+        labels, ctab, names = nb.freesurfer.io.read_annot(annotfile, orig_ids=True)
+        keep = [name.decode("utf-8") not in _EXCLUDED_REGIONS for name in names]
+        return labels, ctab[keep, -1]
+
+    annot = pd.read_csv(annotfile)
+    excluded = ["'unknown'", "'corpuscallosum'"]
+    if ventricles is not True:
+        excluded.append("'vent'")
+    keep = ~annot['structure'][:44].isin(excluded)
+    return annot['label_annot'].to_numpy(), annot['label'][:44][keep].to_numpy()
 
 
 def centroid_extraction_sphere(sphere_coords, annotfile, ventricles=False):
@@ -49,42 +154,338 @@ def centroid_extraction_sphere(sphere_coords, annotfile, ventricles=False):
       Sporns O, Bullmore ET (2017). Adolescent tuning of association cortex in human
       structural brain networks. Cerebral Cortex, 28(1):281–294.
     """
-    # for cortical annotation files only
-    if "aparc_aseg" not in annotfile:
-        labels, ctab, names = nb.freesurfer.io.read_annot(annotfile, orig_ids=True)
+    # centroids are memoized per sphere, annotation file and ventricles
+    ventricles = "aparc_aseg" in annotfile and ventricles is True
+    key = (array_checksum(sphere_coords), file_checksum(annotfile), ventricles)
+    if key not in _centroids:
+        labels, label_ids = _annot_labels(annotfile, ventricles=ventricles)
+        _centroids[key] = _label_centroids(sphere_coords, labels, label_ids)
 
-        centroid = np.empty((0, 3))
-        for ic in range(ctab.shape[0]):
-            if not names[ic].decode("utf-8") == 'unknown' and not names[ic].decode("utf-8") == 'corpus'\
-                and not names[ic].decode("utf-8") == 'corpuscallosum' and not names[ic].decode("utf-8") == 'medialwall'\
-                and not names[ic].decode("utf-8") == 'Background+FreeSurfer_Defined_Medial_Wall':
-                label = ctab[ic, -1]
-                centroid = np.vstack((centroid, np.array(np.mean(sphere_coords[labels == label, :], axis=0))))
-
-    elif "aparc_aseg" in annotfile and ventricles is not True:
-        annot = pd.read_csv(annotfile)
-
-        centroid = np.empty((0, 3))
-        for ic in range(annot['structure'][:44].shape[0]):
-            if not annot['structure'][:44][ic] == "'unknown'" and not annot['structure'][:44][ic] == "'corpuscallosum'" and not annot['structure'][:44][ic] == "'vent'":
-                label = annot['label'][ic]
-                centroid = np.vstack((centroid, np.array(np.mean(sphere_coords[annot[annot['label_annot'] ==
-                                                                                     label].index.values, :], axis=0))))
-
-    elif "aparc_aseg" in annotfile and ventricles is True:
-        annot = pd.read_csv(annotfile)
-
-        centroid = np.empty((0, 3))
-        for ic in range(annot['structure'][:44].shape[0]):
-            if not annot['structure'][:44][ic] == "'unknown'" and not annot['structure'][:44][ic] == "'corpuscallosum'":
-                label = annot['label'][ic]
-                centroid = np.vstack((centroid, np.array(np.mean(sphere_coords[annot[annot['label_annot'] ==
-                                                                                     label].index.values, :], axis=0))))
+    return _centroids[key].copy()
 
-    return centroid
 
+def _random_rotations(n, rs):
+    """Draw random rotation matrices uniformly.
+
+    Parameters
+    ----------
+    n : int
+        Number of rotations.
+    rs : RandomState
+        Random number generator.
+
+    Returns
+    -------
+    rot : ndarray
+        Rotation matrices, shape = (n, 3, 3)
+    """
+    A = rs.normal(loc=0, scale=1, size=(n, 3, 3))
+    rot, temp = np.linalg.qr(A)
+    rot = rot * np.sign(np.diagonal(temp, axis1=1, axis2=2))[:, None, :]
+    rot[np.linalg.det(rot) < 0, :, 0] *= -1
+    return rot
+
+
+def _rotated_distances(coord, rot):
+    """Distances between unrotated and rotated coordinates for a batch of rotations.
+
+    Parameters
+    ----------
+    coord : ndarray
+        Coordinates on the sphere, shape = (m, 3)
+    rot : ndarray
+        Rotation matrices, shape = (n, 3, 3)
+
+    Returns
+    -------
+    dist : ndarray
+        Euclidean distances, shape = (n, m, m). Rows correspond to unrotated
+        and columns to rotated coordinates.
+    """
+    coord_rot = np.matmul(coord, rot)
+
+    # accumulate squared differences in the same order as cdist
+    dist = np.square(coord[None, :, None, 0] - coord_rot[:, None, :, 0])
+    for k in range(1, 3):
+        dist += np.square(coord[None, :, None, k] - coord_rot[:, None, :, k])
+    return np.sqrt(dist, out=dist)
+
+
+def _match_greedy(dist):
+    """Greedy matching of rotated to unrotated regions for a batch of rotations.
+
+    For each unrotated region, find the closest rotated region (minimum), then
+    assign the most distant pair (maximum of the minima), as this region is the
+    hardest to match and would only become harder as other regions are assigned.
+
+    Parameters
+    ----------
+    dist : ndarray
+        Distances between unrotated (rows) and rotated (columns) regions,
+        shape = (n, m, m). Modified in place.
+
+    Returns
+    -------
+    rot_ix : ndarray
+        Rotated region assigned to each unrotated region, shape = (n, m)
+    """
+    n, m, _ = dist.shape
+    batch = np.arange(n)
+
+    rot_ix = np.empty((n, m), dtype=int)
+    row_argmin = dist.argmin(axis=2)
+    row_min = np.take_along_axis(dist, row_argmin[..., None], axis=2)[..., 0]
+    for _ in range(m):
+        # max(min) (described above), ties go to the first region as with argwhere
+        ref = row_min.argmax(axis=1)
+        rot = row_argmin[batch, ref]
+        rot_ix[batch, ref] = rot
+
+        # disregard assigned regions in next iterations
+        row_min[batch, ref] = -np.inf
+        dist[batch, :, rot] = np.inf
+
+        # update minima of the rows that were closest to the assigned columns
+        bb, rr = np.nonzero((row_argmin == rot[:, None]) & (row_min > -np.inf))
+        if bb.size > 0:
+            row_argmin[bb, rr] = dist[bb, rr].argmin(axis=1)
+            row_min[bb, rr] = dist[bb, rr, row_argmin[bb, rr]]
+
+    return rot_ix
+
+
+def _match_hungarian(dist):
+    """Optimal (minimum total distance) matching of rotated to unrotated regions.
+
+    Parameters
+    ----------
+    dist : ndarray
+        Distances between unrotated (rows) and rotated (columns) regions,
+        shape = (n, m, m).
+
+    Returns
+    -------
+    rot_ix : ndarray
+        Rotated region assigned to each unrotated region, shape = (n, m)
+    """
+    return np.array([linear_sum_assignment(d)[1] for d in dist], dtype=int).reshape(dist.shape[:2])
+
+
+_MATCH = {'greedy': _match_greedy, 'hungarian': _match_hungarian}
+
+
+# Backend of permutation hot loops {'auto', 'numpy', 'numba'}, see set_backend
+_BACKEND = 'auto'
+
+
+def set_backend(backend='auto'):
+    """Set the backend of permutation hot loops
+
+    The greedy matching of rotated to unrotated regions can run as a compiled
+    Numba kernel, which gives the same permutations as the NumPy implementation.
+
+    Parameters
+    ----------
+    backend : {'auto', 'numpy', 'numba'}, optional
+        Backend. If 'auto', use Numba when it is installed, and NumPy otherwise.
+        Default is 'auto'.
+    """
+    global _BACKEND
+    if backend not in ['auto', 'numpy', 'numba']:
+        raise ValueError("Unknown backend '{0}'.".format(backend))
+    if backend == 'numba' and not _kernels.has_numba:
+        raise ImportError("Backend 'numba' requires numba to be installed.")
+    _BACKEND = backend
+
+
+def _use_numba():
+    """Whether hot loops run as Numba kernels."""
+    return _BACKEND == 'numba' or (_BACKEND == 'auto' and _kernels.has_numba)
+
+
+def _match_rotated(coord, rot, method='greedy', use_numba=False):
+    """Match rotated to unrotated regions for a batch of rotations.
+
+    Parameters
+    ----------
+    coord : ndarray
+        Coordinates on the sphere, shape = (m, 3)
+    rot : ndarray
+        Rotation matrices, shape = (n, 3, 3)
+    method : {'greedy', 'hungarian'}, optional
+        Matching method. Default is 'greedy'.
+    use_numba : bool, optional
+        Whether to use the Numba kernel of greedy matching, which also computes
+        distances. Default is False.
+
+    Returns
+    -------
+    rot_ix : ndarray
+        Rotated region assigned to each unrotated region, shape = (n, m)
+    """
+    if use_numba and method == 'greedy':
+        return _kernels.rotate_greedy(coord, np.matmul(coord, rot))
+    return _MATCH[method](_rotated_distances(coord, rot))
+
+
+def _chunk_sizes(n):
+    """Split `n` permutations into chunks of fixed size, independent of the number of jobs."""
+    return [min(_PERM_CHUNK_SIZE, n - i) for i in range(0, n, _PERM_CHUNK_SIZE)]
+
+
+def _spawn_random_states(random_state, n):
+    """Independent random number generators, one per chunk of permutations.
+
+    Parameters
+    ----------
+    random_state : int, RandomState or None
+        Random state. If None or a RandomState, the root seed is drawn from it, so
+        that results can still be controlled through ``np.random.seed``.
+    n : int
+        Number of generators.
+
+    Returns
+    -------
+    rss : list of Generator
+        Random number generators, spawned from a single SeedSequence.
+    """
+    if isinstance(random_state, numbers.Integral):
+        seed = np.random.SeedSequence(random_state)
+    else:
+        rs = check_random_state(random_state)
+        seed = np.random.SeedSequence(rs.randint(np.iinfo(np.int32).max, size=4))
+    return [np.random.default_rng(s) for s in seed.spawn(n)]
+
+
+def _rotate_chunk(coord_l, coord_r, method, use_numba, nrot, rs):
+    """Generate a chunk of rotation permutations.
+
+    The backend (`use_numba`) is resolved before dispatching jobs, as workers do
+    not share the backend setting.
+
+    Returns
+    -------
+    perm_id : ndarray
+        Array of permutations, shape = (m, nrot)
+    n_self : int
+        Number of discarded rotations that mapped to themselves.
+    """
+    nroi_l = coord_l.shape[0]  # n(regions) in the left hemisphere
+    nroi_r = coord_r.shape[0]  # n(regions) in the right hemisphere
+    nroi = nroi_l + nroi_r     # total n(regions)
+
+    perm_id = np.empty((nroi, nrot), dtype=_index_dtype(nroi))
+    r = 0
+    n_self = 0
+
+    # rotations are processed in batches, bounded by the size of the distance tensors
+    batch_size = max(1, _MAX_BATCH_ELEMENTS // max(nroi_l, nroi_r) ** 2)
+
+    # use of "while" is to ensure any rotation that maps to itself is excluded (this is rare, but can happen)
+    while (r < nrot):
+        TL = _random_rotations(min(batch_size, nrot - r), rs)
+
+        # reflect across the Y-Z plane for right hemisphere
+        TR = TL * _REFLECT_YZ
+
+        # after rotation, find "best" match between rotated and unrotated coordinates
+        rot_l = _match_rotated(coord_l, TL, method, use_numba)
+        rot_r = _match_rotated(coord_r, TR, method, use_numba)
+
+        # mapping is x->y, collate vectors from both hemispheres
+        rot_lr = np.hstack((rot_l, nroi_l + rot_r))
+
+        # verify that permutation does not map to itself
+        is_self = np.all(rot_lr == np.arange(nroi), axis=1)
+        n_self += np.count_nonzero(is_self)
+
+        rot_lr = rot_lr[~is_self]
+        perm_id[:, r:r + rot_lr.shape[0]] = rot_lr.T
+        r = r + rot_lr.shape[0]
+
+    return perm_id, n_self
+
+
+@contextlib.contextmanager
+def _log_phase(phase, **counters):
+    """Log the wall time of a phase, only measured if INFO logging is enabled."""
+    if not logger.isEnabledFor(logging.INFO):
+        yield
+        return
+
+    t0 = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - t0
+    logger.info('%s: %.3fs', phase, elapsed, extra=dict(phase=phase, elapsed=elapsed, **counters))
+
+
+def _iter_permutations(chunk_func, args, n, random_state=None, n_jobs=1, lazy=False):
+    """Generate `n` permutations in chunks, each drawn from an independent random stream.
+
+    Chunks do not depend on `n_jobs`, and are yielded in order, so that the
+    first chunks are the same for any `n`. Progress is logged after each chunk
+    (DEBUG), and throughput once iteration ends (INFO).
+
+    Parameters
+    ----------
+    chunk_func : callable
+        Called as ``chunk_func(*args, size, rs)``. Returns the permutations of one
+        chunk and the number of discarded permutations that mapped to themselves.
+    args : tuple
+        Arguments to `chunk_func`.
+    n : int
+        Number of permutations.
+    random_state : int or None, optional
+        Random state. Default is None.
+    n_jobs : int, optional
+        Number of parallel jobs. Default is 1.
+    lazy : bool, optional
+        If True, only as many chunks as jobs are generated at a time, so that
+        iteration can be stopped early. Default is False.
 
-def rotate_parcellation(coord_l, coord_r, nrot=1000):
+    Yields
+    ------
+    perm_id : ndarray
+        Array of permutations of one chunk, shape = (m, size)
+    """
+    chunks = _chunk_sizes(n)
+    rss = _spawn_random_states(random_state, len(chunks))
+    step = effective_n_jobs(n_jobs) if lazy else max(len(chunks), 1)
+
+    r = 0  # count successful (r) iterations
+    c = 0  # count unsuccessful (c) iterations, i.e., that mapped to themselves
+    t0 = time.perf_counter()
+    try:
+        with Parallel(n_jobs=n_jobs) as parallel:
+            for i in range(0, len(chunks), step):
+                jobs = (delayed(chunk_func)(*args, size, rs)
+                        for size, rs in zip(chunks[i:i + step], rss[i:i + step]))
+                for perm_id, n_self in parallel(jobs):
+                    r = r + perm_id.shape[1]
+                    c = c + n_self
+
+                    # track progress
+                    if logger.isEnabledFor(logging.DEBUG):
+                        elapsed = time.perf_counter() - t0
+                        logger.debug('permutation %d of %d, %d mapped to themselves', r, n, c,
+                                     extra=dict(n_done=r, n_total=n, n_self=c, elapsed=elapsed,
+                                                rate=r / elapsed))
+
+                    yield perm_id
+
+    finally:
+        # also reached when iteration is stopped early
+        if logger.isEnabledFor(logging.INFO):
+            elapsed = time.perf_counter() - t0
+            rate = r / elapsed if elapsed > 0 else float('inf')
+            logger.info('permutations: %d of %d in %.3fs (%.1f/s), %d mapped to themselves',
+                        r, n, elapsed, rate, c,
+                        extra=dict(phase='permutations', n_done=r, n_total=n, n_self=c, elapsed=elapsed,
+                                   rate=rate))
+
+
+def rotate_parcellation(coord_l, coord_r, nrot=1000, method='greedy', random_state=None, n_jobs=1,
+                        compact=False):
     """Rotate parcellation (author: @saratheriver)
 
     Parameters
@@ -95,6 +496,19 @@ def rotate_parcellation(coord_l, coord_r, nrot=1000):
         Coordinates of right hemisphere regions on the sphere, shape = (m, 3)
     nrot : int, optional
         Number of rotations. Default is 1000.
+    method : {'greedy', 'hungarian'}, optional
+        Assignment of rotated to unrotated regions. If 'greedy', regions are
+        matched in order of "most distant minimum", as in Váša et al. (2017).
+        If 'hungarian', the matching with minimum total distance is used.
+        Default is 'greedy'.
+    random_state : int or None, optional
+        Random state. Rotations are generated in chunks with independent
+        random streams, so results do not depend on `n_jobs`. Default is None.
+    n_jobs : int, optional
+        Number of parallel jobs. If -1, all CPUs are used. Default is 1.
+    compact : bool, optional
+        If True, permutations are returned as indices in the smallest sufficient
+        integer type (int16 or int32). Otherwise, as float. Default is False.
 
     Returns
     -------
@@ -111,109 +525,308 @@ def rotate_parcellation(coord_l, coord_r, nrot=1000):
       Shinohara RT, Vandekar SN and Raznahan A (2018). On testing for spatial
       correspondence between maps of human brain structure and function.
       NeuroImage, 178:540-51.
-    * Váša F, Seidlitz J, Romero-Garcia R, Whitaker KJ, Rosenthal G, Vértes PE,
+    * Váša F, Seidlitz J, Romero-Garcia R, Whitaker KJ, Rosenthal G, Vértes PE,
       Shinn M, Alexander-Bloch A, Fonagy P, Dolan RJ, Goodyer IM, the NSPN consortium,
       Sporns O, Bullmore ET (2017). Adolescent tuning of association cortex in human
       structural brain networks. Cerebral Cortex, 28(1):281–294.
     """
-    warnings.filterwarnings('ignore')
+    if method not in _MATCH:
+        raise ValueError("Unknown method '{0}'.".format(method))
 
     # check that coordinate dimensions are correct
     if coord_l.shape[1] != 3 or coord_r.shape[1] != 3:
-        print('transposing coordinates to be of dimensions nROI x 3')
+        logger.info('transposing coordinates to be of dimensions nROI x 3')
         coord_l = np.transpose(coord_l)
         coord_r = np.transpose(coord_r)
 
-    nroi_l = coord_l.shape[0]  # n(regions) in the left hemisphere
-    nroi_r = coord_r.shape[0]  # n(regions) in the right hemisphere
-    nroi = nroi_l + nroi_r     # total n(regions)
+    perm_id = _iter_permutations(_rotate_chunk, (coord_l, coord_r, method, _use_numba()), nrot,
+                                 random_state=random_state, n_jobs=n_jobs)
+    perm_id = np.hstack(list(perm_id))
+    return perm_id if compact else perm_id.astype(float)
 
-    perm_id = np.zeros((nroi, nrot))  # initialise output array
-    r = 0                             # count successful (r) iterations unsuccessful (c) iterations
-    c = 0                             # count unsuccessful (c) iterations
 
-    I1 = np.array([[-1, 0, 0], [0, 1, 0], [0, 0, 1]])
+def _rotate_vertices_chunk(coord_l, coord_r, nrot, rs):
+    """Generate a chunk of vertex rotation permutations.
 
-    # main loop -  use of "while" is to ensure any rotation that maps to itself is excluded (this is rare, but can happen)
-    while (r < nrot):
-        A = np.random.normal(loc=0, scale=1, size=(3, 3))
-        TL, temp = np.linalg.qr(A)
-        TL = np.matmul(TL, np.diag(np.sign(np.diag(temp))))
-        if np.linalg.det(TL) < 0:
-            TL[:, 0] = -TL[:, 0]
+    Returns
+    -------
+    perm_id : ndarray
+        Array of permutations, shape = (n, nrot)
+    n_self : int
+        Number of discarded rotations that mapped to themselves, always 0 as
+        vertices are not required to map one-to-one.
+    """
+    nv_l = coord_l.shape[0]  # n(vertices) in the left hemisphere
+    nv = nv_l + coord_r.shape[0]
+    tree_l = cKDTree(coord_l)
+    tree_r = cKDTree(coord_r)
 
+    perm_id = np.empty((nv, nrot), dtype=_index_dtype(nv, signed=False))
+    for r, TL in enumerate(_random_rotations(nrot, rs)):
         # reflect across the Y-Z plane for right hemisphere
-        TR =  np.matmul(np.matmul(I1, TL), I1)
-        coord_l_rot = np.matmul(coord_l, TL)
-        coord_r_rot = np.matmul(coord_r, TR)
+        TR = TL * _REFLECT_YZ
 
-        # after rotation, find "best" match between rotated and unrotated coordinates
-        # first, calculate distance between initial coordinates and rotated ones
-        # left hemisphere
-        dist_l = cdist(coord_l, coord_l_rot)
-
-        # right hemisphere
-        dist_r = cdist(coord_r, coord_r_rot)
-
-        # LEFT
-        # calculate distances, proceed in order of "most distant minimum"
-        # -> for each unrotated region find closest rotated region (minimum), then assign the most distant pair (maximum of the minima),
-        # as this region is the hardest to match and would only become harder as other regions are assigned
-        temp_dist_l = dist_l
-        rot_l = []
-        ref_l = []
-        for _ in range(nroi_l):
-            # max(min) (described above)
-            ref_ix = np.argwhere(np.nanmin(temp_dist_l, axis=1) == np.nanmax(np.nanmin(temp_dist_l, axis=1)))[0]
-            rot_ix = np.argwhere(temp_dist_l[ref_ix, :][0] == np.nanmin(temp_dist_l[ref_ix, :], axis=1))[0]
-            #ref_ix = [i for i, e in enumerate(np.nanmin(temp_dist_l, axis=1)) if e == np.nanmax(np.nanmin(temp_dist_l, axis=1))]  # "furthest" row
-            #rot_ix = [i for i, e in enumerate(temp_dist_l[ref_ix, :][0]) if e == np.nanmin(temp_dist_l[ref_ix, :], axis=1)]    # closest region
-            ref_l = np.append(ref_l, ref_ix)                                           # store reference and rotated indices
-            rot_l = np.append(rot_l, rot_ix)
-            temp_dist_l[:, rot_ix] = np.nan                                            # set temporary indices to NaN, to be disregarded in next iteration
-            temp_dist_l[ref_ix, :] = np.nan
-
-        # RIGHT
-        # calculate distances, proceed in order of "most distant minimum"
-        # -> for each unrotated region find closest rotated region (minimum), then assign the most distant pair (maximum of the minima),
-        # as this region is the hardest to match and would only become harder as other regions are assigned
-        temp_dist_r = dist_r
-        rot_r = []
-        ref_r = []
-        for _ in range(nroi_r):
-            # max(min) (described above)
-            ref_ix = np.argwhere(np.nanmin(temp_dist_r, axis=1) == np.nanmax(np.nanmin(temp_dist_r, axis=1)))[0]
-            rot_ix = np.argwhere(temp_dist_r[ref_ix, :][0] == np.nanmin(temp_dist_r[ref_ix, :], axis=1))[0]
-            #ref_ix = [i for i, e in enumerate(np.nanmin(temp_dist_r, axis=1)) if e == np.nanmax(np.nanmin(temp_dist_r, axis=1))]  # "furthest" row
-            #rot_ix = [i for i, e in enumerate(temp_dist_r[ref_ix, :][0]) if e == np.nanmin(temp_dist_r[ref_ix, :], axis=1)]    # closest region
-            ref_r = np.append(ref_r, ref_ix)                                           # store reference and rotated indices
-            rot_r = np.append(rot_r, rot_ix)
-            temp_dist_r[:, rot_ix] = np.nan                                            # set temporary indices to NaN, to be disregarded in next iteration
-            temp_dist_r[ref_ix, :] = np.nan
-
-        # mapping is x->y
-        # collate vectors from both hemispheres + sort mapping according to "reference" vector
-        ref_lr = np.append(ref_l, nroi_l + ref_r)
-        rot_lr = np.append(rot_l, nroi_l + rot_r)
-        ix = np.argsort(ref_lr)
-        rot_lr_sort = rot_lr[ix]
+        # each vertex takes the value of the closest rotated vertex, which is the
+        # vertex closest to it after the inverse rotation
+        perm_id[:nv_l, r] = tree_l.query(np.matmul(coord_l, TL.T))[1]
+        perm_id[nv_l:, r] = nv_l + tree_r.query(np.matmul(coord_r, TR.T))[1]
 
-        # verify that permutation does not map to itself
-        if np.all(rot_lr_sort == range(nroi)) is not True:
-            perm_id[:, r] = rot_lr_sort
-            r = r + 1
-        elif np.all(rot_lr_sort == range(nroi)) is True:
-            c = c + 1
-            print('map to itself n.' + str(c))
+    return perm_id, 0
 
-        # track progress
-        if np.mod(r, 100) == 0:
-            print('permutation ' + str(r) + ' of ' + str(nrot))
 
-    return perm_id
+def rotate_vertices(sphere_l, sphere_r, nrot=1000, mask_l=None, mask_r=None, random_state=None, n_jobs=1):
+    """Rotate the vertices of a surface sphere
+
+    Each vertex is matched to its nearest rotated vertex with a KD-tree, so that
+    memory usage is linear in the number of vertices.
+
+    Parameters
+    ----------
+    sphere_l : ndarray
+        Coordinates of left hemisphere vertices on the sphere, shape = (n_l, 3)
+    sphere_r : ndarray
+        Coordinates of right hemisphere vertices on the sphere, shape = (n_r, 3)
+    nrot : int, optional
+        Number of rotations. Default is 1000.
+    mask_l : ndarray, optional
+        Boolean mask of left hemisphere vertices, shape = (n_l,). Vertices out of
+        the mask (e.g., the midline) are excluded. Default is None.
+    mask_r : ndarray, optional
+        Boolean mask of right hemisphere vertices, shape = (n_r,). Default is None.
+    random_state : int or None, optional
+        Random state. Rotations are generated in chunks with independent
+        random streams, so results do not depend on `n_jobs`. Default is None.
+    n_jobs : int, optional
+        Number of parallel jobs. If -1, all CPUs are used. Default is 1.
+
+    Returns
+    -------
+    perm_id : ndarray
+        Array of permutations, shape = (m, nrot), where m is the number of
+        vertices within the masks. Indices refer to the masked vertices of both
+        hemispheres (left first), and are stored as uint16 or uint32.
+
+    See Also
+    --------
+    :func:`rotate_parcellation`
+    :func:`spin_test`
+    """
+    if mask_l is not None:
+        sphere_l = sphere_l[mask_l]
+    if mask_r is not None:
+        sphere_r = sphere_r[mask_r]
+
+    perm_id = _iter_permutations(_rotate_vertices_chunk, (sphere_l, sphere_r), nrot, random_state=random_state,
+                                 n_jobs=n_jobs)
+    return np.hstack(list(perm_id))
+
+
+def _standardize(x, corr_type='pearson'):
+    """Center columns of `x` and scale them to unit norm, so that the dot product
+    of two standardized columns is their correlation.
+
+    Parameters
+    ----------
+    x : ndarray, shape = (n, k)
+        Columns to standardize. Must not contain NaNs.
+    corr_type : string, optional
+        Correlation type {'pearson', 'spearman'}. If 'spearman', columns are
+        ranked first. Default is 'pearson'.
+
+    Returns
+    -------
+    z : ndarray, shape = (n, k)
+        Standardized columns.
+    """
+    if corr_type == 'spearman':
+        x = rankdata(x, axis=0)
+    x = x - x.mean(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return x / np.linalg.norm(x, axis=0)
+
+
+def _pairwise_corr(a, b, corr_type='pearson'):
+    """Correlation between the columns of `a` and `b` using pairwise complete observations.
 
+    Parameters
+    ----------
+    a : ndarray, shape = (n, k)
+        Columns to correlate, may contain NaNs.
+    b : ndarray, shape = (n, k) or (n, 1)
+        Columns to correlate, may contain NaNs. Broadcast against `a`.
+    corr_type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+
+    Returns
+    -------
+    r : 1D ndarray
+        Correlations, shape = (k,).
+    """
+    a, b = np.broadcast_arrays(a, b)
+    mask = ~(np.isnan(a) | np.isnan(b))
+    a = np.where(mask, a, np.nan)
+    b = np.where(mask, b, np.nan)
+    if corr_type == 'spearman':
+        # same ranking as pandas, computed after dropping incomplete pairs
+        a = pd.DataFrame(a).rank().to_numpy()
+        b = pd.DataFrame(b).rank().to_numpy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(mask, a - np.nanmean(a, axis=0), 0)
+        b = np.where(mask, b - np.nanmean(b, axis=0), 0)
+        return np.sum(a * b, axis=0) / np.sqrt(np.sum(a * a, axis=0) * np.sum(b * b, axis=0))
+
+
+def _null_correlations(x, y, perm_id, corr_type='pearson'):
+    """Empirical and null correlations between two maps.
+
+    Permuted maps are gathered in chunks with `perm_id`, bounded by
+    `_MAX_BATCH_ELEMENTS`, and null correlations are computed as products of
+    standardized maps.
+
+    Parameters
+    ----------
+    x : 1D ndarray
+        One of two map to be correlated, shape = (m,)
+    y : 1D ndarray
+        The other map to be correlated, shape = (m,)
+    perm_id : ndarray
+        Array of permutations, shape = (m, nrot)
+    corr_type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+
+    Returns
+    -------
+    rho_emp : float
+        Empirical correlation
+    rho_null_xy : 1D ndarray
+        Correlations of permuted `x` to `y`, shape = (nrot,)
+    rho_null_yx : 1D ndarray
+        Correlations of `x` to permuted `y`, shape = (nrot,)
+    """
+    nroi, nperm = perm_id.shape
+    chunk = max(1, _MAX_BATCH_ELEMENTS // nroi)
+
+    rho_null_xy, rho_null_yx = [], []
+    for i in range(0, max(nperm, 1), chunk):
+        pid = np.asarray(perm_id[:, i:i + chunk]).astype(int, copy=False)
+        rho_xy, rho_yx = _chunk_correlations(x, y, pid, corr_type)
+        rho_null_xy.append(rho_xy)
+        rho_null_yx.append(rho_yx)
+
+    rho_emp = rho_null_xy[0][0]
+    rho_null_xy = np.concatenate([r[1:] for r in rho_null_xy])
+    rho_null_yx = np.concatenate([r[1:] for r in rho_null_yx])
+
+    return rho_emp, rho_null_xy, rho_null_yx
+
+
+def _chunk_correlations(x, y, perm_id, corr_type='pearson'):
+    """Correlations of permuted `x` to `y` and of `x` to permuted `y` for a chunk
+    of permutations. The first element of each corresponds to the unpermuted maps.
+    """
+    # unpermuted maps go in the first column
+    x_perm = np.column_stack((x, x[perm_id]))
+    y_perm = np.column_stack((y, y[perm_id]))
+
+    if corr_type not in ['pearson', 'spearman']:
+        # other correlation types (e.g., 'kendall') are left to pandas
+        rho_null_xy = np.array([pd.Series(xp).corr(pd.Series(y), method=corr_type) for xp in x_perm.T])
+        rho_null_yx = np.array([pd.Series(x).corr(pd.Series(yp), method=corr_type) for yp in y_perm.T])
+
+    elif np.isnan(x).any() or np.isnan(y).any():
+        rho_null_xy = _pairwise_corr(x_perm, y[:, None], corr_type)
+        rho_null_yx = _pairwise_corr(x[:, None], y_perm, corr_type)
+
+    else:
+        # correlations are column-wise products of standardized maps
+        x_perm = _standardize(x_perm, corr_type)
+        y_perm = _standardize(y_perm, corr_type)
+        rho_null_xy = np.sum(x_perm * y_perm[:, :1], axis=0)
+        rho_null_yx = np.sum(x_perm[:, :1] * y_perm, axis=0)
+
+    return rho_null_xy, rho_null_yx
+
+
+def _n_exceed(rho_null, rho_emp):
+    """Number of null correlations exceeding the empirical correlation.
+
+    The p-value definition depends on the sign of the empirical correlation, and
+    null correlations within round-off of the empirical one are ties, not exceedances.
+    """
+    if rho_emp >= 0:
+        return np.sum((rho_null > rho_emp + _TIE_TOL).astype(int))
+    return np.sum((rho_null < rho_emp - _TIE_TOL).astype(int))
+
+
+def _p_interval(n_exceed, n):
+    """Clopper-Pearson interval of a permutation p-value with `n_exceed` exceedances (possibly averaged
+    over the two null distributions) out of `n`."""
+    a = 1 - _ADAPTIVE_CONFIDENCE
+    lower = beta.ppf(a / 2, n_exceed, n - n_exceed + 1) if n_exceed > 0 else 0.
+    upper = beta.ppf(1 - a / 2, n_exceed + 1, n - n_exceed) if n_exceed < n else 1.
+    return lower, upper
+
+
+def _null_dtype(compact=False):
+    """Data type of null correlations, float32 in compact mode."""
+    return np.float32 if compact else np.float64
+
+
+def _sequential_p(x, y, perm_chunks, corr_type='pearson', alpha=0.05, compact=False):
+    """Permutation p-value computed over chunks of permutations, stopping as soon as
+    the confidence interval of the p-value lies entirely above or below `alpha`.
+
+    Parameters
+    ----------
+    x : 1D ndarray
+        One of two map to be correlated, shape = (m,)
+    y : 1D ndarray
+        The other map to be correlated, shape = (m,)
+    perm_chunks : iterable of ndarray
+        Chunks of permutations, each of shape = (m, size)
+    corr_type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+    alpha : float, optional
+        Significance level. Default is 0.05.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
+
+    Returns
+    -------
+    p_perm : float
+        Permutation p-value
+    r_dist : 1D ndarray
+        Null correlations, shape = (nperm*2,)
+    nperm : int
+        Number of permutations used.
+    """
+    nperm = 0
+    n_exceed_xy = 0
+    n_exceed_yx = 0
+    rho_null_xy, rho_null_yx = [], []
+    for pid in perm_chunks:
+        rho_emp, rho_xy, rho_yx = _null_correlations(x, y, pid, corr_type)
+        n_exceed_xy += _n_exceed(rho_xy, rho_emp)
+        n_exceed_yx += _n_exceed(rho_yx, rho_emp)
+        rho_null_xy.append(rho_xy)
+        rho_null_yx.append(rho_yx)
+        nperm += pid.shape[1]
+
+        # both null distributions come from the same rotations, so the interval is that of
+        # the averaged exceedance count over nperm trials, as for the averaged p-value
+        lower, upper = _p_interval((n_exceed_xy + n_exceed_yx) / 2, nperm)
+        if upper < alpha or lower > alpha:
+            break
+
+    # average p-values
+    p_perm = (n_exceed_xy / nperm + n_exceed_yx / nperm) / 2
+
+    return p_perm, np.concatenate(rho_null_xy + rho_null_yx).astype(_null_dtype(compact), copy=False), nperm
 
-def perm_sphere_p(x, y, perm_id, corr_type='pearson', null_dist=False):
+
+def perm_sphere_p(x, y, perm_id, corr_type='pearson', null_dist=False, adaptive=False, alpha=0.05,
+                  compact=False):
     """Generate a p-value for the spatial correlation between two parcellated cortical surface maps (author: @saratheriver)
 
     Parameters
@@ -228,13 +841,26 @@ def perm_sphere_p(x, y, perm_id, corr_type='pearson', null_dist=False):
         Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
     null_dist : bool, optional
         Output null correlations. Default is False.
+    adaptive : bool, optional
+        If True, permutations are evaluated in chunks, stopping as soon as the
+        99% confidence interval of the p-value lies above or below `alpha`.
+        The number of permutations used is then returned last, i.e.,
+        ``(p_perm, n_used)``, or ``(p_perm, r_dist, n_used)`` if ``null_dist is True``.
+        Default is False.
+    alpha : float, optional
+        Significance level. Only used if ``adaptive is True``. Default is 0.05.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
 
     Returns
     -------
     p_perm : float
         Permutation p-value
     r_dist : 1D ndarray
-        Null correlations, shape = (n_rot*2,). Only if ``null_dist is True``.
+        Null correlations, shape = (nrot*2,), or (n_used*2,) if ``adaptive is True``.
+        Only if ``null_dist is True``.
+    n_used : int
+        Number of permutations used, at most `nrot`. Only if ``adaptive is True``.
 
     See Also
     --------
@@ -251,53 +877,255 @@ def perm_sphere_p(x, y, perm_id, corr_type='pearson', null_dist=False):
       Sporns O, Bullmore ET (2017). Adolescent tuning of association cortex in human
       structural brain networks. Cerebral Cortex, 28(1):281–294.
     """
-    nroi = perm_id.shape[0]   # number of regions
     nperm = perm_id.shape[1]  # number of permutations
 
-    # empirical correlation
-    rho_emp = pd.Series(x).corr(pd.Series(y), method=corr_type)
-
-    # permutation of measures
-    x_perm = np.empty((0, nroi))
-    y_perm = np.empty((0, nroi))
-    for rr in range(nperm):
-        x_perm2 = []
-        y_perm2 =[]
-        for ii in range(nroi):
-            x_perm2 = np.append(x_perm2, x[int(perm_id[ii, rr])])
-            y_perm2 = np.append(y_perm2, y[int(perm_id[ii, rr])])
-        x_perm = np.vstack((x_perm, x_perm2))
-        y_perm = np.vstack((y_perm, y_perm2))
-
-    x_perm = np.transpose(x_perm)
-    y_perm = np.transpose(y_perm)
-
-    # correlation to unpermuted measures
-    rho_null_xy = []
-    rho_null_yx = []
-    for rr in range(nperm):
-        rho_null_xy = np.append(rho_null_xy, pd.Series(x_perm[:, rr]).corr(pd.Series(y), method=corr_type))
-        rho_null_yx = np.append(rho_null_yx, pd.Series(x).corr(pd.Series(y_perm[:, rr]), method=corr_type))
-
-    # p-value definition depends on the sign of the empirical correlation
-    if rho_emp >= 0:
-        p_perm_xy = np.sum((rho_null_xy > rho_emp).astype(int)) / nperm
-        p_perm_yx = np.sum((rho_null_yx > rho_emp).astype(int)) / nperm
-    elif rho_emp < 0:
-        p_perm_xy = np.sum((rho_null_xy < rho_emp).astype(int)) / nperm
-        p_perm_yx = np.sum((rho_null_yx < rho_emp).astype(int)) / nperm
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
 
-    # average p-values
+    if adaptive is True:
+        perm_chunks = (perm_id[:, i:i + _PERM_CHUNK_SIZE] for i in range(0, nperm, _PERM_CHUNK_SIZE))
+        p_perm, r_dist, nperm = _sequential_p(x, y, perm_chunks, corr_type, alpha=alpha, compact=compact)
+        return (p_perm, r_dist, nperm) if null_dist is True else (p_perm, nperm)
+
+    # empirical and null correlations, permuted x to y (xy) and x to permuted y (yx)
+    with _log_phase('null correlations', n_perm=nperm):
+        rho_emp, rho_null_xy, rho_null_yx = _null_correlations(x, y, perm_id, corr_type)
+
+    p_perm_xy = _n_exceed(rho_null_xy, rho_emp) / nperm
+    p_perm_yx = _n_exceed(rho_null_yx, rho_emp) / nperm
+
+    # average p-values
     p_perm = (p_perm_xy + p_perm_yx) / 2
 
     if null_dist is True:
-        return p_perm, np.append(rho_null_xy, rho_null_yx)
+        return p_perm, np.append(rho_null_xy, rho_null_yx).astype(_null_dtype(compact), copy=False)
     elif null_dist is not True:
         return p_perm
 
 
+def _index_dtype(n, signed=True):
+    """Smallest integer type (int16/uint16 or int32/uint32) able to index `n` elements."""
+    if signed:
+        return np.int16 if n <= np.iinfo(np.int16).max + 1 else np.int32
+    return np.uint16 if n <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+def _spin_files(surface_name, parcellation_name):
+    """Annotation (or mask, for vertices) and sphere files used to generate spin permutations."""
+    root_pth = os.path.dirname(__file__)
+    surf_pth = os.path.join(os.path.dirname(root_pth), 'datasets', 'surfaces')
+    if parcellation_name is None:
+        if surface_name == "fsa5":
+            annotfile = os.path.join(surf_pth, 'fsa5_{}_mask.csv')
+            spherefile = os.path.join(surf_pth, 'fsa5_sphere_{}.gii')
+        elif surface_name == "conte69":
+            annotfile = os.path.join(surf_pth, 'conte69_32k_{}_mask.csv')
+            spherefile = os.path.join(surf_pth, 'conte69_32k_{}_sphere.gii')
+        else:
+            raise ValueError("Unknown surface '{0}' for vertex-wise maps.".format(surface_name))
+
+        return [annotfile.format('lh'), annotfile.format('rh')], \
+               [spherefile.format('lh'), spherefile.format('rh')]
+
+    if surface_name == "fsa5_with_sctx" and parcellation_name == "aparc_aseg":
+        annotfile = os.path.join(root_pth, 'annot', surface_name + '_{}_' + parcellation_name + '.csv')
+    else:
+        annotfile = os.path.join(root_pth, 'annot', surface_name + '_{}_' + parcellation_name + '.annot')
+
+    if surface_name == "fsa5":
+        spherefile = os.path.join(surf_pth, 'fsa5_sphere_{}.gii')
+    elif surface_name == "fsa5_with_sctx":
+        spherefile = os.path.join(surf_pth, 'fsa5_with_sctx_sphere_{}.gii')
+    else:
+        raise ValueError("Unknown surface '{0}'.".format(surface_name))
+
+    return [annotfile.format('lh'), annotfile.format('rh')], \
+           [spherefile.format('lh'), spherefile.format('rh')]
+
+
+def _spin_cache_file(surface_name, parcellation_name, n_rot, ventricles, method, random_state):
+    """Path to stored spin permutations.
+
+    Permutations are identified by the generation parameters and a checksum of the
+    annotation and sphere files, so edited files do not reuse stale permutations.
+    """
+    annotfiles, spherefiles = _spin_files(surface_name, parcellation_name)
+    checksum = file_checksum(*(annotfiles + spherefiles))
+
+    if parcellation_name is None:
+        # vertices are matched to their nearest neighbour, `method` does not apply
+        name = '{0}_vertices'.format(surface_name)
+        method = 'nearest'
+    else:
+        name = '{0}_{1}'.format(surface_name, parcellation_name)
+    if parcellation_name == 'aparc_aseg' and ventricles is True:
+        name += '_vent'
+    name += '_nrot{0}_seed{1}_{2}_v{3}_{4}.npy'.format(n_rot, random_state, method, _SPIN_CACHE_VERSION,
+                                                        checksum[:16])
+    return os.path.join(get_cache_dir('spins'), name)
+
+
+def _spin_coordinates(surface_name='fsa5', parcellation_name='aparc', ventricles=False):
+    """Sphere coordinates of the parcels (or masked vertices if `parcellation_name` is None)
+    of both hemispheres, memoized per annotation and sphere files.
+    """
+    annotfiles, spherefiles = _spin_files(surface_name, parcellation_name)
+    key = (file_checksum(*(annotfiles + spherefiles)), parcellation_name == 'aparc_aseg' and ventricles is True)
+    if key in _spin_coords:
+        return _spin_coords[key]
+
+    if parcellation_name is None:
+        if surface_name == "fsa5":
+            sphere_lh, sphere_rh = load_fsa5(as_sphere=True, with_normals=False)
+        elif surface_name == "conte69":
+            sphere_lh, sphere_rh = load_conte69(as_sphere=True, with_normals=False)
+        mask_lh, mask_rh = load_mask(surface_name=surface_name)
+        coords = sphere_lh.Points[mask_lh], sphere_rh.Points[mask_rh]
+
+    else:
+        if surface_name == "fsa5":
+            sphere_lh, sphere_rh = load_fsa5(as_sphere=True)
+        elif surface_name == "fsa5_with_sctx":
+            sphere_lh, sphere_rh = load_fsa5(as_sphere=True, with_sctx=True)
+
+        # get sphere coordinates of parcels
+        if surface_name == "fsa5_with_sctx" and parcellation_name == "aparc_aseg":
+            lh_centroid = centroid_extraction_sphere(sphere_lh.Points, annotfiles[0], ventricles=ventricles)
+            rh_centroid = centroid_extraction_sphere(sphere_rh.Points, annotfiles[1], ventricles=ventricles)
+        else:
+            lh_centroid = centroid_extraction_sphere(sphere_lh.Points, annotfiles[0])
+            rh_centroid = centroid_extraction_sphere(sphere_rh.Points, annotfiles[1])
+        coords = lh_centroid, rh_centroid
+
+    for c in coords:
+        c.flags.writeable = False
+    _spin_coords[key] = coords
+    return coords
+
+
+def _spin_chunk_args(surface_name='fsa5', parcellation_name='aparc', ventricles=False, method='greedy'):
+    """Chunk function and its arguments to generate spin permutations of a parcellation,
+    or of vertices if `parcellation_name` is None.
+    """
+    if parcellation_name is not None and method not in _MATCH:
+        raise ValueError("Unknown method '{0}'.".format(method))
+
+    coord_lh, coord_rh = _spin_coordinates(surface_name, parcellation_name, ventricles=ventricles)
+    if parcellation_name is None:
+        return _rotate_vertices_chunk, (coord_lh, coord_rh)
+    return _rotate_chunk, (coord_lh, coord_rh, method, _use_numba())
+
+
+def _spin_permutations(surface_name='fsa5', parcellation_name='aparc', n_rot=1000, ventricles=False,
+                       method='greedy', random_state=None, cache=True, n_jobs=1):
+    """Spin permutations of a parcellation, or of vertices if `parcellation_name` is None,
+    read from the on-disk store when available.
+
+    Permutations are only stored when `random_state` is an int, and they are
+    memory-mapped when read from the store.
+
+    Returns
+    -------
+    perm_id : ndarray
+        Array of permutations, shape = (m, n_rot)
+    """
+    fname = None
+    if cache and isinstance(random_state, numbers.Integral):
+        fname = _spin_cache_file(surface_name, parcellation_name, n_rot, ventricles, method, random_state)
+        if os.path.isfile(fname):
+            with _log_phase('load permutations', n_perm=n_rot):
+                return np.load(fname, mmap_mode='r')
+
+    # generate permutation maps
+    chunk_func, args = _spin_chunk_args(surface_name, parcellation_name, ventricles=ventricles, method=method)
+    perm_id = _iter_permutations(chunk_func, args, n_rot, random_state=random_state, n_jobs=n_jobs)
+    perm_id = np.hstack(list(perm_id))
+
+    if fname is not None:
+        try:
+            with _log_phase('store permutations', n_perm=n_rot):
+                save_array(fname, perm_id)
+        except OSError as e:
+            warnings.warn('Could not store spin permutations: {0}'.format(e))
+
+    return perm_id
+
+
+def _iter_spin_permutations(surface_name='fsa5', parcellation_name='aparc', n_rot=1000, ventricles=False,
+                            method='greedy', random_state=None, cache=True, n_jobs=1):
+    """Spin permutations in chunks, generated only as they are consumed.
+
+    Permutations are read from the on-disk store when available, but partially
+    consumed permutations are not stored.
+
+    Yields
+    ------
+    perm_id : ndarray
+        Array of permutations of one chunk, shape = (m, size)
+    """
+    if cache and isinstance(random_state, numbers.Integral):
+        fname = _spin_cache_file(surface_name, parcellation_name, n_rot, ventricles, method, random_state)
+        if os.path.isfile(fname):
+            perm_id = np.load(fname, mmap_mode='r')
+            for i in range(0, n_rot, _PERM_CHUNK_SIZE):
+                yield perm_id[:, i:i + _PERM_CHUNK_SIZE]
+            return
+
+    chunk_func, args = _spin_chunk_args(surface_name, parcellation_name, ventricles=ventricles, method=method)
+    for perm_id in _iter_permutations(chunk_func, args, n_rot, random_state=random_state, n_jobs=n_jobs,
+                                      lazy=True):
+        yield perm_id
+
+
+def precompute_spins(n_rot=1000, random_state=0, method='greedy', n_jobs=1):
+    """Compute and store spin permutations for all available parcellations
+
+    Subsequent calls to :func:`spin_test` with the same `n_rot`, `random_state`
+    and `method` reuse the stored permutations. The store is located in
+    ``$ENIGMA_CACHE_DIR`` if set, otherwise in ``~/.cache/enigmatoolbox``.
+
+    Parameters
+    ----------
+    n_rot : int, optional
+        Number of spin rotations. Default is 1000.
+    random_state : int, optional
+        Random state. Default is 0.
+    method : {'greedy', 'hungarian'}, optional
+        Assignment of rotated to unrotated regions. Default is 'greedy'.
+    n_jobs : int, optional
+        Number of parallel jobs. If -1, all CPUs are used. Default is 1.
+
+    Returns
+    -------
+    fnames : list of str
+        Paths to stored permutations.
+
+    See Also
+    --------
+    :func:`spin_test`
+    :func:`rotate_parcellation`
+    """
+    if not isinstance(random_state, numbers.Integral):
+        raise ValueError('Spin permutations can only be stored for an integer random_state.')
+
+    # cortical parcellations, and cortical + subcortical with and without ventricles
+    annot_pth = os.path.join(os.path.dirname(__file__), 'annot')
+    spins = [('fsa5', fn[len('fsa5_lh_'):-len('.annot')], False)
+             for fn in sorted(os.listdir(annot_pth)) if fn.startswith('fsa5_lh_') and fn.endswith('.annot')]
+    spins += [('fsa5_with_sctx', 'aparc_aseg', False), ('fsa5_with_sctx', 'aparc_aseg', True)]
+
+    fnames = []
+    for surface_name, parcellation_name, ventricles in spins:
+        _spin_permutations(surface_name, parcellation_name, n_rot=n_rot, ventricles=ventricles,
+                           method=method, random_state=random_state, cache=True, n_jobs=n_jobs)
+        fnames.append(_spin_cache_file(surface_name, parcellation_name, n_rot, ventricles, method,
+                                       random_state))
+    return fnames
+
+
 def spin_test(map1, map2, surface_name='fsa5', parcellation_name='aparc', n_rot=1000,
-              type='pearson', null_dist=False, ventricles=False):
+              type='pearson', null_dist=False, ventricles=False, method='greedy', random_state=None,
+              cache=True, n_jobs=1, adaptive=False, alpha=0.05, compact=False):
     """Spin permutation (author: @saratheriver)
 
     Parameters
@@ -307,9 +1135,11 @@ def spin_test(map1, map2, surface_name='fsa5', parcellation_name='aparc', n_rot=
     map2 : narray, ndarray, or pandas.Series
         The other map to be correlated
     surface_name : string, optional
-        Surface name {'fsa5', 'fsa5_with_sctx'}. Use 'fsa5' for Conte69. Default is 'fsa5'.
-    parcellation_name : string, optional
-        Parcellation name {'aparc', 'aparc_aseg'}. Default is 'aparc'.
+        Surface name {'fsa5', 'fsa5_with_sctx', 'conte69'}. Use 'fsa5' for parcellated Conte69 maps,
+        'conte69' is only available for vertex-wise maps. Default is 'fsa5'.
+    parcellation_name : string or None, optional
+        Parcellation name {'aparc', 'aparc_aseg'}. If None, maps are vertex-wise (both hemispheres,
+        left first), and vertices out of the cortical mask are excluded. Default is 'aparc'.
     n_rot : int, optional
         Number of spin rotations. Default is 1000.
     type : string, optional
@@ -319,19 +1149,46 @@ def spin_test(map1, map2, surface_name='fsa5', parcellation_name='aparc', n_rot=
     ventricles : bool, optional
         Whether ventricles are present in map1, map2. Only used when ``parcellation_name is 'aparc_aseg'``.
         Default is False.
+    method : {'greedy', 'hungarian'}, optional
+        Assignment of rotated to unrotated regions. Only used for parcellated maps,
+        vertices are assigned to the nearest rotated vertex. Default is 'greedy'.
+    random_state : int or None, optional
+        Random state. Default is None.
+    cache : bool, optional
+        Whether to reuse spin permutations from the on-disk store, and to add them
+        to the store if not already there. Only used if `random_state` is an int.
+        Default is True.
+    n_jobs : int, optional
+        Number of parallel jobs used to generate rotations. Results do not depend
+        on `n_jobs`. If -1, all CPUs are used. Default is 1.
+    adaptive : bool, optional
+        If True, rotations are generated in chunks, stopping as soon as the 99%
+        confidence interval of the p-value lies above or below `alpha`, with at
+        most `n_rot` rotations. The number of rotations used is then returned
+        last, i.e., ``(p_spin, n_used)``, or ``(p_spin, r_dist, n_used)`` if
+        ``null_dist is True``. Default is False.
+    alpha : float, optional
+        Significance level. Only used if ``adaptive is True``. Default is 0.05.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
 
     Returns
     -------
     p_spin : float
         Permutation p-value
     r_dist : 1D ndarray
-        Null correlations, shape = (n_rot*2,). Only if ``null_dist is True``.
+        Null correlations, shape = (n_rot*2,), or (n_used*2,) if ``adaptive is True``.
+        Only if ``null_dist is True``.
+    n_used : int
+        Number of rotations used, at most `n_rot`. Only if ``adaptive is True``.
 
     See Also
     --------
     :func:`centroid_extraction_sphere`
     :func:`rotate_parcellation`
+    :func:`rotate_vertices`
     :func:`perm_sphere_p`
+    :func:`precompute_spins`
 
     References
     ----------
@@ -339,42 +1196,38 @@ def spin_test(map1, map2, surface_name='fsa5', parcellation_name='aparc', n_rot=
       Shinohara RT, Vandekar SN and Raznahan A (2018). On testing for spatial
       correspondence between maps of human brain structure and function.
       NeuroImage, 178:540-51.
-    * Váša F, Seidlitz J, Romero-Garcia R, Whitaker KJ, Rosenthal G, Vértes PE,
+    * Váša F, Seidlitz J, Romero-Garcia R, Whitaker KJ, Rosenthal G, Vértes PE,
       Shinn M, Alexander-Bloch A, Fonagy P, Dolan RJ, Goodyer IM, the NSPN consortium,
       Sporns O, Bullmore ET (2017). Adolescent tuning of association cortex in human
       structural brain networks. Cerebral Cortex, 28(1):281–294.
     """
-    if surface_name == "fsa5":
-        sphere_lh, sphere_rh = load_fsa5(as_sphere=True)
-    elif surface_name == "fsa5_with_sctx":
-        sphere_lh, sphere_rh = load_fsa5(as_sphere=True, with_sctx=True)
-
-    root_pth = os.path.dirname(__file__)
-    # get sphere coordinates of parcels
-    if surface_name == "fsa5_with_sctx" and parcellation_name =="aparc_aseg":
-        annotfile_lh = os.path.join(root_pth, 'annot', surface_name + '_lh_' + parcellation_name + '.csv')
-        annotfile_rh = os.path.join(root_pth, 'annot', surface_name + '_rh_' + parcellation_name + '.csv')
-
-        lh_centroid = centroid_extraction_sphere(sphere_lh.Points, annotfile_lh, ventricles=ventricles)
-        rh_centroid = centroid_extraction_sphere(sphere_rh.Points, annotfile_rh, ventricles=ventricles)
-    else:
-        annotfile_lh = os.path.join(root_pth, 'annot', surface_name + '_lh_' + parcellation_name + '.annot')
-        annotfile_rh = os.path.join(root_pth, 'annot', surface_name + '_rh_' + parcellation_name + '.annot')
-
-        lh_centroid = centroid_extraction_sphere(sphere_lh.Points, annotfile_lh)
-        rh_centroid = centroid_extraction_sphere(sphere_rh.Points, annotfile_rh)
-
-    # generate permutation maps
-    perm_id = rotate_parcellation(lh_centroid, rh_centroid, n_rot)
-
-    # generate spin permuted p-value
     if isinstance(map1, pd.DataFrame) or isinstance(map1, pd.Series):
         map1 = map1.to_numpy()
 
     if isinstance(map2, pd.DataFrame) or isinstance(map2, pd.Series):
         map2 = map2.to_numpy()
 
-    p_spin, r_dist = perm_sphere_p(map1, map2, perm_id, type, null_dist=True)
+    # exclude vertices out of the cortical mask
+    if parcellation_name is None:
+        mask = load_mask(surface_name=surface_name, join=True)
+        map1 = np.asarray(map1)[mask]
+        map2 = np.asarray(map2)[mask]
+
+    if adaptive is True:
+        # generate permutation maps only as needed
+        perm_id = _iter_spin_permutations(surface_name, parcellation_name, n_rot=n_rot, ventricles=ventricles,
+                                          method=method, random_state=random_state, cache=cache, n_jobs=n_jobs)
+        map1 = np.asarray(map1, dtype=float).ravel()
+        map2 = np.asarray(map2, dtype=float).ravel()
+        p_spin, r_dist, n_used = _sequential_p(map1, map2, perm_id, type, alpha=alpha, compact=compact)
+        return (p_spin, r_dist, n_used) if null_dist is True else (p_spin, n_used)
+
+    # generate permutation maps
+    perm_id = _spin_permutations(surface_name, parcellation_name, n_rot=n_rot, ventricles=ventricles,
+                                 method=method, random_state=random_state, cache=cache, n_jobs=n_jobs)
+
+    # generate spin permuted p-value
+    p_spin, r_dist = perm_sphere_p(map1, map2, perm_id, type, null_dist=True, compact=compact)
 
     if null_dist is True:
         return p_spin, r_dist
@@ -382,96 +1235,778 @@ def spin_test(map1, map2, surface_name='fsa5', parcellation_name='aparc', n_rot=
         return p_spin
 
 
-def shuf_test(map1, map2, n_rot=1000, type='pearson', null_dist=False):
-    """Shuf permuation (author: @saratheriver)
+def _perm_sphere_p_many(maps_a, maps_b, perm_id, corr_type='pearson', null_dist=False, compact=False):
+    """Permutation p-values for the correlations between every pair of maps in
+    `maps_a` and `maps_b`, sharing one set of permutations.
+
+    Null correlations are computed as matrix products of standardized maps, in
+    chunks of permutations to bound memory usage.
+
+    Parameters
+    ----------
+    maps_a : ndarray, shape = (m, n_a)
+        Maps arranged in columns.
+    maps_b : ndarray, shape = (m, n_b)
+        Maps arranged in columns.
+    perm_id : ndarray
+        Array of permutations, shape = (m, nrot)
+    corr_type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+    null_dist : bool, optional
+        Output null correlations. Default is False.
+    compact : bool, optional
+        If True, null correlations are stored as float32. Default is False.
+
+    Returns
+    -------
+    r : ndarray
+        Empirical correlations, shape = (n_a, n_b)
+    p_perm : ndarray
+        Permutation p-values, shape = (n_a, n_b)
+    r_dist : ndarray
+        Null correlations, shape = (n_a, n_b, nrot*2). Only if ``null_dist is True``.
+    """
+    nroi, nperm = perm_id.shape
+    n_a, n_b = maps_a.shape[1], maps_b.shape[1]
+
+    if corr_type not in ['pearson', 'spearman'] or np.isnan(maps_a).any() or np.isnan(maps_b).any():
+        # fall back to one pair at a time
+        r = np.empty((n_a, n_b))
+        p_perm = np.empty((n_a, n_b))
+        r_dist = np.empty((n_a, n_b, 2 * nperm), dtype=_null_dtype(compact)) if null_dist else None
+        for i in range(n_a):
+            for j in range(n_b):
+                r[i, j] = _null_correlations(maps_a[:, i], maps_b[:, j], perm_id[:, :0], corr_type)[0]
+                if null_dist:
+                    p_perm[i, j], r_dist[i, j] = perm_sphere_p(maps_a[:, i], maps_b[:, j], perm_id, corr_type,
+                                                               null_dist=True)
+                else:
+                    p_perm[i, j] = perm_sphere_p(maps_a[:, i], maps_b[:, j], perm_id, corr_type)
+        return (r, p_perm, r_dist) if null_dist else (r, p_perm)
+
+    z_a = _standardize(maps_a, corr_type)
+    z_b = _standardize(maps_b, corr_type)
+    r = z_a.T @ z_b
+    positive = r >= 0
+
+    n_exceed_xy = np.zeros((n_a, n_b), dtype=int)
+    n_exceed_yx = np.zeros((n_a, n_b), dtype=int)
+    r_dist = np.empty((n_a, n_b, 2 * nperm), dtype=_null_dtype(compact)) if null_dist else None
+
+    with _log_phase('null correlations', n_perm=nperm, n_pairs=n_a * n_b):
+        chunk = max(1, _MAX_BATCH_ELEMENTS // (nroi * max(n_a, n_b)))
+        for i in range(0, nperm, chunk):
+            pid = np.asarray(perm_id[:, i:i + chunk]).astype(int, copy=False)
+            nc = pid.shape[1]
+
+            # permuted maps a against maps b (xy), and maps a against permuted maps b (yx)
+            za_perm = _standardize(maps_a[pid].reshape(nroi, nc * n_a), corr_type)
+            zb_perm = _standardize(maps_b[pid].reshape(nroi, nc * n_b), corr_type)
+            rho_null_xy = (za_perm.T @ z_b).reshape(nc, n_a, n_b)
+            rho_null_yx = (z_a.T @ zb_perm).reshape(n_a, nc, n_b).transpose(1, 0, 2)
+
+            # p-value definition depends on the sign of the empirical correlation
+            n_exceed_xy += np.where(positive, rho_null_xy > r + _TIE_TOL, rho_null_xy < r - _TIE_TOL).sum(axis=0)
+            n_exceed_yx += np.where(positive, rho_null_yx > r + _TIE_TOL, rho_null_yx < r - _TIE_TOL).sum(axis=0)
+
+            if null_dist:
+                r_dist[..., i:i + nc] = rho_null_xy.transpose(1, 2, 0)
+                r_dist[..., nperm + i:nperm + i + nc] = rho_null_yx.transpose(1, 2, 0)
+
+    # average p-values
+    p_perm = (n_exceed_xy / nperm + n_exceed_yx / nperm) / 2
+
+    return (r, p_perm, r_dist) if null_dist else (r, p_perm)
+
+
+def spin_test_many(maps_a, maps_b, surface_name='fsa5', parcellation_name='aparc', n_rot=1000,
+                   type='pearson', null_dist=False, ventricles=False, method='greedy', random_state=None,
+                   cache=True, n_jobs=1, compact=False):
+    """Spin permutation for every pair of maps, sharing one set of rotations
+
+    Equivalent to calling :func:`spin_test` on every pair of maps with the same
+    rotations, but rotations are generated only once and all null correlations are
+    computed with matrix products.
+
+    Parameters
+    ----------
+    maps_a : ndarray or pandas.DataFrame
+        Maps arranged in columns, shape = (n_regions, n_maps_a)
+    maps_b : ndarray or pandas.DataFrame
+        Maps arranged in columns, shape = (n_regions, n_maps_b)
+    surface_name : string, optional
+        Surface name {'fsa5', 'fsa5_with_sctx', 'conte69'}. Use 'fsa5' for parcellated Conte69 maps,
+        'conte69' is only available for vertex-wise maps. Default is 'fsa5'.
+    parcellation_name : string or None, optional
+        Parcellation name {'aparc', 'aparc_aseg'}. If None, maps are vertex-wise (both hemispheres,
+        left first), and vertices out of the cortical mask are excluded. Default is 'aparc'.
+    n_rot : int, optional
+        Number of spin rotations. Default is 1000.
+    type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+    null_dist : bool, optional
+        Output null correlations. Default is False.
+    ventricles : bool, optional
+        Whether ventricles are present in the maps. Only used when ``parcellation_name is 'aparc_aseg'``.
+        Default is False.
+    method : {'greedy', 'hungarian'}, optional
+        Assignment of rotated to unrotated regions. Only used for parcellated maps,
+        vertices are assigned to the nearest rotated vertex. Default is 'greedy'.
+    random_state : int or None, optional
+        Random state. Default is None.
+    cache : bool, optional
+        Whether to use the on-disk store of spin permutations. Only used if
+        `random_state` is an int. Default is True.
+    n_jobs : int, optional
+        Number of parallel jobs used to generate rotations. Results do not depend
+        on `n_jobs`. If -1, all CPUs are used. Default is 1.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
+
+    Returns
+    -------
+    r : 2D ndarray
+        Correlations between maps, shape = (n_maps_a, n_maps_b)
+    p_spin : 2D ndarray
+        Permutation p-values, shape = (n_maps_a, n_maps_b)
+    r_dist : 3D ndarray
+        Null correlations, shape = (n_maps_a, n_maps_b, n_rot*2). Only if ``null_dist is True``.
+
+    See Also
+    --------
+    :func:`spin_test`
+    """
+    maps_a = np.asarray(maps_a, dtype=float)
+    maps_b = np.asarray(maps_b, dtype=float)
+    if maps_a.ndim == 1:
+        maps_a = maps_a[:, None]
+    if maps_b.ndim == 1:
+        maps_b = maps_b[:, None]
+
+    # exclude vertices out of the cortical mask
+    if parcellation_name is None:
+        mask = load_mask(surface_name=surface_name, join=True)
+        maps_a = maps_a[mask]
+        maps_b = maps_b[mask]
+
+    # generate permutation maps
+    perm_id = _spin_permutations(surface_name, parcellation_name, n_rot=n_rot, ventricles=ventricles,
+                                 method=method, random_state=random_state, cache=cache, n_jobs=n_jobs)
+
+    return _perm_sphere_p_many(maps_a, maps_b, perm_id, type, null_dist=null_dist, compact=compact)
+
+
+def _shuffle_chunk(nroi, n_rot, rs):
+    """Generate a chunk of random permutations that do not map to themselves.
+
+    Returns
+    -------
+    perm_id : ndarray
+        Array of permutations, shape = (nroi, n_rot)
+    n_self : int
+        Number of discarded permutations that mapped to themselves.
+    """
+    perm_id = np.empty((nroi, n_rot), dtype=int)
+    r = 0
+    n_self = 0
+    while (r < n_rot):
+        rot_lr_sort = rs.permutation(nroi)
+
+        # verify that permutation does not map to itself
+        if np.all(rot_lr_sort == np.arange(nroi)):
+            n_self = n_self + 1
+        else:
+            perm_id[:, r] = rot_lr_sort
+            r = r + 1
+
+    return perm_id, n_self
+
+
+def shuf_test(map1, map2, n_rot=1000, type='pearson', null_dist=False, random_state=None, n_jobs=1,
+              adaptive=False, alpha=0.05, compact=False):
+    """Shuf permuation (author: @saratheriver)
+
+    Parameters
+    ----------
+    map1 : narray, ndarray, or pandas.Series
+        One of two map to be correlated
+    map2 : narray, ndarray, or pandas.Series
+        The other map to be correlated
+    n_rot : int, optional
+        Number of shuffles. Default is 1000.
+    type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+    null_dist : bool, optional
+        Output null correlations. Default is False.
+    random_state : int or None, optional
+        Random state. Shuffles are generated in chunks with independent random
+        streams, so results do not depend on `n_jobs`. Default is None.
+    n_jobs : int, optional
+        Number of parallel jobs. If -1, all CPUs are used. Default is 1.
+    adaptive : bool, optional
+        If True, shuffles are generated in chunks, stopping as soon as the 99%
+        confidence interval of the p-value lies above or below `alpha`, with at
+        most `n_rot` shuffles. The number of shuffles used is then returned
+        last, i.e., ``(p_shuf, n_used)``, or ``(p_shuf, r_dist, n_used)`` if
+        ``null_dist is True``. Default is False.
+    alpha : float, optional
+        Significance level. Only used if ``adaptive is True``. Default is 0.05.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
+
+    Returns
+    -------
+    p_shuf : float
+        Permutation p-value
+    r_dist : 1D ndarray
+        Null correlations, shape = (n_rot*2,), or (n_used*2,) if ``adaptive is True``.
+        Only if ``null_dist is True``.
+    n_used : int
+        Number of shuffles used, at most `n_rot`. Only if ``adaptive is True``.
+    """
+    nroi = map1.shape[0]  # number of regions
+
+    # generate random permutations, in chunks drawn from independent random streams
+    perm_id = _iter_permutations(_shuffle_chunk, (nroi,), n_rot, random_state=random_state, n_jobs=n_jobs,
+                                 lazy=adaptive)
+
+    if adaptive is True:
+        map1 = np.asarray(map1, dtype=float).ravel()
+        map2 = np.asarray(map2, dtype=float).ravel()
+        p_shuf, r_dist, n_used = _sequential_p(map1, map2, perm_id, type, alpha=alpha, compact=compact)
+        return (p_shuf, r_dist, n_used) if null_dist is True else (p_shuf, n_used)
+
+    perm_id = np.hstack(list(perm_id))
+
+    p_shuf, r_dist = perm_sphere_p(map1, map2, perm_id, type, null_dist=True, compact=compact)
+
+    if null_dist is True:
+        return p_shuf, r_dist
+    elif null_dist is not True:
+        return p_shuf
+
+
+def shuf_test_many(maps_a, maps_b, n_rot=1000, type='pearson', null_dist=False, random_state=None, n_jobs=1,
+                   compact=False):
+    """Shuf permutation for every pair of maps, sharing one set of shuffles
+
+    Equivalent to calling :func:`shuf_test` on every pair of maps with the same
+    shuffles, but shuffles are generated only once and all null correlations are
+    computed with matrix products.
+
+    Parameters
+    ----------
+    maps_a : ndarray or pandas.DataFrame
+        Maps arranged in columns, shape = (n_regions, n_maps_a)
+    maps_b : ndarray or pandas.DataFrame
+        Maps arranged in columns, shape = (n_regions, n_maps_b)
+    n_rot : int, optional
+        Number of shuffles. Default is 1000.
+    type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+    null_dist : bool, optional
+        Output null correlations. Default is False.
+    random_state : int or None, optional
+        Random state. Default is None.
+    n_jobs : int, optional
+        Number of parallel jobs used to generate shuffles. Results do not depend
+        on `n_jobs`. If -1, all CPUs are used. Default is 1.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
+
+    Returns
+    -------
+    r : 2D ndarray
+        Correlations between maps, shape = (n_maps_a, n_maps_b)
+    p_shuf : 2D ndarray
+        Permutation p-values, shape = (n_maps_a, n_maps_b)
+    r_dist : 3D ndarray
+        Null correlations, shape = (n_maps_a, n_maps_b, n_rot*2). Only if ``null_dist is True``.
+
+    See Also
+    --------
+    :func:`shuf_test`
+    """
+    maps_a = np.asarray(maps_a, dtype=float)
+    maps_b = np.asarray(maps_b, dtype=float)
+    if maps_a.ndim == 1:
+        maps_a = maps_a[:, None]
+    if maps_b.ndim == 1:
+        maps_b = maps_b[:, None]
+
+    # generate random permutations, in chunks drawn from independent random streams
+    perm_id = _iter_permutations(_shuffle_chunk, (maps_a.shape[0],), n_rot, random_state=random_state,
+                                 n_jobs=n_jobs)
+    perm_id = np.hstack(list(perm_id))
+
+    return _perm_sphere_p_many(maps_a, maps_b, perm_id, type, null_dist=null_dist, compact=compact)
+
+
+def _masked_correlations(x, y):
+    """Pearson correlations between the columns of `x` and `y` using pairwise complete
+    observations, computed with matrix products of the masks and zero-filled maps.
+
+    Parameters
+    ----------
+    x : ndarray, shape = (n, k)
+        Columns to correlate, may contain NaNs. Better centered for numerical accuracy.
+    y : ndarray, shape = (n, l)
+        Columns to correlate, may contain NaNs. Better centered for numerical accuracy.
+
+    Returns
+    -------
+    r : ndarray
+        Correlations, shape = (k, l).
+    """
+    mask_x = ~np.isnan(x)
+    mask_y = ~np.isnan(y)
+    x = np.where(mask_x, x, 0)
+    y = np.where(mask_y, y, 0)
+    mask_x = mask_x.astype(float)
+    mask_y = mask_y.astype(float)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = mask_x.T @ mask_y
+        sx = x.T @ mask_y
+        sy = mask_x.T @ y
+        sxy = x.T @ y - sx * sy / n
+        sxx = (x * x).T @ mask_y - sx * sx / n
+        syy = mask_x.T @ (y * y) - sy * sy / n
+        return sxy / np.sqrt(sxx * syy)
+
+
+def _perm_gene_p(x, genes, perm_id, corr_type='pearson', null_dist=False, compact=False):
+    """Permutation p-values for the correlations between one map and many genes.
+
+    Permuted maps are correlated with all genes with one matrix product per chunk
+    of permutations. Permutations must be bijective: the correlation of the map to
+    permuted genes equals the correlation of the inversely permuted map to genes.
+
+    Parameters
+    ----------
+    x : 1D ndarray
+        Map, shape = (m,)
+    genes : ndarray
+        Gene expression, shape = (m, n_genes)
+    perm_id : ndarray
+        Array of permutations, shape = (m, nrot)
+    corr_type : string, optional
+        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
+    null_dist : bool, optional
+        Output null correlations. Default is False.
+    compact : bool, optional
+        If True, null correlations are stored as float32. Default is False.
+
+    Returns
+    -------
+    r : 1D ndarray
+        Empirical correlations, shape = (n_genes,)
+    p_perm : 1D ndarray
+        Permutation p-values, shape = (n_genes,)
+    r_dist : 2D ndarray
+        Null correlations, shape = (n_genes, nrot*2). Only if ``null_dist is True``.
+    """
+    if corr_type not in ['pearson', 'spearman']:
+        raise ValueError("Unknown correlation type '{0}'.".format(corr_type))
+
+    nroi, nperm = perm_id.shape
+    n_genes = genes.shape[1]
+
+    if np.isnan(x).any() or np.isnan(genes).any():
+        if corr_type != 'pearson':
+            raise ValueError("Only 'pearson' correlations are supported for maps with NaNs.")
+
+        # missing regions move with the permutations, pairs are masked instead
+        x = x - np.nanmean(x)
+        genes = genes - np.nanmean(genes, axis=0)
+
+        def corr(maps):
+            return _masked_correlations(maps, genes)
+    else:
+        z_genes = _standardize(genes, corr_type)
+
+        def corr(maps):
+            return _standardize(maps, corr_type).T @ z_genes
+
+    r = corr(x[:, None])[0]
+    positive = r >= 0
+
+    n_exceed_xy = np.zeros(n_genes, dtype=int)
+    n_exceed_yx = np.zeros(n_genes, dtype=int)
+    r_dist = np.empty((n_genes, 2 * nperm), dtype=_null_dtype(compact)) if null_dist else None
+
+    with _log_phase('null correlations', n_perm=nperm, n_genes=n_genes):
+        chunk = max(1, _MAX_BATCH_ELEMENTS // (2 * max(nroi, n_genes)))
+        for i in range(0, nperm, chunk):
+            pid = np.asarray(perm_id[:, i:i + chunk]).astype(int, copy=False)
+            nc = pid.shape[1]
+
+            # permuted map against genes (xy), and inversely permuted map against genes (yx)
+            rho_null = corr(np.hstack((x[pid], x[np.argsort(pid, axis=0)])))
+            rho_null_xy, rho_null_yx = rho_null[:nc], rho_null[nc:]
+
+            # p-value definition depends on the sign of the empirical correlation
+            n_exceed_xy += np.where(positive, rho_null_xy > r + _TIE_TOL, rho_null_xy < r - _TIE_TOL).sum(axis=0)
+            n_exceed_yx += np.where(positive, rho_null_yx > r + _TIE_TOL, rho_null_yx < r - _TIE_TOL).sum(axis=0)
+
+            if null_dist:
+                r_dist[:, i:i + nc] = rho_null_xy.T
+                r_dist[:, nperm + i:nperm + i + nc] = rho_null_yx.T
+
+    # average p-values
+    p_perm = (n_exceed_xy / nperm + n_exceed_yx / nperm) / 2
+
+    return (r, p_perm, r_dist) if null_dist else (r, p_perm)
+
+
+def spin_test_genes(map1, expression, surface_name='fsa5', parcellation_name='aparc', n_rot=1000,
+                    type='pearson', null_dist=False, ventricles=False, method='greedy', random_state=None,
+                    cache=True, n_jobs=1, compact=False):
+    """Spin permutation of the correlations between one map and every gene
+
+    Equivalent to calling :func:`spin_test` on the map and each gene with the same
+    rotations, but rotations are generated only once and the map is correlated to
+    all genes with matrix products. Regions with missing expression (NaN) are
+    excluded pairwise, as in :func:`spin_test`.
+
+    Parameters
+    ----------
+    map1 : narray, ndarray, or pandas.Series
+        Parcellated map, shape = (n_regions,)
+    expression : pandas.DataFrame or ndarray
+        Gene expression of the same regions, shape = (n_regions, n_genes), e.g., rows of
+        :func:`enigmatoolbox.datasets.fetch_ahba`. Non-numeric columns (e.g., 'label') are ignored.
+    surface_name : string, optional
+        Surface name {'fsa5', 'fsa5_with_sctx'}. Default is 'fsa5'.
+    parcellation_name : string, optional
+        Parcellation name {'aparc', 'aparc_aseg'}. Default is 'aparc'.
+    n_rot : int, optional
+        Number of spin rotations. Default is 1000.
+    type : string, optional
+        Correlation type {'pearson', 'spearman'}. Only 'pearson' if there are NaNs. Default is 'pearson'.
+    null_dist : bool, optional
+        Output null correlations. Default is False.
+    ventricles : bool, optional
+        Whether ventricles are present in the map. Only used when ``parcellation_name is 'aparc_aseg'``.
+        Default is False.
+    method : {'greedy', 'hungarian'}, optional
+        Assignment of rotated to unrotated regions. Default is 'greedy'.
+    random_state : int or None, optional
+        Random state. Default is None.
+    cache : bool, optional
+        Whether to use the on-disk store of spin permutations. Only used if
+        `random_state` is an int. Default is True.
+    n_jobs : int, optional
+        Number of parallel jobs used to generate rotations. Results do not depend
+        on `n_jobs`. If -1, all CPUs are used. Default is 1.
+    compact : bool, optional
+        If True, null correlations are returned as float32. Default is False.
+
+    Returns
+    -------
+    r : 1D ndarray
+        Correlations between map and genes, shape = (n_genes,)
+    p_spin : 1D ndarray
+        Permutation p-values, shape = (n_genes,)
+    r_dist : 2D ndarray
+        Null correlations, shape = (n_genes, n_rot*2). Only if ``null_dist is True``.
+
+    See Also
+    --------
+    :func:`spin_test`
+    :func:`gene_set_test`
+    """
+    if parcellation_name is None:
+        raise ValueError("Gene expression must be parcellated.")
+
+    if isinstance(expression, pd.DataFrame):
+        expression = expression.select_dtypes('number')
+    genes = np.asarray(expression, dtype=float)
+    map1 = np.asarray(map1, dtype=float).ravel()
+
+    # generate permutation maps
+    perm_id = _spin_permutations(surface_name, parcellation_name, n_rot=n_rot, ventricles=ventricles,
+                                 method=method, random_state=random_state, cache=cache, n_jobs=n_jobs)
+
+    return _perm_gene_p(map1, genes, perm_id, type, null_dist=null_dist, compact=compact)
+
+
+def gene_set_test(r, genes, gene_set, r_dist=None, n_perm=10000, null_dist=False, random_state=None):
+    """Permutation test of the mean correlation of a gene set
+
+    The score of the gene set is the mean correlation of its genes (e.g., from
+    :func:`spin_test_genes`). If the null correlations of all genes are provided
+    (`r_dist`), the score is compared to the mean correlation of the same genes
+    under each spin rotation. This is the recommended null, as it preserves both
+    the spatial autocorrelation of the map and the co-expression of the genes in
+    the set. Otherwise, the score is compared to the scores of random gene sets of
+    the same size drawn from all genes, which ignores both.
+
+    Parameters
+    ----------
+    r : 1D ndarray
+        Correlations of all genes, shape = (n_genes,). Genes with NaN correlations are ignored.
+    genes : list or 1D ndarray
+        Names of all genes, shape = (n_genes,)
+    gene_set : list or set
+        Names of the genes in the set, e.g., from :func:`enigmatoolbox.datasets.risk_genes`.
+        Genes that are not in `genes` are ignored with a warning.
+    r_dist : 2D ndarray, optional
+        Null correlations of all genes, shape = (n_genes, n_null), as returned by
+        :func:`spin_test_genes` with ``null_dist=True``. If None, random gene sets
+        are used instead. Default is None.
+    n_perm : int, optional
+        Number of random gene sets. Only used if `r_dist` is None. Default is 10000.
+    null_dist : bool, optional
+        Output null scores. Default is False.
+    random_state : int or None, optional
+        Random state. Only used if `r_dist` is None. Default is None.
+
+    Returns
+    -------
+    score : float
+        Mean correlation of the genes in the set
+    p_perm : float
+        Permutation p-value
+    score_dist : 1D ndarray
+        Null scores, shape = (n_null,) with `r_dist`, (n_perm,) otherwise.
+        Only if ``null_dist is True``.
+
+    See Also
+    --------
+    :func:`spin_test_genes`
+    """
+    r = np.asarray(r, dtype=float)
+    genes = np.asarray(genes)
+    if genes.shape != r.shape:
+        raise ValueError("Correlations and gene names do not match.")
+    if r_dist is not None:
+        r_dist = np.asarray(r_dist)
+        if r_dist.ndim != 2 or r_dist.shape[0] != r.size:
+            raise ValueError("Null correlations must have shape (n_genes, n_null).")
+
+    valid = ~np.isnan(r)
+    r, genes = r[valid], genes[valid]
+
+    gene_set = list(gene_set)
+    in_set = np.isin(genes, gene_set)
+    n_set = np.count_nonzero(in_set)
+    if n_set == 0:
+        raise ValueError("No genes of the gene set found.")
+    missing = np.setdiff1d(gene_set, genes)
+    if missing.size > 0:
+        warnings.warn('{0} of {1} genes of the gene set not found or with NaN correlations: {2}'
+                      .format(missing.size, len(gene_set), ', '.join(map(str, missing[:10]))
+                              + (', ...' if missing.size > 10 else '')))
+    score = r[in_set].mean()
+
+    if r_dist is not None:
+        # mean correlation of the same genes under each rotation
+        score_dist = r_dist[valid][in_set].mean(axis=0, dtype=float)
+    else:
+        # random gene sets are the smallest random keys of each row, drawn in chunks
+        rs = check_random_state(random_state)
+        score_dist = np.empty(n_perm)
+        chunk = max(1, _MAX_BATCH_ELEMENTS // r.size)
+        for i in range(0, n_perm, chunk):
+            keys = rs.random_sample((min(chunk, n_perm - i), r.size))
+            idx = np.argpartition(keys, n_set - 1, axis=1)[:, :n_set]
+            score_dist[i:i + idx.shape[0]] = r[idx].mean(axis=1)
+
+    p_perm = _n_exceed(score_dist, score) / score_dist.size
+
+    return (score, p_perm, score_dist) if null_dist else (score, p_perm)
+
+
+def _centered_operator(w, deflate=True):
+    """Doubly centred weight matrix as a LinearOperator.
+
+    The centred matrix is never built, so memory usage is that of `w`.
+
+    Parameters
+    ----------
+    w : ndarray or sparse matrix, shape = (n_vertices, n_vertices)
+        Symmetric spatial weight matrix.
+    deflate : bool, optional
+        If True, the constant vector, which is a zero eigenvector of the centred
+        matrix, is moved to the bottom of the spectrum so that it is never among
+        the leading eigenvectors. Default is True.
+
+    Returns
+    -------
+    op : LinearOperator
+        Centred weight matrix.
+    """
+    n = w.shape[0]
+
+    # the constant vector goes below the rest of the spectrum, using the Gershgorin bound
+    const_ev = -2 * float(abs(w).sum(axis=1).max()) if deflate else 0
+
+    def matmat(x):
+        x = np.asarray(x).reshape(n, -1)
+        mu = x.mean(axis=0)
+        y = np.asarray(w @ (x - mu))
+        return y - y.mean(axis=0) + const_ev * mu
+
+    def matvec(x):
+        return matmat(x)[:, 0]
+
+    return LinearOperator((n, n), matvec=matvec, rmatvec=matvec, matmat=matmat, dtype=np.float64)
+
+
+def _leading_eigh(w, n_components, solver='arpack', random_state=None):
+    """Leading eigenvalues/vectors of the doubly centred weight matrix.
+
+    Parameters
+    ----------
+    w : ndarray or sparse matrix, shape = (n_vertices, n_vertices)
+        Symmetric spatial weight matrix.
+    n_components : int
+        Number of eigenvectors.
+    solver : {'arpack', 'lobpcg', 'randomized'}, optional
+        Eigensolver. Default is 'arpack'.
+    random_state : int or None, optional
+        Random state of the initial vectors. Default is None.
+
+    Returns
+    -------
+    ev : 1D ndarray, shape (n_components,)
+        Eigenvalues in descending order.
+    mem : 2D ndarray, shape (n_vertices, n_components)
+        Eigenvectors in same order.
+    """
+    rs = check_random_state(random_state)
+    n = w.shape[0]
+
+    if solver == 'arpack':
+        op = _centered_operator(w)
+        ev, mem = eigsh(op, k=n_components, which='LA', v0=rs.uniform(-1, 1, n))
+
+    elif solver == 'lobpcg':
+        op = _centered_operator(w)
+        x = rs.normal(size=(n, n_components))
+        ev, mem = lobpcg(op, x, largest=True, maxiter=500)
+
+    elif solver == 'randomized':
+        # the centred matrix has large negative eigenvalues, so the range of the matrix
+        # would capture the eigenvalues largest in magnitude. The iteration uses the
+        # matrix shifted by (a bound on) its most negative eigenvalue, which is positive
+        # semidefinite and has the same leading eigenvectors.
+        op = _centered_operator(w, deflate=False)
+        ev_min = eigsh(op, k=1, which='SA', tol=1e-3, v0=rs.uniform(-1, 1, n))[0][0]
+        shift = max(0., -1.1 * ev_min)
+
+        # randomized subspace iteration (Halko et al., 2011), orthogonal to the
+        # constant vector, which is a zero eigenvector
+        q = rs.normal(size=(n, min(n - 1, 2 * n_components + 10)))
+        q, _ = np.linalg.qr(q - q.mean(axis=0))
+        ev = None
+        for _ in range(_RANDOMIZED_MAX_ITER):
+            y = op.matmat(q)
+
+            # Rayleigh-Ritz with the unshifted matrix, stop when eigenvalues converge
+            ev_prev, ev = ev, np.linalg.eigvalsh(q.T @ y)[-n_components:]
+            if ev_prev is not None and np.allclose(ev, ev_prev, rtol=0, atol=_RANDOMIZED_TOL * abs(ev).max()):
+                break
+            q, _ = np.linalg.qr(y + shift * q)
+
+        ev, mem = np.linalg.eigh(q.T @ op.matmat(q))
+        ev, mem = ev[-n_components:], q @ mem[:, -n_components:]
+
+    else:
+        raise ValueError("Unknown solver '{0}'.".format(solver))
+
+    order = np.argsort(ev)[::-1]
+    return ev[order], mem[:, order]
 
-    Parameters
-    ----------
-    map1 : narray, ndarray, or pandas.Series
-        One of two map to be correlated
-    map2 : narray, ndarray, or pandas.Series
-        The other map to be correlated
-    n_rot : int, optional
-        Number of shuffles. Default is 1000.
-    type : string, optional
-        Correlation type {'pearson', 'spearman'}. Default is 'pearson'.
-    null_dist : bool, optional
-        Output null correlations. Default is False.
 
-    Returns
-    -------
-    p_shuf : float
-        Permutation p-value
-    r_dist : 1D ndarray
-        Null correlations, shape = (n_rot*2,). Only if ``null_dist is True``.
+def _centered_eigh(w, n_components=None, solver='dense', random_state=None):
+    """Eigenvalues/vectors of the doubly centred weight matrix, in descending order.
+
+    With the dense solver, all eigenvalues/vectors are computed, including zero
+    ones. Otherwise, only the `n_components` leading ones.
     """
-    r = 0  # count successful (r) iterations unsuccessful (c) iterations
-    c = 0  # count unsuccessful (c) iterations
-    nroi = map1.shape[0]  # number of regions
+    if solver != 'dense':
+        if ssp.issparse(w):
+            w = w.tocsr()
+        return _leading_eigh(w, n_components, solver=solver, random_state=random_state)
 
-    # generate random permutations
-    perm_id = np.zeros((nroi, n_rot))
-    while (r < n_rot):
-        rot_lr_sort = np.random.permutation(nroi)
+    # Doubly centering weight matrix
+    if ssp.issparse(w):
+        m = w.mean(axis=0).A
+        wc = w.mean() - m - m.T
+
+        if not ssp.isspmatrix_coo(w):
+            w_format = w.format
+            w = w.tocoo(copy=False)
+            row, col = w.row, w.col
+            w = getattr(w, 'to' + w_format)(copy=False)
+        else:
+            row, col = w.row, w.col
+        wc[row, col] += w.data
 
-        # verify that permutation does not map to itself
-        if np.all(rot_lr_sort == range(nroi)) is not True:
-            perm_id[:, r] = rot_lr_sort
-            r = r + 1
-        elif np.all(rot_lr_sort == range(nroi)) is True:
-            c = c + 1
-            print('map to itself n.' + str(c))
-
-        # track progress
-        if np.mod(r, 100) == 0:
-            print('permutation ' + str(r) + ' of ' + str(n_rot))
-
-    # empirical correlation
-    rho_emp = pd.Series(map1).corr(pd.Series(map2), method=type)
-
-    # permutation of measures
-    x_perm = np.empty((0, nroi))
-    y_perm = np.empty((0, nroi))
-    for rr in range(n_rot):
-        x_perm2 = []
-        y_perm2 = []
-        for ii in range(nroi):
-            x_perm2 = np.append(x_perm2, map1[int(perm_id[ii, rr])])
-            y_perm2 = np.append(y_perm2, map2[int(perm_id[ii, rr])])
-        x_perm = np.vstack((x_perm, x_perm2))
-        y_perm = np.vstack((y_perm, y_perm2))
-
-    x_perm = np.transpose(x_perm)
-    y_perm = np.transpose(y_perm)
-
-    # correlation to unpermuted measures
-    rho_null_xy = []
-    rho_null_yx = []
-    for rr in range(n_rot):
-        rho_null_xy = np.append(rho_null_xy, pd.Series(x_perm[:, rr]).corr(pd.Series(map2), method=type))
-        rho_null_yx = np.append(rho_null_yx, pd.Series(map1).corr(pd.Series(y_perm[:, rr]), method=type))
-
-    # p-value definition depends on the sign of the empirical correlation
-    if rho_emp >= 0:
-        p_perm_xy = np.sum((rho_null_xy > rho_emp).astype(int)) / n_rot
-        p_perm_yx = np.sum((rho_null_yx > rho_emp).astype(int)) / n_rot
     else:
-        p_perm_xy = np.sum((rho_null_xy < rho_emp).astype(int)) / n_rot
-        p_perm_yx = np.sum((rho_null_yx < rho_emp).astype(int)) / n_rot
+        m = w.mean(axis=0, keepdims=True)
+        wc = w.mean() - m - m.T
+        wc += w
 
-    # average p-values
-    p_shuf = (p_perm_xy + p_perm_yx) / 2
+    # when using float64, eigh is unstable for sparse matrices
+    ev, mem = np.linalg.eigh(wc.astype(np.float32))
+    return ev[::-1], mem[:, ::-1]
 
-    # null distribution
-    r_dist = np.append(rho_null_xy, rho_null_yx)
 
-    if null_dist is True:
-        return p_shuf, r_dist
-    elif null_dist is not True:
-        return p_shuf
+def _mem_cache_name(w, n_components=None, solver='dense'):
+    """Name of stored Moran eigenvectors, identified by a checksum of the weight matrix.
+
+    `spectrum` and `tol` are applied after loading, so they are not part of the name.
+    """
+    if ssp.issparse(w):
+        w = w.tocsr(copy=True)
+        w.sum_duplicates()
+        w.sort_indices()
+        checksum = array_checksum(np.array(w.shape), w.indptr.astype(np.int64), w.indices.astype(np.int64),
+                                  w.data)
+    else:
+        checksum = array_checksum(w)
+
+    name = 'mem_{0}_{1}'.format(checksum[:16], solver)
+    if solver != 'dense':
+        name += '_k{0}'.format(n_components)
+    return name + '_v{0}'.format(_MEM_CACHE_VERSION)
 
 
-def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
+def _centered_eigh_cached(w, n_components=None, solver='dense', random_state=None):
+    """Same as :func:`_centered_eigh`, but read from the prebuilt entries or the
+    on-disk store when available, and added to the store otherwise.
+
+    Eigenvalues and eigenvectors are stored as separate ``.npy`` files, so that
+    they can be memory-mapped on load.
+    """
+    name = _mem_cache_name(w, n_components=n_components, solver=solver)
+    try:
+        cache_dirs = [_PREBUILT_MEM_DIR, get_cache_dir('mem')]
+    except OSError as e:
+        warnings.warn('Could not access Moran eigenvector store: {0}'.format(e))
+        cache_dirs = [_PREBUILT_MEM_DIR]
+
+    for pth in cache_dirs:
+        fname = os.path.join(pth, name + '_{0}.npy')
+        # eigenvectors are written last
+        if os.path.isfile(fname.format('mem')):
+            return np.load(fname.format('ev'), mmap_mode='r'), np.load(fname.format('mem'), mmap_mode='r')
+
+    ev, mem = _centered_eigh(w, n_components=n_components, solver=solver, random_state=random_state)
+    if len(cache_dirs) > 1:
+        try:
+            save_array(fname.format('ev'), ev)
+            save_array(fname.format('mem'), mem)
+        except OSError as e:
+            warnings.warn('Could not store Moran eigenvectors: {0}'.format(e))
+    return ev, mem
+
+
+def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10, n_components=None, solver='dense',
+                random_state=None, cache=False):
     """Compute Moran eigenvectors map.
 
     Parameters
@@ -490,6 +2025,30 @@ def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
     tol : float, optional
         Minimum value for an eigenvalue to be considered non-zero.
         Default is 1e-10.
+    n_components : int or None, optional
+        Number of leading eigenvectors (i.e., with the largest eigenvalues) to
+        compute. If None, compute all of them. Required if ``solver != 'dense'``.
+        Default is None.
+    solver : {'dense', 'arpack', 'lobpcg', 'randomized'}, optional
+        Eigensolver. If 'dense', the doubly centred weight matrix is built and
+        fully decomposed. Otherwise, double centring is applied implicitly and
+        only `n_components` eigenvectors are computed, which is required for
+        vertex-wise weight matrices. 'lobpcg' and 'randomized' iterate until
+        the eigenvalues converge, their eigenvectors are accurate to about 1e-5.
+        Default is 'dense'.
+    random_state : int or None, optional
+        Random state of the truncated solvers. Default is None.
+    cache : bool, optional
+        If True, eigenvectors are read from the on-disk store when available,
+        and added to the store otherwise. Entries are identified by a checksum
+        of the weight matrix, `solver` and `n_components`. Prebuilt entries are
+        shipped for the inverse distance weights (i.e., ``1 / d`` off the diagonal,
+        0 on the diagonal) of :func:`get_cortical_distance` and
+        :func:`get_subcortical_distance`, but not for vertex-wise fsa5 weights.
+        Dense eigenvalues are computed in single precision, so zero eigenvalues
+        of these weights are only resolved to about 1e-9: use ``tol=1e-6``.
+        The store is located in ``$ENIGMA_CACHE_DIR`` if set, otherwise in
+        ``~/.cache/enigmatoolbox``. Default is False.
 
     Returns
     -------
@@ -497,6 +2056,8 @@ def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
         Eigenvalues in descending order. With ``n_components = n_vertices - 1``
         if ``spectrum == 'all'`` and ``n_components = n_vertices - n_zero`` if
         ``spectrum == 'nonzero'``, and `n_zero` is number of zero eigenvalues.
+        With truncated solvers, at most `n_components`, and zero eigenvalues
+        are removed if ``spectrum == 'nonzero'``.
     mem : 2D ndarray, shape (n_vertices, n_components)
         Eigenvectors of the weight matrix in same order.
 
@@ -513,6 +2074,10 @@ def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
     """
     if spectrum not in ['all', 'nonzero']:
         raise ValueError("Unknown autocor '{0}'.".format(spectrum))
+    if solver not in ['dense', 'arpack', 'lobpcg', 'randomized']:
+        raise ValueError("Unknown solver '{0}'.".format(solver))
+    if solver != 'dense' and n_components is None:
+        raise ValueError("Solver '{0}' requires n_components.".format(solver))
 
     # If surface is provided instead of affinity
     if not (isinstance(w, np.ndarray) or ssp.issparse(w)):
@@ -523,28 +2088,17 @@ def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
     if not is_symmetric(w):
         w = make_symmetric(w, check=False, sparse_format='coo')
 
-    # Doubly centering weight matrix
-    if ssp.issparse(w):
-        m = w.mean(axis=0).A
-        wc = w.mean() - m - m.T
-
-        if not ssp.isspmatrix_coo(w):
-            w_format = w.format
-            w = w.tocoo(copy=False)
-            row, col = w.row, w.col
-            w = getattr(w, 'to' + w_format)(copy=False)
-        else:
-            row, col = w.row, w.col
-        wc[row, col] += w.data
-
+    if cache:
+        ev, mem = _centered_eigh_cached(w, n_components=n_components, solver=solver, random_state=random_state)
     else:
-        m = w.mean(axis=0, keepdims=True)
-        wc = w.mean() - m - m.T
-        wc += w
+        ev, mem = _centered_eigh(w, n_components=n_components, solver=solver, random_state=random_state)
 
-    # when using float64, eigh is unstable for sparse matrices
-    ev, mem = np.linalg.eigh(wc.astype(np.float32))
-    ev, mem = ev[::-1], mem[:, ::-1]
+    if solver != 'dense':
+        # the constant vector is never among the leading eigenvectors
+        mask_nonzero = np.abs(ev) >= tol
+        if spectrum == 'nonzero' and not mask_nonzero.all():
+            ev, mem = ev[mask_nonzero], mem[:, mask_nonzero]
+        return mem, ev
 
     # Remove zero eigen-value/vector
     ev_abs = np.abs(ev)
@@ -556,6 +2110,8 @@ def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
 
     # Multiple zero eigenvalues
     if spectrum == 'all':
+        # stored eigenvectors are read-only
+        ev, mem = np.array(ev), np.array(mem)
         if n_zero > 1:
             n = w.shape[0]
             memz = np.hstack([mem[:, mask_zero], np.ones((n, 1))])
@@ -575,11 +2131,86 @@ def compute_mem(w, n_ring=1, spectrum='nonzero', tol=1e-10):
         ev = ev[mask_nonzero]
         mem = mem[:, mask_nonzero]
 
+    if n_components is not None:
+        ev, mem = ev[:n_components], mem[:, :n_components]
+
     return mem, ev
 
 
+def _iter_moran_randomization(x, mem, n_rep=100, batch_size=100, procedure='singleton', joint=False,
+                              random_state=None, dtype=np.float64):
+    """Generate random samples from `x` based on Moran spectral randomization,
+    in batches of `batch_size` samples.
+
+    Batches are drawn from the same random stream, so concatenating them gives
+    the same samples for any `batch_size`.
+
+    Yields
+    ------
+    output : ndarray, shape = (batch_size, n_vertices, n_feat)
+        Random samples. The last batch may be smaller.
+    """
+    if x.ndim == 1:
+        x = np.atleast_2d(x).T
+
+    procedure = procedure.lower()
+    if procedure not in ['singleton', 'pair']:
+        raise ValueError("Unknown procedure '{0}'".format(procedure))
+
+    rs = check_random_state(random_state)
+
+    n_comp = mem.shape[1]
+    n_rows = x.shape[0]
+    n_cols = 1 if joint else x.shape[1]
+
+    rxv = 1 - cdist(x.T, mem.T, 'correlation').T
+    if procedure == 'pair':
+        n_pairs = n_comp // 2
+        n_top = 2 * n_pairs
+        is_odd = n_top != n_comp
+        rsq = rxv ** 2
+
+    x_mean = x.mean(axis=0)
+    x_std = x.std(axis=0, ddof=1)
+    scale = np.sqrt(n_rows - 1) * x_std
+    mem = mem.astype(dtype, copy=False)
+
+    for start in range(0, n_rep, batch_size):
+        n_batch = min(batch_size, n_rep - start)
+
+        if procedure == 'singleton':
+            rxv2 = rxv * rs.choice([-1., 1.], size=(n_batch, n_comp, n_cols))
+
+        else:  # pair
+            # random numbers are drawn per sample to keep the random stream,
+            # coefficients are then assembled for the whole batch
+            rxv2 = np.empty((n_batch,) + rxv.shape)
+            p = np.empty((n_batch, n_comp), dtype=int)
+            phi = np.empty((n_batch, n_pairs, n_cols))
+            for i in range(n_batch):
+                p[i] = rs.permutation(n_comp)
+
+                if is_odd:  # singleton method for last item
+                    rxv2[i, p[i, -1]] = rxv[p[i, -1]] * rs.choice([-1, 1], size=n_cols)
+
+                phi[i] = rs.uniform(0, 2 * np.pi, size=(n_pairs, n_cols))
+
+            # ia, ib = p[:, :n_top:2], p[:, 1:n_top:2]
+            ia, ib = p[:, :n_pairs], p[:, n_pairs:n_top]
+            if joint:
+                phi = phi + np.arctan2(rxv[ia], rxv[ib])
+            amp = np.sqrt(rsq[ia] + rsq[ib])
+            batch = np.arange(n_batch)[:, None]
+            rxv2[batch, ia] = amp * np.cos(phi)
+            rxv2[batch, ib] = amp * np.sin(phi)
+
+        sim = (mem @ rxv2.astype(dtype, copy=False)) * scale.astype(dtype)
+        sim += x_mean.astype(dtype)
+        yield sim
+
+
 def moran_randomization(x, mem, n_rep=100, procedure='singleton', joint=False,
-                        random_state=None):
+                        random_state=None, dtype=np.float64):
     """Generate random samples from `x` based on Moran spectral randomization.
 
     Parameters
@@ -599,6 +2230,8 @@ def moran_randomization(x, mem, n_rep=100, procedure='singleton', joint=False,
         randomized separately. Default is False.
     random_state : int or None, optional
         Random state. Default is None.
+    dtype : {np.float64, np.float32}, optional
+        Data type of the random samples. Default is np.float64.
 
     Returns
     -------
@@ -616,50 +2249,9 @@ def moran_randomization(x, mem, n_rep=100, procedure='singleton', joint=False,
       null models for irregularly spaced data using Moran spectral
       randomization methods. Methods in Ecology and Evolution, 6(10):1169-78.
     """
-    if x.ndim == 1:
-        x = np.atleast_2d(x).T
-
-    procedure = procedure.lower()
-    if procedure not in ['singleton', 'pair']:
-        raise ValueError("Unknown procedure '{0}'".format(procedure))
-
-    rs = check_random_state(random_state)
-
-    n_comp = mem.shape[1]
-    n_rows = x.shape[0]
-    n_cols = 1 if joint else x.shape[1]
-
-    rxv = 1 - cdist(x.T, mem.T, 'correlation').T
-    if procedure == 'singleton':
-        rxv2 = rxv * rs.choice([-1., 1.], size=(n_rep, n_comp, n_cols))
-
-    else:  # pair
-        n_pairs = n_comp // 2
-        n_top = 2 * n_pairs
-        is_odd = n_top != n_comp
-
-        rsq = rxv ** 2
-        rxv2 = np.empty((n_rep,) + rxv.shape)
-        for i in range(n_rep):
-            p = rs.permutation(n_comp)
-            # ia, ib = p[:n_top:2], p[1:n_top:2]
-            ia, ib = p[:n_pairs], p[n_pairs:n_top]
-
-            if is_odd:  # singleton method for last item
-                rxv2[i, p[-1]] = rxv[p[-1]] * rs.choice([-1, 1], size=n_cols)
-
-            phi = rs.uniform(0, 2 * np.pi, size=(n_pairs, n_cols))
-            if joint:
-                phi = phi + np.arctan2(rxv[ia], rxv[ib])
-            rxv2[i, ia] = rxv2[i, ib] = np.sqrt(rsq[ia] + rsq[ib])
-            rxv2[i, ia] *= np.cos(phi)
-            rxv2[i, ib] *= np.sin(phi)
-
-    x_mean = x.mean(axis=0)
-    x_std = x.std(axis=0, ddof=1)
-    sim = x_mean + (mem @ rxv2) * (np.sqrt(n_rows - 1) * x_std)
-
-    return sim.squeeze()
+    sim = _iter_moran_randomization(x, mem, n_rep=n_rep, batch_size=n_rep, procedure=procedure,
+                                    joint=joint, random_state=random_state, dtype=dtype)
+    return next(sim).squeeze()
 
 
 def is_symmetric(x, tol=1E-10):
@@ -743,52 +2335,60 @@ def make_symmetric(x, check=True, tol=1E-10, copy=True, sparse_format=None):
 
 def get_subcortical_distance(ventricles=False):
     """ """
+    ventricles = bool(ventricles)
+    if ventricles in _subcortical_distances:
+        return _subcortical_distances[ventricles].copy()
+
     sphere_lh, sphere_rh = load_fsa5(as_sphere=True, with_sctx=True)
 
     root_pth = os.path.dirname(__file__)
 
     # get centroids
-    annot_l = pd.read_csv(os.path.join(root_pth, 'annot', 'fsa5_with_sctx_lh_aparc_aseg.csv'))
-    annot_r = pd.read_csv(os.path.join(root_pth, 'annot', 'fsa5_with_sctx_rh_aparc_aseg.csv'))
-    if not ventricles:
-        centroid_l = np.empty((0, 3))
-        for ic in range(36, 44):
-            if not annot_l['structure'][36:44][ic] == "'vent'":
-                label = annot_l['label'][ic]
-                centroid_l = np.vstack((centroid_l, np.array(np.mean(sphere_lh.Points[annot_l[annot_l['label_annot'] ==
-                                                                                     label].index.values, :], axis=0))))
+    centroids = []
+    for side, sphere in zip(['lh', 'rh'], [sphere_lh, sphere_rh]):
+        annot = pd.read_csv(os.path.join(root_pth, 'annot', 'fsa5_with_sctx_{0}_aparc_aseg.csv'.format(side)))
+        sctx = annot[36:44]
+        if not ventricles:
+            sctx = sctx[sctx['structure'] != "'vent'"]
+        centroids.append(_label_centroids(sphere.Points, annot['label_annot'].to_numpy(), sctx['label'].to_numpy()))
+    centroids = np.vstack(centroids)
+
+    # get euclidean distance
+    w = cdist(centroids, centroids)
+
+    _subcortical_distances[ventricles] = w
+    return w.copy()
 
-        centroid_r = np.empty((0, 3))
-        for ic in range(36, 44):
-            if not annot_r['structure'][36:44][ic] == "'vent'":
-                label = annot_r['label'][ic]
-                centroid_r = np.vstack((centroid_r, np.array(np.mean(sphere_rh.Points[annot_r[annot_r['label_annot'] ==
-                                                                                     label].index.values, :], axis=0))))
 
-        centroids = np.append(centroid_l, centroid_r, axis=0)
+def get_cortical_distance():
+    """Euclidean distance between the centroids of the Desikan-Killiany regions
 
-        # get euclidean distance
-        w = cdist(centroids, centroids)
+    Centroids are computed on the fsaverage5 cortical surfaces, with regions
+    of the left hemisphere first, as in parcellated ENIGMA maps.
 
-    elif ventricles:
-        centroid_l = np.empty((0, 3))
-        for ic in range(36, 44):
-            label = annot_l['label'][ic]
-            centroid_l = np.vstack((centroid_l, np.array(np.mean(sphere_lh.Points[annot_l[annot_l['label_annot'] ==
-                                                                                     label].index.values, :], axis=0))))
+    Returns
+    -------
+    d : 2D ndarray
+        Distance matrix, shape = (68, 68)
+    """
+    if 'aparc' in _cortical_distances:
+        return _cortical_distances['aparc'].copy()
 
-        centroid_r = np.empty((0, 3))
-        for ic in range(36, 44):
-            label = annot_r['label'][ic]
-            centroid_r = np.vstack((centroid_r, np.array(np.mean(sphere_rh.Points[annot_r[annot_r['label_annot'] ==
-                                                                                     label].index.values, :], axis=0))))
+    surf_lh, surf_rh = load_fsa5(with_normals=False)
+    annotfiles, _ = _spin_files('fsa5', 'aparc')
 
-        centroids = np.append(centroid_l, centroid_r, axis=0)
+    # get centroids
+    centroids = []
+    for annotfile, surf in zip(annotfiles, [surf_lh, surf_rh]):
+        labels, label_ids = _annot_labels(annotfile)
+        centroids.append(_label_centroids(surf.Points, labels, label_ids))
+    centroids = np.vstack(centroids)
 
-        # get euclidean distance
-        w = cdist(centroids, centroids)
+    # get euclidean distance
+    d = cdist(centroids, centroids)
 
-    return w
+    _cortical_distances['aparc'] = d
+    return d.copy()
 
 
 class MoranRandomization(BaseEstimator):
@@ -813,6 +2413,14 @@ class MoranRandomization(BaseEstimator):
     tol : float, optional
         Minimum value for an eigenvalue to be considered non-zero.
         Default is 1e-10.
+    n_components : int or None, optional
+        Number of leading Moran eigenvectors. If None, use all. Default is None.
+    solver : {'dense', 'arpack', 'lobpcg', 'randomized'}, optional
+        Eigensolver. Use a truncated solver ('arpack', 'lobpcg' or 'randomized')
+        with `n_components` for vertex-wise surfaces. Default is 'dense'.
+    cache : bool, optional
+        Whether to reuse Moran eigenvectors from the on-disk store, and to add
+        them to the store if not already there. Default is False.
     random_state : int or None, optional
         Random state. Default is None.
 
@@ -828,7 +2436,8 @@ class MoranRandomization(BaseEstimator):
     :class:`.SpinPermutations`
     """
     def __init__(self, procedure='singleton', spectrum='nonzero', joint=False,
-                 n_rep=100, n_ring=1, tol=1e-10, random_state=None):
+                 n_rep=100, n_ring=1, tol=1e-10, n_components=None, solver='dense',
+                 cache=False, random_state=None):
 
         self.procedure = procedure
         self.spectrum = spectrum
@@ -836,6 +2445,9 @@ class MoranRandomization(BaseEstimator):
         self.n_rep = n_rep
         self.n_ring = n_ring
         self.tol = tol
+        self.n_components = n_components
+        self.solver = solver
+        self.cache = cache
         self.random_state = random_state
 
     def fit(self, w):
@@ -854,11 +2466,15 @@ class MoranRandomization(BaseEstimator):
             Returns self.
 
         """
-        self.mem_, self.mev_ = compute_mem(w, spectrum=self.spectrum,
-                                           tol=self.tol)
+        self.mem_, self.mev_ = compute_mem(w, n_ring=self.n_ring,
+                                           spectrum=self.spectrum, tol=self.tol,
+                                           n_components=self.n_components,
+                                           solver=self.solver,
+                                           random_state=self.random_state,
+                                           cache=self.cache)
         return self
 
-    def randomize(self, x):
+    def randomize(self, x, dtype=np.float64):
         """Generate random samples from `x`.
 
         Parameters
@@ -866,6 +2482,8 @@ class MoranRandomization(BaseEstimator):
         x : 1D or 2D ndarray, shape = (n_verts,) or (n_verts, n_feat)
             Array of variables arranged in columns, where `n_feat` is the
             number of variables.
+        dtype : {np.float64, np.float32}, optional
+            Data type of the random samples. Default is np.float64.
 
         Returns
         -------
@@ -875,5 +2493,379 @@ class MoranRandomization(BaseEstimator):
         """
         rand = moran_randomization(x, self.mem_, n_rep=self.n_rep,
                                    procedure=self.procedure, joint=self.joint,
-                                   random_state=self.random_state)
+                                   random_state=self.random_state, dtype=dtype)
         return rand
+
+    def iter_randomize(self, x, batch_size=100, reducer=None, dtype=np.float64):
+        """Generate random samples from `x` in batches.
+
+        Only one batch of samples is held in memory at a time. Concatenating
+        the batches gives the same samples as :meth:`randomize`.
+
+        Parameters
+        ----------
+        x : 1D or 2D ndarray, shape = (n_verts,) or (n_verts, n_feat)
+            Array of variables arranged in columns, where `n_feat` is the
+            number of variables.
+        batch_size : int, optional
+            Number of random samples per batch. Default is 100.
+        reducer : callable, optional
+            Function applied to each batch of random samples (e.g., to compute
+            null correlations), whose output is yielded instead of the samples.
+            Default is None.
+        dtype : {np.float64, np.float32}, optional
+            Data type of the random samples. Default is np.float64.
+
+        Yields
+        ------
+        output : ndarray, shape = (batch_size, n_verts, n_feat)
+            Random samples, the last batch may be smaller. If ``n_feat == 1``,
+            shape = (batch_size, n_verts). If `reducer` is provided, the output
+            of `reducer` for each batch instead.
+
+        """
+        n_feat = 1 if x.ndim == 1 else x.shape[1]
+        for rand in _iter_moran_randomization(x, self.mem_, n_rep=self.n_rep,
+                                              batch_size=batch_size,
+                                              procedure=self.procedure,
+                                              joint=self.joint,
+                                              random_state=self.random_state,
+                                              dtype=dtype):
+            if n_feat == 1:
+                rand = rand[..., 0]
+            yield rand if reducer is None else reducer(rand)
+
+
+_SMOOTHING_KERNELS = {
+    'exp': lambda d: np.exp(-d),
+    'gaussian': lambda d: np.exp(-1.25 * np.square(d)),
+    'uniform': lambda d: np.isfinite(d).astype(float),
+}
+
+
+def _knn_distances(d, n_neighbors=None):
+    """Distances to the nearest neighbours of each point, in ascending order.
+
+    Parameters
+    ----------
+    d : ndarray or sparse matrix, shape = (n, n)
+        Distance matrix. If sparse, only stored entries are neighbours.
+    n_neighbors : int or None, optional
+        Number of nearest neighbours kept. If None, keep all. Default is None.
+
+    Returns
+    -------
+    dist : ndarray, shape = (n, k)
+        Distances to neighbours. Points with less than `k` neighbours are
+        padded with inf.
+    idx : ndarray, shape = (n, k)
+        Indices of neighbours. Padded with the index of the point itself.
+    """
+    n = d.shape[0]
+
+    if ssp.issparse(d):
+        d = ssp.csr_matrix(d, dtype=float, copy=True)
+        d.setdiag(0)
+        d.eliminate_zeros()
+
+        nnz = np.diff(d.indptr)
+        k = nnz.max() if n_neighbors is None else min(n_neighbors, nnz.max())
+        rows = np.repeat(np.arange(n), nnz)
+        order = np.lexsort((d.data, rows))
+        pos = np.arange(d.nnz) - d.indptr[rows]
+        keep = pos < k
+
+        dist = np.full((n, k), np.inf)
+        idx = np.repeat(np.arange(n)[:, None], k, axis=1)
+        dist[rows[keep], pos[keep]] = d.data[order][keep]
+        idx[rows[keep], pos[keep]] = d.indices[order][keep]
+        return dist, idx
+
+    d = np.asarray(d, dtype=float)
+    k = n - 1 if n_neighbors is None else min(n_neighbors, n - 1)
+    dist = np.empty((n, k))
+    idx = np.empty((n, k), dtype=_index_dtype(n))
+
+    chunk = max(1, _MAX_BATCH_ELEMENTS // n)
+    for i in range(0, n, chunk):
+        rows = np.arange(i, min(i + chunk, n))
+        di = d[rows].copy()
+        di[np.arange(rows.size), rows] = np.inf  # exclude self
+        ii = np.argpartition(di, k - 1, axis=1)[:, :k] if k < n - 1 else np.argsort(di, axis=1)[:, :k]
+        dd = np.take_along_axis(di, ii, axis=1)
+        order = np.argsort(dd, axis=1, kind='stable')
+        dist[rows] = np.take_along_axis(dd, order, axis=1)
+        idx[rows] = np.take_along_axis(ii, order, axis=1)
+    return dist, idx
+
+
+def _smoothed_variogram(x, pair_i, pair_j, u, h, bandwidth):
+    """Gaussian-smoothed variogram of the maps in the columns of `x`, evaluated at
+    distances `h` using the pairs of points (`pair_i`, `pair_j`) at distance `u`.
+
+    Pairs are processed in chunks, so memory does not grow with the number of pairs.
+
+    Returns
+    -------
+    gamma : ndarray, shape = (n_bins, n_maps)
+        Variograms.
+    """
+    x = x.reshape(x.shape[0], -1)
+    num = np.zeros((h.size, x.shape[1]))
+    den = np.zeros((h.size, 1))
+
+    chunk = max(1, _MAX_BATCH_ELEMENTS // max(h.size, x.shape[1]))
+    for s in range(0, u.size, chunk):
+        w = np.exp(-.5 * np.square(2.68 * (u[s:s + chunk] - h[:, None]) / bandwidth))
+        v = .5 * np.square(x[pair_i[s:s + chunk]] - x[pair_j[s:s + chunk]])
+        num += w @ v
+        den += w.sum(axis=1, keepdims=True)
+    return num / den
+
+
+def _smoothing_matrix(dist, idx, k, kernel='exp'):
+    """Sparse row-normalized matrix smoothing each point over itself and its `k`
+    nearest neighbours, with weights decaying with distance.
+    """
+    n = dist.shape[0]
+    d = np.hstack([np.zeros((n, 1)), dist[:, :k]])
+    d_max = np.where(np.isfinite(d), d, 0).max(axis=1, keepdims=True)
+    d_max[d_max == 0] = 1
+
+    w = _SMOOTHING_KERNELS[kernel](d / d_max)
+    w /= w.sum(axis=1, keepdims=True)
+    cols = np.hstack([np.arange(n)[:, None], idx[:, :k]])
+    return ssp.csr_matrix((w.ravel(), cols.ravel(), np.arange(0, n * (k + 1) + 1, k + 1)), shape=(n, n))
+
+
+def _smoothing_matrices(dist, idx, deltas=None, kernel='exp'):
+    """Smoothing matrices of the neighbourhood sizes `deltas`, as fractions of the
+    number of neighbours (default 0.1, 0.2, ..., 0.9).
+    """
+    k_max = dist.shape[1]
+    if deltas is None:
+        deltas = np.arange(.1, 1, .1)
+    ks = np.unique(np.clip(np.round(np.asarray(deltas) * k_max).astype(int), 1, k_max))
+    return [_smoothing_matrix(dist, idx, k, kernel=kernel) for k in ks]
+
+
+def _iter_variogram_randomization(x, smoothers, h, bandwidth, pairs, n_rep=100, batch_size=100, resample=False,
+                                  random_state=None):
+    """Generate variogram-matching surrogates of `x` in batches of `batch_size`.
+
+    Each surrogate is a random permutation of `x` smoothed over its nearest
+    neighbours (with the matrices in `smoothers`), rescaled and with added noise
+    so that its variogram matches the variogram of `x`. Random numbers are drawn
+    surrogate by surrogate from the same random stream, so concatenating batches
+    gives the same surrogates for any `batch_size`.
+
+    Yields
+    ------
+    output : ndarray, shape = (batch_size, n_vertices)
+        Surrogates. The last batch may be smaller.
+    """
+    rs = check_random_state(random_state)
+    n = x.size
+
+    pair_i, pair_j, u = pairs
+    gamma_x = _smoothed_variogram(x, pair_i, pair_j, u, h, bandwidth)
+    x_sorted = np.sort(x)
+
+    for start in range(0, n_rep, batch_size):
+        n_batch = min(batch_size, n_rep - start)
+
+        x_perm = np.empty((n, n_batch))
+        noise = np.empty((n, n_batch))
+        for i in range(n_batch):
+            x_perm[:, i] = x[rs.permutation(n)]
+            noise[:, i] = rs.standard_normal(n)
+
+        # pick the neighbourhood size whose smoothed variogram best fits the one of x
+        best_sse = np.full(n_batch, np.inf)
+        best_y = np.empty((n, n_batch))
+        best_alpha = np.empty(n_batch)
+        best_beta = np.empty(n_batch)
+        for smoother in smoothers:
+            y = smoother @ x_perm
+            gamma_y = _smoothed_variogram(y, pair_i, pair_j, u, h, bandwidth)
+
+            gy_mean = gamma_y.mean(axis=0)
+            gy = gamma_y - gy_mean
+            gx = gamma_x - gamma_x.mean()
+            beta = (gy * gx).sum(axis=0) / np.square(gy).sum(axis=0)
+            alpha = gamma_x.mean() - beta * gy_mean
+            sse = np.square(gamma_x - alpha - beta * gamma_y).sum(axis=0)
+
+            better = sse < best_sse
+            best_sse[better] = sse[better]
+            best_y[:, better] = y[:, better]
+            best_alpha[better] = alpha[better]
+            best_beta[better] = beta[better]
+
+        surr = np.sqrt(np.abs(best_beta)) * best_y + np.sqrt(np.abs(best_alpha)) * noise
+
+        if resample:
+            # keep the ranks of the surrogates, with the values of x
+            rank = np.argsort(surr, axis=0)
+            np.put_along_axis(surr, rank, x_sorted[:, None], axis=0)
+
+        yield surr.T
+
+
+class VariogramRandomization(BaseEstimator):
+    """Variogram-matching surrogates.
+
+    Surrogates preserve the spatial autocorrelation of a map, as measured by its
+    variogram, and only need distances between points. Thus, they can be used
+    with subcortical (e.g., :func:`get_subcortical_distance`) or non-spherical
+    data (e.g., hippocampal surfaces).
+
+    Parameters
+    ----------
+    n_rep : int, optional
+        Number of randomizations. Default is 100.
+    n_neighbors : int or None, optional
+        Number of nearest neighbours of each point kept from the distance
+        matrix. Variograms and smoothing only use these neighbours, so memory
+        is O(n_vertices * n_neighbors). If None, keep all. Default is None.
+    deltas : 1D ndarray or None, optional
+        Neighbourhood sizes used to smooth permuted maps, as fractions of
+        `n_neighbors`. If None, use 0.1, 0.2, ..., 0.9. Default is None.
+    n_bins : int, optional
+        Number of distances at which variograms are evaluated. Default is 25.
+    pv : float, optional
+        Percentile of the distances between neighbours up to which variograms
+        are evaluated. Default is 25.
+    kernel : {'exp', 'gaussian', 'uniform'}, optional
+        Smoothing kernel. Default is 'exp'.
+    resample : bool, optional
+        If True, surrogates take the values of the original map (i.e., same
+        distribution), keeping their ranks. Default is False.
+    n_ring : int, optional
+        Neighborhood size to build the distance matrix. Only used if user
+        provides a surface mesh. Default is 1.
+    random_state : int or None, optional
+        Random state. Default is None.
+
+    Attributes
+    ----------
+    dist_ : 2D ndarray, shape (n_vertices, n_neighbors)
+        Distances to nearest neighbours in ascending order.
+    idx_ : 2D ndarray, shape (n_vertices, n_neighbors)
+        Indices of nearest neighbours in same order.
+    h_ : 1D ndarray, shape (n_bins,)
+        Distances at which variograms are evaluated.
+
+    See Also
+    --------
+    :class:`.MoranRandomization`
+
+    References
+    ----------
+    * Burt J.B., Helmer M., Shinn M., Anticevic A. and Murray J.D. (2020).
+      Generative modeling of brain maps with spatial autocorrelation.
+      NeuroImage, 220:117038.
+    """
+    def __init__(self, n_rep=100, n_neighbors=None, deltas=None, n_bins=25, pv=25,
+                 kernel='exp', resample=False, n_ring=1, random_state=None):
+
+        self.n_rep = n_rep
+        self.n_neighbors = n_neighbors
+        self.deltas = deltas
+        self.n_bins = n_bins
+        self.pv = pv
+        self.kernel = kernel
+        self.resample = resample
+        self.n_ring = n_ring
+        self.random_state = random_state
+
+    def fit(self, d):
+        """ Compute nearest neighbours and variogram distances.
+
+        Parameters
+        ----------
+        d : BSPolyData, ndarray or sparse matrix, shape = (n_verts, n_verts)
+            Distance matrix or surface. If sparse, only stored entries are
+            neighbours (e.g., output of :func:`get_ring_distance`). If surface,
+            the distance matrix is built based on the geodesic distance between
+            each vertex and the vertices in its `n_ring`.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+
+        """
+        if self.kernel not in _SMOOTHING_KERNELS:
+            raise ValueError("Unknown kernel '{0}'.".format(self.kernel))
+
+        # If surface is provided instead of distances
+        if not (isinstance(d, np.ndarray) or ssp.issparse(d)):
+            d = me.get_ring_distance(d, n_ring=self.n_ring, metric='geodesic')
+
+        self.dist_, self.idx_ = _knn_distances(d, n_neighbors=self.n_neighbors)
+
+        # pairs of neighbours up to the pv-th percentile of their distances
+        finite = np.isfinite(self.dist_)
+        u = self.dist_[finite]
+        u_max = np.percentile(u, self.pv)
+        keep = u <= u_max
+        pair_i = np.nonzero(finite)[0][keep]
+        pair_j = self.idx_[finite][keep]
+        self._pairs = pair_i, pair_j, u[keep]
+
+        self.h_ = np.linspace(u[keep].min(), u_max, self.n_bins)
+        self._bandwidth = 3 * (self.h_[1] - self.h_[0])
+
+        # smoothing only depends on the distances, not on the map
+        self._smoothers = _smoothing_matrices(self.dist_, self.idx_, deltas=self.deltas, kernel=self.kernel)
+        return self
+
+    def randomize(self, x):
+        """Generate surrogates of `x`.
+
+        Parameters
+        ----------
+        x : 1D ndarray, shape = (n_verts,)
+            Map to randomize.
+
+        Returns
+        -------
+        output : ndarray, shape = (n_rep, n_verts)
+            Surrogates.
+
+        """
+        return np.vstack(list(self.iter_randomize(x, batch_size=self.n_rep)))
+
+    def iter_randomize(self, x, batch_size=100, reducer=None):
+        """Generate surrogates of `x` in batches.
+
+        Only one batch of surrogates is held in memory at a time. Concatenating
+        the batches gives the same surrogates as :meth:`randomize`.
+
+        Parameters
+        ----------
+        x : 1D ndarray, shape = (n_verts,)
+            Map to randomize.
+        batch_size : int, optional
+            Number of surrogates per batch. Default is 100.
+        reducer : callable, optional
+            Function applied to each batch of surrogates (e.g., to compute
+            null correlations), whose output is yielded instead of the
+            surrogates. Default is None.
+
+        Yields
+        ------
+        output : ndarray, shape = (batch_size, n_verts)
+            Surrogates, the last batch may be smaller. If `reducer` is
+            provided, the output of `reducer` for each batch instead.
+
+        """
+        x = np.asarray(x, dtype=float)
+        if x.ndim != 1 or x.size != self.dist_.shape[0]:
+            raise ValueError('Map must be 1D with {0} values.'.format(self.dist_.shape[0]))
+
+        for surr in _iter_variogram_randomization(x, self._smoothers, self.h_, self._bandwidth, self._pairs,
+                                                  n_rep=self.n_rep, batch_size=batch_size,
+                                                  resample=self.resample, random_state=self.random_state):
+            yield surr if reducer is None else reducer(surr)
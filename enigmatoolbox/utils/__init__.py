@@ -1,5 +1,5 @@
 from .parcellation import (relabel_consecutive, parcel_to_surface, surface_to_parcel, subcorticalvertices)
-from .useful import (zscore_matrix, reorder_sctx)
+from .useful import (zscore_matrix, ZscoreReference, reorder_sctx)
 
 __all__ = ['relabel_consecutive',
            'parcel_to_surface',
@@ -7,4 +7,5 @@ __all__ = ['relabel_consecutive',
            'surface_to_parcel',
            'subcorticalvertices',
            'zscore_matrix',
+           'ZscoreReference',
            'reorder_sctx']
@@ -7,9 +7,24 @@ Utility functions for ENIMA-related analyses.
 
 
 import numpy as np
-import numpy.matlib as npm
+import pandas as pd
 
-def zscore_matrix(data, group, controlCode):
+
+def _site_reference(n, mean, std, site, index):
+    """Control statistics of each subject, from the statistics of their site.
+
+    Sites with fewer than 2 controls have no standard deviation and raise an error.
+    """
+    missing = pd.Index(site).difference(mean.index)
+    if len(missing) > 0:
+        raise ValueError("No controls at sites: {0}.".format(', '.join(map(str, missing))))
+    n = n.max(axis=1).reindex(pd.unique(site))
+    if (n < 2).any():
+        raise ValueError("Fewer than 2 controls at sites: {0}.".format(', '.join(map(str, n.index[n < 2]))))
+    return mean.reindex(site).set_axis(index), std.reindex(site).set_axis(index)
+
+
+def zscore_matrix(data, group, controlCode, site=None):
     """
     Z-score data relative to a given group (author: @saratheriver)
 
@@ -19,19 +34,126 @@ def zscore_matrix(data, group, controlCode):
         Data matrix (e.g. thickness data), shape = (n_subject, n_region)
     group : list
         Group assignment (e.g, [0, 0, 0, 1, 1, 1], same length as n_subject.
-    controlCode : int
-        Value that corresponds to "baseline" group
+    controlCode : int or list
+        Value (or values) that corresponds to "baseline" group
+    site : list, optional
+        Site of each subject, same length as n_subject. If provided, data are z-scored
+        relative to the controls of the same site. Default is None.
 
     Returns
     -------
     Z : pandas.DataFrame
         Z-scored data relative to control code
     """
-    C = [i for i, x in enumerate(group) if x == controlCode]
-    n = len(group)
-    z1 = data - npm.repmat(np.mean(data.iloc[C, ]), n, 1)
-    z2 = np.std(data.iloc[C, ], ddof=1)
-    return z1 / z2
+    data = pd.DataFrame(data)
+    controls = np.isin(np.asarray(group), controlCode)
+
+    if site is None:
+        return (data - data[controls].mean()) / data[controls].std(ddof=1)
+
+    # statistics of the controls of all sites in one grouped pass
+    site = np.asarray(site)
+    grouped = data[controls].groupby(site[controls])
+    mean, std = _site_reference(grouped.count(), grouped.mean(), grouped.std(ddof=1), site, data.index)
+    return (data - mean) / std
+
+
+class ZscoreReference:
+    """Incremental z-scoring relative to a given group
+
+    Means and variances of the controls are updated chunk by chunk, per site,
+    with the parallel variant of Welford's algorithm, so data can be read in
+    chunks (e.g., ``pd.read_csv(..., chunksize=10000)``) and never be loaded
+    at once.
+
+    Parameters
+    ----------
+    controlCode : int or list
+        Value (or values) that corresponds to "baseline" group
+
+    Attributes
+    ----------
+    n_ : pandas.DataFrame
+        Number of controls of each site (rows) and region (columns).
+    mean_ : pandas.DataFrame
+        Mean of controls of each site and region.
+    var_ : pandas.DataFrame
+        Variance (ddof=1) of controls of each site and region.
+    """
+
+    def __init__(self, controlCode):
+        self.controlCode = controlCode
+
+        self.n_ = None
+        self.mean_ = None
+        self._m2 = None
+
+    def partial_fit(self, data, group, site=None):
+        """Update control statistics with a chunk of subjects.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data matrix of the chunk, shape = (n_subject, n_region)
+        group : list
+            Group assignment, same length as n_subject.
+        site : list, optional
+            Site of each subject, same length as n_subject. Default is None, i.e., one site.
+
+        Returns
+        -------
+        self : ZscoreReference
+        """
+        data = pd.DataFrame(data)
+        controls = np.isin(np.asarray(group), self.controlCode)
+        site = np.zeros(data.shape[0], dtype=int) if site is None else np.asarray(site)
+
+        grouped = data[controls].groupby(site[controls])
+        n_b = grouped.count()
+        mean_b = grouped.mean()
+        m2_b = grouped.var(ddof=0) * n_b
+
+        if self.n_ is None:
+            self.n_, self.mean_, self._m2 = n_b, mean_b, m2_b
+            return self
+
+        # merge statistics of the chunk and previous chunks, sites may be new
+        sites = self.n_.index.union(n_b.index)
+        n_a, mean_a, m2_a = [x.reindex(sites).fillna(0) for x in [self.n_, self.mean_, self._m2]]
+        n_b, mean_b, m2_b = [x.reindex(sites).fillna(0) for x in [n_b, mean_b, m2_b]]
+
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean_ = mean_a + delta * (n_b / n)
+            self._m2 = m2_a + m2_b + delta ** 2 * (n_a * n_b / n)
+        self.n_ = n
+        return self
+
+    @property
+    def var_(self):
+        return self._m2 / (self.n_ - 1)
+
+    def transform(self, data, site=None):
+        """Z-score data relative to the controls (of the same site).
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Data matrix, shape = (n_subject, n_region)
+        site : list, optional
+            Site of each subject, same length as n_subject. Default is None, i.e., one site.
+
+        Returns
+        -------
+        Z : pandas.DataFrame
+            Z-scored data relative to control code
+        """
+        data = pd.DataFrame(data)
+        site = np.zeros(data.shape[0], dtype=int) if site is None else np.asarray(site)
+        mean, std = _site_reference(self.n_, self.mean_, np.sqrt(self.var_), site, data.index)
+        return (data - mean) / std
+
 
 def reorder_sctx(data):
     """
@@ -18,9 +18,10 @@ TEST_REQUIRES = [
         'pytest', 'coverage', 'pytest-cov', 'coveralls',
     ]
 
-INSTALL_REQUIRES = ['numpy>=1.11.0',
+INSTALL_REQUIRES = ['numpy>=1.17.0',
                     'scipy>=0.17.0',
                     'scikit-learn>=0.20.0',
+                    'joblib',
                     'matplotlib>=2.0.0',
                     'vtk>=8.1.0',
                     'nibabel',
@@ -64,11 +65,12 @@ setup(
         'Programming Language :: Python :: 3 :: Only',
     ],
     keywords='enigma surface connectivity atrophy',
-    packages=find_packages(exclude=['contrib', 'docs']),
+    packages=find_packages(exclude=['contrib', 'docs', 'tests', 'tests.*']),
     python_requires='>=3.5',
     install_requires=INSTALL_REQUIRES,
     extras_require={
         'test': TEST_REQUIRES + INSTALL_REQUIRES,
+        'numba': ['numba'],
     },
     include_package_data=True,
     zip_safe=False,
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Use a temporary cache directory, so tests never read or write the user cache."""
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('ENIGMA_CACHE_DIR', str(path))
+    return path
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+from enigmatoolbox._cache import get_cache_dir, file_checksum, array_checksum, save_array
+
+
+def test_get_cache_dir(cache_dir):
+    path = get_cache_dir('spins')
+    assert path == os.path.join(str(cache_dir), 'spins')
+    assert os.path.isdir(path)
+
+
+def test_file_checksum_invalidation(tmp_path):
+    fname = str(tmp_path / 'x.csv')
+    with open(fname, 'w') as f:
+        f.write('1,2,3\n')
+    checksum = file_checksum(fname)
+    assert file_checksum(fname) == checksum
+
+    # same size, different contents and modification time
+    with open(fname, 'w') as f:
+        f.write('1,2,4\n')
+    os.utime(fname, ns=(0, os.stat(fname).st_mtime_ns + 10 ** 9))
+    assert file_checksum(fname) != checksum
+
+
+def test_array_checksum():
+    x = np.arange(6)
+    assert array_checksum(x) == array_checksum(x.copy())
+    assert array_checksum(x) != array_checksum(x.reshape(2, 3))
+    assert array_checksum(x) != array_checksum(x.astype(float))
+
+
+def test_save_array(tmp_path):
+    fname = str(tmp_path / 'x.npy')
+    x = np.random.RandomState(0).randn(4, 3)
+    save_array(fname, x)
+    assert np.array_equal(np.load(fname), x)
+    assert os.listdir(str(tmp_path)) == ['x.npy']
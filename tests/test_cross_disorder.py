@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from enigmatoolbox.cross_disorder import cross_disorder_effect
+from enigmatoolbox.permutation_testing import spin_test, shuf_test
+
+
+@pytest.fixture(scope='module')
+def correlation():
+    return cross_disorder_effect(disorder=['22q', 'ocd'], method='correlation')
+
+
+def test_correlation_without_pvalues(correlation):
+    correlation_matrix, names = correlation
+    n = len(names['cortex'])
+    assert correlation_matrix['cortex'].shape == (n, n)
+    assert np.allclose(np.diag(correlation_matrix['cortex']), 1)
+
+
+def test_spin_pvalues(correlation):
+    correlation_matrix, pvalue_matrix, names = cross_disorder_effect(disorder=['22q', 'ocd'], method='correlation',
+                                                                     spin_pvalues=True, n_rot=100, random_state=0)
+    for region in ['cortex', 'subcortex']:
+        assert np.allclose(correlation_matrix[region], correlation[0][region])
+        assert pvalue_matrix[region].shape == correlation_matrix[region].shape
+        assert np.allclose(pvalue_matrix[region], pvalue_matrix[region].T)
+
+
+def test_spin_pvalues_match_pairwise_tests():
+    rs = np.random.RandomState(0)
+    cortex, subcortex = rs.randn(2, 68), rs.randn(2, 16)
+    _, pvalue_matrix, _ = cross_disorder_effect(
+        disorder=['22q'], method='correlation', additional_data_cortex=cortex, additional_name_cortex=['a', 'b'],
+        additional_data_subcortex=subcortex, additional_name_subcortex=['a', 'b'], spin_pvalues=True, n_rot=100,
+        random_state=0)
+
+    # same permutations as pairwise tests with the same random state
+    assert pvalue_matrix['cortex'][-2, -1] == pytest.approx(spin_test(*cortex, n_rot=100, random_state=0))
+    assert pvalue_matrix['subcortex'][-2, -1] == pytest.approx(shuf_test(*subcortex, n_rot=100, random_state=0))
+
+
+def test_additional_maps():
+    rs = np.random.RandomState(0)
+    correlation_matrix, pvalue_matrix, names = cross_disorder_effect(
+        disorder=['22q'], method='correlation', additional_data_cortex=rs.randn(1, 68),
+        additional_name_cortex=['extra'], additional_data_subcortex=rs.randn(2, 16),
+        additional_name_subcortex=['a', 'b'], spin_pvalues=True, n_rot=50, random_state=0)
+
+    assert list(names['cortex'][-1:]) == ['extra']
+    assert list(names['subcortex'][-2:]) == ['a', 'b']
+    for region in ['cortex', 'subcortex']:
+        assert correlation_matrix[region].shape == pvalue_matrix[region].shape == (len(names[region]),) * 2
@@ -0,0 +1,313 @@
+import gc
+import os
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+import pytest
+
+from enigmatoolbox.datasets import (load_conte69, load_fsa5, load_sc, load_fc, load_summary_stats, query_summary_stats,
+                                   structural_covariance, fetch_ahba, write_cifti, write_ciftis, CiftiWriter)
+from enigmatoolbox.datasets import base
+from enigmatoolbox.mesh.mesh_io import read_surface
+
+
+
+def _reference_structural_covariance(zdata):
+    """Loop-based networks of the original implementation."""
+    joint_var_matrix = np.zeros((zdata.shape[1], zdata.shape[1], zdata.shape[0]))
+    for kk in range(zdata.shape[0]):
+        for ii in range(zdata.shape[1]):
+            for jj in range(zdata.shape[1]):
+                joint_var_matrix[ii, jj, kk] = 1 / np.exp(np.square(zdata[kk, ii] - zdata[kk, jj]))
+    return joint_var_matrix
+
+_DISORDERS = ['22q', 'adhd', 'asd', 'bipolar', 'depression', 'epilepsy', 'ocd', 'schizophrenia']
+
+
+def test_load_summary_stats():
+    root_pth = os.path.join(os.path.dirname(base.__file__), 'summary_statistics')
+    on_disk = sorted(fn for fn in os.listdir(root_pth) if fn.endswith('.csv'))
+
+    files = []
+    for disorder in _DISORDERS:
+        stats = load_summary_stats(disorder)
+        for key in stats:
+            fname = os.path.basename(stats._files[key])
+            files.append(fname)
+            assert key.split('_')[0] == base._parse_summary_stats_name(fname)[2]
+            pd.testing.assert_frame_equal(stats[key], pd.read_csv(os.path.join(root_pth, fname)))
+
+    # every file on disk, each under one disorder
+    assert sorted(files) == on_disk
+
+    # keys of earlier releases
+    stats = load_summary_stats('depression')
+    assert stats._files['SubVol_recurrrent_vs_firstepisode'].endswith('mdd_recurrent-firstepisode_SubVol.csv')
+    assert stats._files['CortSurf_case_vs_controls_adult_early'].endswith(
+        'mddadult_case-controls_CortSurf_early.csv')
+    assert stats._files['SubVol_case_vs_controls_late'].endswith('mddlate_case-controls_SubVol.csv')
+    assert 'CortThick_psychP_vs_psychN' in load_summary_stats('22q')
+    assert 'CortThick_case_vs_controls_meta_analysis' in load_summary_stats('asd')
+    assert 'SubVol_medicatedcase_vs_unmedicated_adult' in load_summary_stats('ocd')
+    assert 'CortThick_case_vs_controls_ltle' in load_summary_stats('epilepsy')
+
+    with pytest.raises(ValueError):
+        load_summary_stats('unknown')
+
+
+def test_query_summary_stats(cache_dir, monkeypatch):
+    monkeypatch.setattr(base, '_summary_stats_store', {})
+    stats = load_summary_stats('depression')
+
+    values, tables, regions = query_summary_stats(disorder='depression', measure='CortThick', stat='se_icv')
+    assert values.shape == (tables.shape[0], regions.size)
+    assert list(tables['key']) == [k for k in stats if k.startswith('CortThick')]
+    for row, key in zip(values, tables['key']):
+        t = stats[key]
+        assert np.array_equal(row[pd.Index(regions).get_indexer(t['Structure'])], t['se_icv'])
+        assert np.isnan(row).sum() == regions.size - t.shape[0]
+
+    # criteria combine, lists select any
+    values, tables, _ = query_summary_stats(cohort=['mddadult', 'mddadolescent'], contrast='case-controls',
+                                            subgroup='firstepisode')
+    assert sorted(tables['key']) == ['CortSurf_case_vs_controls_adolescent_firstepisode',
+                                     'CortSurf_case_vs_controls_adult_firstepisode',
+                                     'CortThick_case_vs_controls_adolescent_firstepisode',
+                                     'CortThick_case_vs_controls_adult_firstepisode']
+    assert query_summary_stats(disorder='unknown')[0].shape == (0, 0)
+    with pytest.raises(ValueError):
+        query_summary_stats(stat='unknown')
+
+    # stored once, then memory-mapped from the cache directory
+    assert len(os.listdir(str(cache_dir / 'summary_stats'))) == 4
+    store = base._load_summary_stats_store()
+    assert base._load_summary_stats_store() is store
+    monkeypatch.setattr(base, '_summary_stats_store', {})
+    assert isinstance(base._load_summary_stats_store()['values'], np.memmap)
+    assert np.array_equal(query_summary_stats(cohort=['mddadult', 'mddadolescent'], contrast='case-controls',
+                                              subgroup='firstepisode')[0], values)
+
+    # rebuilt if the tables change
+    monkeypatch.setattr(base, 'file_checksum', lambda *fnames: 'f' * 64)
+    assert base._load_summary_stats_store() is not store
+    assert len(os.listdir(str(cache_dir / 'summary_stats'))) == 8
+
+
+def test_connectivity_cache(tmp_path, cache_dir, monkeypatch):
+    monkeypatch.setattr(base, '_connectivity_arrays', base.OrderedDict())
+    fname = str(tmp_path / 'conn.csv')
+    np.savetxt(fname, np.eye(3), delimiter=',')
+
+    x = base._load_connectivity_csv(fname)
+    assert np.array_equal(x, np.eye(3))
+    assert not x.flags.writeable
+    assert len(os.listdir(str(cache_dir / 'hcp_connectivity'))) == 1
+
+    # cache hit: same array from memory
+    assert base._load_connectivity_csv(fname) is x
+
+    # edited files are parsed again
+    np.savetxt(fname, 2 * np.eye(3), delimiter=',')
+    os.utime(fname, ns=(0, os.stat(fname).st_mtime_ns + 10 ** 9))
+    assert np.array_equal(base._load_connectivity_csv(fname), 2 * np.eye(3))
+    assert len(os.listdir(str(cache_dir / 'hcp_connectivity'))) == 2
+
+
+def test_connectivity_cache_eviction(tmp_path, cache_dir, monkeypatch):
+    monkeypatch.setattr(base, '_connectivity_arrays', base.OrderedDict())
+    monkeypatch.setattr(base, '_CONNECTIVITY_CACHE_SIZE', 2)
+    fnames = [str(tmp_path / 'conn{0}.csv'.format(i)) for i in range(3)]
+    for i, fn in enumerate(fnames):
+        np.savetxt(fn, i * np.eye(3), delimiter=',')
+
+    a, b = base._load_connectivity_csv(fnames[0]), base._load_connectivity_csv(fnames[1])
+    assert base._load_connectivity_csv(fnames[0]) is a  # a is now the most recently used
+    base._load_connectivity_csv(fnames[2])
+    assert len(base._connectivity_arrays) == 2
+
+    # least recently used is evicted from memory, and memory-mapped again from disk
+    assert base._load_connectivity_csv(fnames[0]) is a
+    b2 = base._load_connectivity_csv(fnames[1])
+    assert b2 is not b and isinstance(b2, np.memmap)
+    assert np.array_equal(b2, np.eye(3))
+    assert len(os.listdir(str(cache_dir / 'hcp_connectivity'))) == 3
+
+
+@pytest.mark.parametrize('load, prefix', [(load_sc, 'struc'), (load_fc, 'func')])
+def test_load_connectivity_matches_loadtxt(load, prefix):
+    root_pth = os.path.join(os.path.dirname(base.__file__), 'matrices', 'hcp_connectivity')
+    names = ['Matrix_ctx', 'Labels_ctx', 'Matrix_sctx', 'Labels_sctx']
+    for x, name in zip(load('schaefer_100'), names):
+        ref = np.loadtxt(os.path.join(root_pth, '{0}{1}_schaefer_100.csv'.format(prefix, name)),
+                         dtype=str if 'Labels' in name else float, delimiter=',')
+        assert x.dtype == ref.dtype
+        assert np.array_equal(x, ref)
+
+
+def test_template_surfaces_are_not_shared():
+    lh, _ = load_conte69()
+    points = lh.Points.copy()
+    normals = lh.PointData['Normals'].copy()
+
+    lh.Points[0] += 100
+    lh.PointData['Normals'][0] += 1
+    lh.append_array(np.zeros(lh.n_points), name='x', at='p')
+
+    lh2, _ = load_conte69()
+    assert np.array_equal(lh2.Points, points)
+    assert np.array_equal(lh2.PointData['Normals'], normals)
+    assert 'x' not in lh2.PointData.keys()
+
+
+@pytest.mark.parametrize('as_sphere', [False, True])
+def test_template_surfaces_match_read_surface(as_sphere):
+    root_pth = os.path.join(os.path.dirname(base.__file__), 'surfaces')
+    fname = 'fsa5_sphere_{0}.gii' if as_sphere else 'fsa5_{0}.gii'
+    for surf, side in zip(load_fsa5(as_sphere=as_sphere, with_normals=False), ['lh', 'rh']):
+        ref = read_surface(os.path.join(root_pth, fname.format(side)))
+        assert np.array_equal(surf.Points, ref.Points)
+        assert np.array_equal(surf.GetCells2D(), ref.GetCells2D())
+
+
+@pytest.mark.parametrize('max_block_elements', [2 ** 23, 500, 100])
+def test_structural_covariance_matches_loop(monkeypatch, max_block_elements):
+    monkeypatch.setattr(base, '_MAX_BLOCK_ELEMENTS', max_block_elements)
+    zdata = np.random.RandomState(0).randn(7, 12)
+    ref = _reference_structural_covariance(zdata)
+
+    x = structural_covariance(zdata)
+    assert x.shape == (12, 12, 7) and x.dtype == np.float64
+    assert np.allclose(x, ref, rtol=1e-12, atol=0)
+
+    i, j = np.triu_indices(12, k=1)
+    x = structural_covariance(zdata, triu=True)
+    assert np.allclose(x, ref[i, j], rtol=1e-12, atol=0)
+
+    x = structural_covariance(zdata, dtype=np.float32, triu=True)
+    assert x.dtype == np.float32
+    assert np.allclose(x, ref[i, j], rtol=1e-5, atol=0)
+
+
+def test_structural_covariance_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(base, '_MAX_BLOCK_ELEMENTS', 100)
+    zdata = np.random.RandomState(0).randn(7, 12)
+    ref = _reference_structural_covariance(zdata)
+
+    fname = str(tmp_path / 'networks.npy')
+    x = structural_covariance(zdata, dtype=np.float32, out=fname)
+    assert isinstance(x, np.memmap)
+    assert np.allclose(np.load(fname), ref, rtol=1e-5, atol=0)
+
+    out = np.empty((66, 7))
+    assert structural_covariance(zdata, triu=True, out=out) is out
+    assert np.allclose(out, ref[np.triu_indices(12, k=1)], rtol=1e-12, atol=0)
+    with pytest.raises(ValueError):
+        structural_covariance(zdata, out=out)
+
+
+def _ahba_csv(fname):
+    rs = np.random.RandomState(0)
+    df = pd.DataFrame(rs.rand(5, 4), columns=['A1BG', 'A2M', 'AAAS', 'ZZZ3'])
+    df.insert(0, 'label', ['L_a', 'L_b', 'R_a', 'R_b', 'Thal'])
+    df.to_csv(fname, index=False)
+    return pd.read_csv(fname)
+
+
+def test_fetch_ahba(tmp_path, cache_dir):
+    fname = str(tmp_path / 'ahba.csv')
+    ref = _ahba_csv(fname)
+
+    df = fetch_ahba(fname)
+    pd.testing.assert_frame_equal(df, ref, check_dtype=False, rtol=1e-6)
+    assert len(os.listdir(str(cache_dir / 'ahba'))) == 4
+
+    # columns of the full table, in the requested order
+    df = fetch_ahba(fname, genes=['AAAS', 'A1BG'])
+    pd.testing.assert_frame_equal(df, fetch_ahba(fname)[['label', 'AAAS', 'A1BG']])
+    with pytest.raises(ValueError, match='B2M'):
+        fetch_ahba(fname, genes=['A1BG', 'B2M'])
+
+    # edited files are imported again
+    ref = _ahba_csv(fname).assign(A2M=0.)
+    ref.to_csv(fname, index=False)
+    os.utime(fname, ns=(0, os.stat(fname).st_mtime_ns + 10 ** 9))
+    pd.testing.assert_frame_equal(fetch_ahba(fname), ref, check_dtype=False, rtol=1e-6)
+    assert len(os.listdir(str(cache_dir / 'ahba'))) == 8
+
+
+def test_fetch_ahba_offline(tmp_path, cache_dir, monkeypatch):
+    fname = str(tmp_path / 'allgenes_stable_r0.2.csv')
+    ref = _ahba_csv(fname)
+    monkeypatch.setattr(base, '_AHBA_URL', fname)
+
+    with pytest.raises(FileNotFoundError):
+        fetch_ahba(offline=True)
+
+    # fetched once, then read from the cache only
+    pd.testing.assert_frame_equal(fetch_ahba(), ref, check_dtype=False, rtol=1e-6)
+    os.remove(fname)
+    pd.testing.assert_frame_equal(fetch_ahba(offline=True), ref, check_dtype=False, rtol=1e-6)
+    pd.testing.assert_frame_equal(fetch_ahba(genes=['ZZZ3'], offline=True), ref[['label', 'ZZZ3']],
+                                  check_dtype=False, rtol=1e-6)
+
+
+def test_cifti_writer_round_trip(tmp_path):
+    data = np.random.RandomState(0).rand(3, 32492).astype(np.float32)
+    write_cifti(data, dpath=str(tmp_path), fname='ref.dscalar.nii', labels=['a', 'b', 'c'])
+
+    with CiftiWriter(str(tmp_path / 'out.dscalar.nii')) as writer:
+        writer.append(data[0], labels=['a'])
+        writer.append(data[1:], labels=['b', 'c'])
+
+    img, ref = nib.load(str(tmp_path / 'out.dscalar.nii')), nib.load(str(tmp_path / 'ref.dscalar.nii'))
+    assert np.array_equal(img.get_fdata(), data)
+    assert np.array_equal(img.get_fdata(), ref.get_fdata())
+    assert list(img.header.get_axis(0).name) == ['a', 'b', 'c']
+    assert sorted(os.listdir(str(tmp_path))) == ['out.dscalar.nii', 'ref.dscalar.nii']
+
+
+def test_cifti_writer_errors(tmp_path):
+    writer = CiftiWriter(str(tmp_path / 'out.dscalar.nii'))
+    with pytest.raises(ValueError, match='vertices'):
+        writer.append(np.zeros(10))
+    with pytest.raises(ValueError, match='labels'):
+        writer.append(np.zeros((2, 32492)), labels=['a'])
+
+    # temporary buffer is removed if the writer is never closed
+    writer.append(np.zeros(32492))
+    assert len(os.listdir(str(tmp_path))) == 1
+    del writer
+    gc.collect()
+    assert os.listdir(str(tmp_path)) == []
+
+    # no partial file on errors
+    with pytest.raises(RuntimeError):
+        with CiftiWriter(str(tmp_path / 'out.dscalar.nii')) as writer:
+            writer.append(np.zeros(32492))
+            raise RuntimeError
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.mark.parametrize('hemi, n_vertices', [('lh', 32492), ('both', 64984)])
+def test_write_ciftis(tmp_path, hemi, n_vertices):
+    rs = np.random.RandomState(0)
+    data = [rs.rand(n_vertices), rs.rand(2, n_vertices)]
+    labels = [None, ['a', 'b']]
+    write_ciftis(data, ['0.dscalar.nii', '1.dscalar.nii'], dpath=str(tmp_path), labels=labels, hemi=hemi, n_jobs=2)
+
+    for i, (x, lab) in enumerate(zip(data, labels)):
+        write_cifti(x, dpath=str(tmp_path), fname='ref.dscalar.nii', labels=lab, hemi=hemi)
+        img, ref = nib.load(str(tmp_path / '{0}.dscalar.nii'.format(i))), nib.load(str(tmp_path / 'ref.dscalar.nii'))
+        assert np.array_equal(img.get_fdata(), np.atleast_2d(x))
+        assert img.header.get_axis(0) == ref.header.get_axis(0)
+        assert img.header.get_axis(1) == ref.header.get_axis(1)
+
+    # brain models of the reference files, as in the original write_cifti
+    if hemi == 'lh':
+        root_pth = os.path.dirname(base.__file__)
+        ref = nib.load(os.path.join(root_pth, 'import_export', 'lh.conte69_ref.dscalar.nii'))
+        assert img.header.get_axis(1) == ref.header.get_axis(1)
+
+    with pytest.raises(ValueError):
+        write_ciftis(data, ['0.dscalar.nii'], dpath=str(tmp_path))
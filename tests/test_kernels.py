@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from enigmatoolbox.permutation_testing import _kernels, rotate_parcellation, set_backend
+from enigmatoolbox.permutation_testing import permutation_testing as pt
+
+
+def _rotated_coordinates(n_rot=3):
+    coord, _ = pt._spin_coordinates('fsa5', 'aparc')
+    rot = pt._random_rotations(n_rot, np.random.RandomState(0))
+    return coord, rot
+
+
+def test_rotate_greedy_python_matches_numpy():
+    # kernel source run by the Python interpreter, so it is checked without numba
+    coord, rot = _rotated_coordinates()
+    rot_ix = _kernels._rotate_greedy(coord, np.matmul(coord, rot))
+    assert np.array_equal(rot_ix, pt._match_greedy(pt._rotated_distances(coord, rot)))
+
+
+@pytest.mark.skipif(_kernels.has_numba, reason='numba is installed')
+def test_numba_backend_unavailable():
+    with pytest.raises(ImportError):
+        set_backend('numba')
+    assert not pt._use_numba()
+
+
+@pytest.mark.skipif(not _kernels.has_numba, reason='numba is not installed')
+def test_rotate_greedy_matches_numpy():
+    coord, rot = _rotated_coordinates(20)
+    rot_ix = _kernels.rotate_greedy(coord, np.matmul(coord, rot))
+    assert np.array_equal(rot_ix, pt._match_greedy(pt._rotated_distances(coord, rot)))
+
+
+@pytest.mark.skipif(not _kernels.has_numba, reason='numba is not installed')
+def test_rotate_parcellation_backends():
+    coord_l, coord_r = pt._spin_coordinates('fsa5', 'aparc')
+    try:
+        set_backend('numpy')
+        perm_numpy = rotate_parcellation(coord_l, coord_r, nrot=50, random_state=0)
+        set_backend('numba')
+        perm_numba = rotate_parcellation(coord_l, coord_r, nrot=50, random_state=0)
+    finally:
+        set_backend('auto')
+    assert np.array_equal(perm_numpy, perm_numba)
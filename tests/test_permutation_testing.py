@@ -0,0 +1,530 @@
+import os
+import warnings
+
+import nibabel as nb
+import numpy as np
+import pandas as pd
+import scipy.sparse as ssp
+import pytest
+
+from enigmatoolbox.permutation_testing import (perm_sphere_p, shuf_test, spin_test, spin_test_many, shuf_test_many,
+                                               precompute_spins, rotate_vertices,
+                                               MoranRandomization, VariogramRandomization, get_cortical_distance,
+                                               get_subcortical_distance, centroid_extraction_sphere,
+                                               spin_test_genes, gene_set_test)
+from enigmatoolbox.datasets import load_fsa5
+from enigmatoolbox.permutation_testing import permutation_testing as pt
+from enigmatoolbox._cache import file_checksum
+from scipy.linalg import subspace_angles
+from scipy.spatial.distance import cdist
+
+
+def _reference_perm_p(x, y, perm_id, corr_type='pearson'):
+    """Loop-based p-value of the original implementation."""
+    nperm = perm_id.shape[1]
+    rho_emp = pd.Series(x).corr(pd.Series(y), method=corr_type)
+
+    rho_null_xy = np.empty(nperm)
+    rho_null_yx = np.empty(nperm)
+    for rr in range(nperm):
+        pid = perm_id[:, rr].astype(int)
+        rho_null_xy[rr] = pd.Series(x[pid]).corr(pd.Series(y), method=corr_type)
+        rho_null_yx[rr] = pd.Series(x).corr(pd.Series(y[pid]), method=corr_type)
+
+    if rho_emp >= 0:
+        p_xy, p_yx = np.mean(rho_null_xy > rho_emp), np.mean(rho_null_yx > rho_emp)
+    else:
+        p_xy, p_yx = np.mean(rho_null_xy < rho_emp), np.mean(rho_null_yx < rho_emp)
+    return (p_xy + p_yx) / 2, np.append(rho_null_xy, rho_null_yx)
+
+
+def _reference_greedy(dist):
+    """Loop-based greedy matching of the original implementation, for one rotation."""
+    dist = dist.astype(float)
+    rot_ix = np.empty(dist.shape[0], dtype=int)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for _ in range(dist.shape[0]):
+            row_min = np.nanmin(dist, axis=1)
+            ref = np.argwhere(row_min == np.nanmax(row_min))[0, 0]
+            rot = np.argwhere(dist[ref] == np.nanmin(dist[ref]))[0, 0]
+            rot_ix[ref] = rot
+            dist[:, rot] = np.nan
+            dist[ref, :] = np.nan
+    return rot_ix
+
+
+def _reference_moran_randomization(x, mem, n_rep=100, procedure='singleton', joint=False, random_state=None):
+    """Moran spectral randomization of the original implementation."""
+    if x.ndim == 1:
+        x = np.atleast_2d(x).T
+    rs = np.random.RandomState(random_state)
+
+    n_comp = mem.shape[1]
+    n_cols = 1 if joint else x.shape[1]
+    rxv = 1 - cdist(x.T, mem.T, 'correlation').T
+    if procedure == 'singleton':
+        rxv2 = rxv * rs.choice([-1., 1.], size=(n_rep, n_comp, n_cols))
+    else:
+        n_pairs = n_comp // 2
+        n_top = 2 * n_pairs
+        rsq = rxv ** 2
+        rxv2 = np.empty((n_rep,) + rxv.shape)
+        for i in range(n_rep):
+            p = rs.permutation(n_comp)
+            ia, ib = p[:n_pairs], p[n_pairs:n_top]
+            if n_top != n_comp:
+                rxv2[i, p[-1]] = rxv[p[-1]] * rs.choice([-1, 1], size=n_cols)
+            phi = rs.uniform(0, 2 * np.pi, size=(n_pairs, n_cols))
+            if joint:
+                phi = phi + np.arctan2(rxv[ia], rxv[ib])
+            rxv2[i, ia] = rxv2[i, ib] = np.sqrt(rsq[ia] + rsq[ib])
+            rxv2[i, ia] *= np.cos(phi)
+            rxv2[i, ib] *= np.sin(phi)
+
+    sim = x.mean(axis=0) + (mem @ rxv2) * (np.sqrt(x.shape[0] - 1) * x.std(axis=0, ddof=1))
+    return sim.squeeze()
+
+
+def _reference_centroids(sphere_coords, annotfile, ventricles=False):
+    """Centroid extraction of the original implementation."""
+    centroid = []
+    if 'aparc_aseg' not in annotfile:
+        labels, ctab, names = nb.freesurfer.io.read_annot(annotfile, orig_ids=True)
+        for ic in range(ctab.shape[0]):
+            if names[ic].decode('utf-8') not in ['unknown', 'corpus', 'corpuscallosum', 'medialwall',
+                                                 'Background+FreeSurfer_Defined_Medial_Wall']:
+                centroid.append(sphere_coords[labels == ctab[ic, -1]].mean(axis=0))
+    else:
+        annot = pd.read_csv(annotfile)
+        excluded = ["'unknown'", "'corpuscallosum'"] + ([] if ventricles else ["'vent'"])
+        for ic in range(44):
+            if annot['structure'][ic] not in excluded:
+                idx = annot[annot['label_annot'] == annot['label'][ic]].index.values
+                centroid.append(sphere_coords[idx].mean(axis=0))
+    return np.array(centroid)
+
+
+def _inverse_distance_weights(n, seed=0):
+    d = cdist(*[np.random.RandomState(seed).rand(n, 3)] * 2)
+    w = np.zeros_like(d)
+    w[d > 0] = 1 / d[d > 0]
+    return w
+
+
+def _random_maps(n_maps, n_regions=68, seed=0):
+    return np.random.RandomState(seed).randn(n_maps, n_regions)
+
+
+@pytest.mark.parametrize('corr_type', ['pearson', 'spearman'])
+def test_perm_sphere_p_matches_loop(corr_type):
+    x, y = _random_maps(2)
+    rs = np.random.RandomState(1)
+    perm_id = np.column_stack([rs.permutation(x.size) for _ in range(200)])
+
+    p, r_dist = perm_sphere_p(x, y, perm_id, corr_type, null_dist=True)
+    p_ref, r_dist_ref = _reference_perm_p(x, y, perm_id, corr_type)
+    assert p == pytest.approx(p_ref)
+    assert np.allclose(r_dist, r_dist_ref)
+
+
+def test_shuf_test_matches_loop():
+    x, y = _random_maps(2)
+    p, r_dist = shuf_test(x, y, n_rot=250, null_dist=True, random_state=0)
+
+    # same shuffles as shuf_test
+    perm_id = np.hstack(list(pt._iter_permutations(pt._shuffle_chunk, (x.size,), 250, random_state=0)))
+    p_ref, r_dist_ref = _reference_perm_p(x, y, perm_id)
+    assert p == pytest.approx(p_ref)
+    assert np.allclose(r_dist, r_dist_ref)
+
+
+def test_match_greedy_matches_loop():
+    coord, _ = pt._spin_coordinates('fsa5', 'aparc')
+    rot = pt._random_rotations(20, np.random.RandomState(0))
+    dist = pt._rotated_distances(coord, rot)
+
+    rot_ix = pt._match_greedy(dist.copy())
+    for d, ix in zip(dist, rot_ix):
+        assert np.array_equal(ix, _reference_greedy(d))
+
+
+@pytest.mark.parametrize('method', ['greedy', 'hungarian'])
+def test_rotate_parcellation(method):
+    coord_l, coord_r = pt._spin_coordinates('fsa5', 'aparc')
+    perm_id = pt.rotate_parcellation(coord_l, coord_r, nrot=30, method=method, random_state=0)
+    n_l = coord_l.shape[0]
+
+    assert perm_id.shape == (n_l + coord_r.shape[0], 30)
+    for pid in perm_id.T:
+        # permutations within each hemisphere, never the identity
+        assert np.array_equal(np.sort(pid[:n_l]), np.arange(n_l))
+        assert np.array_equal(np.sort(pid[n_l:]), np.arange(n_l, pid.size))
+        assert not np.array_equal(pid, np.arange(pid.size))
+
+
+def test_spin_permutations_cache(cache_dir, monkeypatch):
+    perm_id = pt._spin_permutations('fsa5', 'aparc', n_rot=20, random_state=0)
+    assert len(list((cache_dir / 'spins').iterdir())) == 1
+
+    # cache hit: stored permutations are memory-mapped
+    cached = pt._spin_permutations('fsa5', 'aparc', n_rot=20, random_state=0)
+    assert isinstance(cached, np.memmap)
+    assert np.array_equal(cached, perm_id)
+
+    # not stored without an integer seed, or if disabled
+    pt._spin_permutations('fsa5', 'aparc', n_rot=20, random_state=None)
+    pt._spin_permutations('fsa5', 'aparc', n_rot=20, random_state=1, cache=False)
+    assert len(list((cache_dir / 'spins').iterdir())) == 1
+
+    # edited annotation or sphere files invalidate stored permutations
+    monkeypatch.setattr(pt, 'file_checksum', lambda *fnames: file_checksum(*fnames)[::-1])
+    regenerated = pt._spin_permutations('fsa5', 'aparc', n_rot=20, random_state=0)
+    assert not isinstance(regenerated, np.memmap)
+    assert np.array_equal(regenerated, perm_id)
+    assert len(list((cache_dir / 'spins').iterdir())) == 2
+
+
+def test_precompute_spins(monkeypatch):
+    fnames = precompute_spins(n_rot=5, random_state=0)
+    assert all(os.path.isfile(fn) for fn in fnames)
+    assert any('fsa5_with_sctx_aparc_aseg_vent' in os.path.basename(fn) for fn in fnames)
+
+    # spin_test reads the stored permutations instead of generating them
+    def fail(*args, **kwargs):
+        raise AssertionError('permutations were generated')
+
+    monkeypatch.setattr(pt, '_iter_permutations', fail)
+    x, y = _random_maps(2)
+    assert 0 <= spin_test(x, y, n_rot=5, random_state=0) <= 1
+
+    with pytest.raises(ValueError):
+        precompute_spins(n_rot=5, random_state=None)
+
+
+def test_spin_test_many_matches_spin_test():
+    maps_a, maps_b = _random_maps(2), _random_maps(3, seed=1)
+    r, p, r_dist = spin_test_many(maps_a.T, maps_b.T, n_rot=100, null_dist=True, random_state=0)
+    assert p.shape == r.shape == (2, 3)
+    assert r_dist.shape == (2, 3, 200)
+
+    for i, a in enumerate(maps_a):
+        for j, b in enumerate(maps_b):
+            p_ij, r_dist_ij = spin_test(a, b, n_rot=100, null_dist=True, random_state=0)
+            assert r[i, j] == pytest.approx(np.corrcoef(a, b)[0, 1])
+            assert p[i, j] == pytest.approx(p_ij)
+            assert np.allclose(r_dist[i, j], r_dist_ij)
+
+
+def test_permutations_do_not_depend_on_n_jobs():
+    x, y = _random_maps(2)
+    assert shuf_test(x, y, n_rot=250, random_state=0) == shuf_test(x, y, n_rot=250, random_state=0, n_jobs=2)
+
+    perm_id = pt._spin_permutations('fsa5', 'aparc', n_rot=250, random_state=0, cache=False)
+    assert np.array_equal(perm_id, pt._spin_permutations('fsa5', 'aparc', n_rot=250, random_state=0,
+                                                         cache=False, n_jobs=2))
+
+
+def test_random_state():
+    x, y = _random_maps(2)
+    int_p = spin_test(x, y, n_rot=50, null_dist=True, random_state=3)
+    assert np.array_equal(int_p[1], spin_test(x, y, n_rot=50, null_dist=True, random_state=3)[1])
+    assert not np.array_equal(int_p[1], spin_test(x, y, n_rot=50, null_dist=True, random_state=4)[1])
+
+    # without a seed, permutations follow the global random state
+    np.random.seed(3)
+    r_dist = spin_test(x, y, n_rot=50, null_dist=True)[1]
+    np.random.seed(3)
+    assert np.array_equal(r_dist, spin_test(x, y, n_rot=50, null_dist=True)[1])
+
+
+def _random_sphere(n, seed=0):
+    coord = np.random.RandomState(seed).randn(n, 3)
+    return coord / np.linalg.norm(coord, axis=1, keepdims=True)
+
+
+def test_rotate_vertices_matches_brute_force():
+    coord_l, coord_r = _random_sphere(300), _random_sphere(250, seed=1)
+    perm_id, _ = pt._rotate_vertices_chunk(coord_l, coord_r, 5, np.random.default_rng(0))
+    rot = pt._random_rotations(5, np.random.default_rng(0))
+
+    for pid, TL in zip(perm_id.T, rot):
+        TR = TL * pt._REFLECT_YZ
+        assert np.array_equal(pid[:300], cdist(coord_l @ TL.T, coord_l).argmin(axis=1))
+        assert np.array_equal(pid[300:], 300 + cdist(coord_r @ TR.T, coord_r).argmin(axis=1))
+
+
+def test_rotate_vertices_mask():
+    coord_l, coord_r = _random_sphere(300), _random_sphere(250, seed=1)
+    mask_l, mask_r = np.arange(300) % 3 > 0, np.arange(250) % 5 > 0
+    perm_id = rotate_vertices(coord_l, coord_r, nrot=10, mask_l=mask_l, mask_r=mask_r, random_state=0)
+
+    n_l = mask_l.sum()
+    assert perm_id.shape == (n_l + mask_r.sum(), 10)
+    assert perm_id.dtype == np.uint16
+    assert perm_id[:n_l].max() < n_l <= perm_id[n_l:].min()
+    assert np.array_equal(perm_id, rotate_vertices(coord_l[mask_l], coord_r[mask_r], nrot=10, random_state=0))
+
+
+def test_vertex_spin_test():
+    x, y = np.random.RandomState(0).randn(2, 20484)
+    p, r_dist = spin_test(x, y, parcellation_name=None, n_rot=10, null_dist=True, random_state=0)
+    assert 0 <= p <= 1
+    assert r_dist.shape == (20,)
+
+
+def test_return_shapes():
+    x, y = _random_maps(2)
+    perm_id = pt._spin_permutations('fsa5', 'aparc', n_rot=200, random_state=0)
+    assert np.isscalar(perm_sphere_p(x, y, perm_id))
+    p, r_dist = perm_sphere_p(x, y, perm_id, null_dist=True)
+    assert r_dist.shape == (400,)
+
+    # adaptive mode also returns the number of permutations used
+    p, n_used = perm_sphere_p(x, y, perm_id, adaptive=True)
+    p, r_dist, n_used = perm_sphere_p(x, y, perm_id, null_dist=True, adaptive=True)
+    assert 0 < n_used <= 200
+    assert r_dist.shape == (2 * n_used,)
+
+    assert len(spin_test(x, y, n_rot=200, random_state=0, adaptive=True)) == 2
+    assert len(spin_test(x, y, n_rot=200, random_state=0, null_dist=True, adaptive=True)) == 3
+    assert len(shuf_test(x, y, n_rot=200, random_state=0, adaptive=True)) == 2
+    assert len(shuf_test(x, y, n_rot=200, random_state=0, null_dist=True, adaptive=True)) == 3
+
+
+@pytest.mark.parametrize('test', [spin_test, shuf_test])
+def test_adaptive_decision(test):
+    x, noise = _random_maps(2, seed=2)
+    for y, significant in [(x + 0.2 * noise, True), (noise, False)]:
+        p_full = test(x, y, n_rot=1000, random_state=0)
+        p, n_used = test(x, y, n_rot=1000, random_state=0, adaptive=True)
+        assert (p_full < 0.05) == (p < 0.05) == significant
+
+        # clear decisions stop early
+        assert n_used < 1000
+
+
+@pytest.mark.parametrize('solver', ['arpack', 'lobpcg', 'randomized'])
+@pytest.mark.parametrize('n_components', [10, 40, 60])
+def test_truncated_solvers_match_dense(solver, n_components):
+    # inverse distance weights, whose centred matrix has large negative eigenvalues
+    w = _inverse_distance_weights(400)
+
+    m = w.mean(axis=0, keepdims=True)
+    ev_ref, mem_ref = np.linalg.eigh(w.mean() - m - m.T + w)
+    ev_ref, mem_ref = ev_ref[::-1][:n_components], mem_ref[:, ::-1][:, :n_components]
+
+    ev, mem = pt._centered_eigh(w, n_components=n_components, solver=solver, random_state=0)
+    assert mem.shape == (400, n_components)
+    assert np.allclose(ev, ev_ref, rtol=0, atol=1e-8 * ev_ref[0])
+    assert subspace_angles(mem, mem_ref).max() < 1e-4
+    assert np.allclose(mem.T @ mem, np.eye(n_components), atol=1e-8)
+
+
+@pytest.mark.parametrize('procedure', ['singleton', 'pair'])
+@pytest.mark.parametrize('joint', [False, True])
+def test_moran_randomization_matches_original(procedure, joint):
+    mem, _ = pt.compute_mem(_inverse_distance_weights(60), tol=1e-6)
+    x = _random_maps(2, n_regions=60).T
+
+    sim = pt.moran_randomization(x, mem, n_rep=30, procedure=procedure, joint=joint, random_state=0)
+    sim_ref = _reference_moran_randomization(x, mem, n_rep=30, procedure=procedure, joint=joint, random_state=0)
+    assert sim.shape == (30, 60, 2)
+    assert np.allclose(sim, sim_ref)
+
+
+@pytest.mark.parametrize('procedure', ['singleton', 'pair'])
+def test_moran_iter_randomize(procedure):
+    x = _random_maps(1, n_regions=60)[0]
+    msr = MoranRandomization(procedure=procedure, n_rep=25, tol=1e-6, random_state=0).fit(_inverse_distance_weights(60))
+    sim = msr.randomize(x)
+    assert sim.shape == (25, 60)
+
+    # batches concatenate to the same samples, for any batch size
+    for batch_size in [1, 7, 25, 100]:
+        assert np.allclose(np.concatenate(list(msr.iter_randomize(x, batch_size=batch_size))), sim)
+
+    means = list(msr.iter_randomize(x, batch_size=10, reducer=lambda s: s.mean(axis=1)))
+    assert [m.shape for m in means] == [(10,), (10,), (5,)]
+    assert np.allclose(np.concatenate(means), sim.mean(axis=1))
+
+    sim32 = msr.randomize(x, dtype=np.float32)
+    assert sim32.dtype == np.float32
+    assert np.allclose(sim32, sim, atol=1e-4)
+
+
+@pytest.mark.parametrize('solver', ['dense', 'arpack'])
+def test_mem_cache(cache_dir, solver):
+    w = _inverse_distance_weights(80)
+    kwargs = dict(tol=1e-6, solver=solver, n_components=None if solver == 'dense' else 20, random_state=0)
+    mem, ev = pt.compute_mem(w, **kwargs)
+
+    mem_stored, ev_stored = pt.compute_mem(w, cache=True, **kwargs)
+    assert len(os.listdir(str(cache_dir / 'mem'))) == 2
+    mem_cached, ev_cached = pt.compute_mem(w, cache=True, **kwargs)
+    for m, e in [(mem_stored, ev_stored), (mem_cached, ev_cached)]:
+        assert np.allclose(e, ev)
+        assert np.allclose(np.abs(m.T @ mem), np.eye(ev.size), atol=1e-4)
+
+
+def test_mem_cache_key():
+    w = _inverse_distance_weights(80)
+    name = pt._mem_cache_name(w)
+    assert pt._mem_cache_name(w.copy()) == name
+    assert pt._mem_cache_name(ssp.csr_matrix(w)) == pt._mem_cache_name(ssp.coo_matrix(w))
+
+    # changed weights, solver or number of components
+    w2 = w.copy()
+    w2[0, 1] = w2[1, 0] = 2 * w[0, 1]
+    assert pt._mem_cache_name(w2) != name
+    assert pt._mem_cache_name(w, n_components=10, solver='arpack') != name
+    assert pt._mem_cache_name(w, n_components=10, solver='arpack') != \
+        pt._mem_cache_name(w, n_components=20, solver='arpack')
+
+
+@pytest.mark.parametrize('d', [get_cortical_distance(), get_subcortical_distance(),
+                               get_subcortical_distance(ventricles=True)])
+def test_prebuilt_mem(cache_dir, d):
+    w = np.zeros_like(d)
+    w[d > 0] = 1 / d[d > 0]
+    assert os.path.isfile(os.path.join(pt._PREBUILT_MEM_DIR, pt._mem_cache_name(w) + '_mem.npy'))
+
+    mem, ev = pt.compute_mem(w, tol=1e-6)
+    mem_prebuilt, ev_prebuilt = pt.compute_mem(w, tol=1e-6, cache=True)
+    assert not os.path.exists(str(cache_dir / 'mem')) or not os.listdir(str(cache_dir / 'mem'))
+    assert np.allclose(ev_prebuilt, ev, atol=1e-4 * abs(ev).max())
+    assert np.allclose(np.abs(mem_prebuilt.T @ mem), np.eye(ev.size), atol=1e-3)
+
+
+@pytest.mark.parametrize('parcellation_name', ['aparc', 'glasser_360', 'schaefer_100', 'schaefer_1000'])
+def test_centroid_extraction_matches_original(parcellation_name):
+    annotfiles, _ = pt._spin_files('fsa5', parcellation_name)
+    for sphere, annotfile in zip(load_fsa5(as_sphere=True), annotfiles):
+        centroids = centroid_extraction_sphere(sphere.Points, annotfile)
+        assert np.allclose(centroids, _reference_centroids(sphere.Points, annotfile))
+
+        # memoized, but callers receive copies
+        centroids[:] = 0
+        assert np.allclose(centroid_extraction_sphere(sphere.Points, annotfile),
+                           _reference_centroids(sphere.Points, annotfile))
+
+
+@pytest.mark.parametrize('ventricles', [False, True])
+def test_centroid_extraction_subcortical_matches_original(ventricles):
+    annotfiles, _ = pt._spin_files('fsa5_with_sctx', 'aparc_aseg')
+    for sphere, annotfile in zip(load_fsa5(as_sphere=True, with_sctx=True), annotfiles):
+        centroids = centroid_extraction_sphere(sphere.Points, annotfile, ventricles=ventricles)
+        assert np.allclose(centroids, _reference_centroids(sphere.Points, annotfile, ventricles=ventricles))
+
+
+def _smooth_map(n=300, seed=0):
+    rs = np.random.RandomState(seed)
+    coord = rs.rand(n, 3)
+    return np.sin(4 * coord[:, 0]) + np.cos(3 * coord[:, 1]) + .1 * rs.randn(n), cdist(coord, coord)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'n_neighbors': 60, 'kernel': 'gaussian', 'resample': True}])
+def test_variogram_randomization(kwargs):
+    x, d = _smooth_map()
+    vr = VariogramRandomization(n_rep=20, random_state=0, **kwargs).fit(d)
+    surr = vr.randomize(x)
+    assert surr.shape == (20, 300)
+    assert surr.dtype == np.float64
+    if kwargs.get('resample'):
+        assert np.allclose(np.sort(surr, axis=1), np.sort(x))
+
+    # reproducible, and batches concatenate to the same surrogates
+    assert np.array_equal(surr, VariogramRandomization(n_rep=20, random_state=0, **kwargs).fit(d).randomize(x))
+    assert np.array_equal(np.vstack(list(vr.iter_randomize(x, batch_size=7))), surr)
+    assert not np.array_equal(surr, VariogramRandomization(n_rep=20, random_state=1, **kwargs).fit(d).randomize(x))
+
+
+def test_variogram_randomization_matches_variogram():
+    x, d = _smooth_map()
+    vr = VariogramRandomization(n_rep=50, random_state=0).fit(d)
+    variogram = lambda y: pt._smoothed_variogram(y.T, *vr._pairs, vr.h_, vr._bandwidth)
+
+    gamma_x = variogram(x)[:, 0]
+    gamma_surr = variogram(vr.randomize(x)).mean(axis=1)
+    gamma_perm = variogram(np.random.RandomState(0).permutation(x)).mean(axis=1)
+
+    # surrogates match the variogram of x, unlike random permutations
+    err_surr = np.abs(gamma_surr - gamma_x).max() / gamma_x.max()
+    err_perm = np.abs(gamma_perm - gamma_x).max() / gamma_x.max()
+    assert err_surr < 0.25
+    assert err_surr < err_perm / 3
+
+
+def test_compact():
+    coord_l, coord_r = pt._spin_coordinates('fsa5', 'aparc')
+    perm_id = pt.rotate_parcellation(coord_l, coord_r, nrot=50, random_state=0)
+    perm_compact = pt.rotate_parcellation(coord_l, coord_r, nrot=50, random_state=0, compact=True)
+    assert perm_id.dtype == np.float64
+    assert perm_compact.dtype == np.int16
+    assert np.array_equal(perm_compact, perm_id)
+
+    # null correlations in float32, p-values unchanged
+    x, y = _random_maps(2)
+    maps = _random_maps(3, seed=1).T
+    for test, args in [(spin_test, (x, y)), (shuf_test, (x, y)), (spin_test_many, (maps, maps)),
+                       (shuf_test_many, (maps, maps))]:
+        res = test(*args, n_rot=50, null_dist=True, random_state=0)
+        res_compact = test(*args, n_rot=50, null_dist=True, random_state=0, compact=True)
+        assert res_compact[-1].dtype == np.float32
+        assert np.allclose(res_compact[-1], res[-1], atol=1e-6)
+        assert np.array_equal(res_compact[-2], res[-2])
+
+    p, r_dist = perm_sphere_p(x, y, perm_compact, null_dist=True, compact=True)
+    assert r_dist.dtype == np.float32
+    assert p == perm_sphere_p(x, y, perm_id)
+
+
+def test_logging(capsys, caplog):
+    coord_l, coord_r = pt._spin_coordinates('fsa5', 'aparc')
+    x, y = _random_maps(2)
+
+    # silent by default
+    pt.rotate_parcellation(coord_l, coord_r, nrot=50, random_state=0)
+    spin_test(x, y, n_rot=50, random_state=0)
+    assert capsys.readouterr().out == ''
+    assert not caplog.records
+
+    with caplog.at_level('DEBUG', logger='enigmatoolbox.permutation_testing'):
+        perm_id = pt.rotate_parcellation(coord_l, coord_r, nrot=50, random_state=0)
+        perm_sphere_p(x, y, perm_id)
+    assert capsys.readouterr().out == ''
+
+    progress = [rec for rec in caplog.records if rec.levelname == 'DEBUG']
+    assert progress and progress[-1].n_done == progress[-1].n_total == 50
+
+    phases = {getattr(rec, 'phase', None): rec for rec in caplog.records if rec.levelname == 'INFO'}
+    assert phases['permutations'].n_done == 50
+    assert phases['permutations'].n_self >= 0
+    assert phases['null correlations'].n_perm == 50
+    assert phases['null correlations'].elapsed >= 0
+
+
+def test_spin_test_genes_matches_spin_test():
+    map1 = _random_maps(1)[0]
+    expression = _random_maps(5, seed=1).T
+    expression[[3, 10], 2] = np.nan
+
+    r, p, r_dist = spin_test_genes(map1, expression, n_rot=100, null_dist=True, random_state=0)
+    for k in range(expression.shape[1]):
+        p_k, r_dist_k = spin_test(map1, expression[:, k], n_rot=100, null_dist=True, random_state=0)
+        assert p[k] == pytest.approx(p_k)
+        assert np.allclose(r_dist[k], r_dist_k)
+
+
+def test_gene_set_test_spin_null():
+    map1 = _random_maps(1)[0]
+    expression = _random_maps(10, seed=1).T
+    genes = np.array(['gene{0}'.format(k) for k in range(10)])
+    r, _, r_dist = spin_test_genes(map1, expression, n_rot=100, null_dist=True, random_state=0)
+
+    with pytest.warns(UserWarning, match='1 of 4 genes'):
+        score, p, score_dist = gene_set_test(r, genes, ['gene1', 'gene4', 'gene7', 'missing'], r_dist=r_dist,
+                                             null_dist=True)
+    assert score == pytest.approx(r[[1, 4, 7]].mean())
+    assert np.allclose(score_dist, r_dist[[1, 4, 7]].mean(axis=0))
+    assert p == pt._n_exceed(score_dist, score) / r_dist.shape[1]
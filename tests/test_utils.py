@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from enigmatoolbox.utils import zscore_matrix, ZscoreReference
+
+
+def _cohort(seed=0):
+    rs = np.random.RandomState(seed)
+    data = pd.DataFrame(rs.randn(60, 4) + 3, columns=['r{0}'.format(k) for k in range(4)])
+    group = rs.randint(0, 2, 60)
+    group[:12] = 0
+    site = np.repeat(['a', 'b', 'c'], 4).tolist() + rs.choice(['a', 'b', 'c'], 48).tolist()
+    return data, group, np.array(site)
+
+
+def _reference_zscore_matrix(data, group, controlCode):
+    """Z-scores of the original implementation."""
+    C = [i for i, x in enumerate(group) if x == controlCode]
+    n = len(group)
+    z1 = data - np.tile(np.mean(data.iloc[C, ]), (n, 1))
+    z2 = np.std(data.iloc[C, ], ddof=1)
+    return z1 / z2
+
+
+def test_zscore_matrix():
+    data, group, _ = _cohort()
+    z = zscore_matrix(data, group, 0)
+    assert isinstance(z, pd.DataFrame)
+    assert list(z.columns) == list(data.columns)
+    assert np.allclose(z, _reference_zscore_matrix(data, group, 0))
+
+
+def test_zscore_matrix_site():
+    data, group, site = _cohort()
+    z = zscore_matrix(data, group, 0, site=site)
+    for s in np.unique(site):
+        controls = data[(group == 0) & (site == s)]
+        assert np.allclose(z[site == s], (data[site == s] - controls.mean()) / controls.std())
+
+
+@pytest.mark.parametrize('with_site', [False, True])
+def test_zscore_reference_matches_zscore_matrix(with_site):
+    data, group, site = _cohort()
+    site = site if with_site else None
+
+    ref = ZscoreReference(0)
+    for i in range(0, data.shape[0], 7):
+        ref.partial_fit(data[i:i + 7], group[i:i + 7], site=None if site is None else site[i:i + 7])
+
+    assert np.allclose(ref.transform(data, site=site), zscore_matrix(data, group, 0, site=site))
+
+
+def test_too_few_controls():
+    data, group, site = _cohort()
+    group[site == 'c'] = 1
+    group[np.flatnonzero(site == 'c')[0]] = 0
+
+    with pytest.raises(ValueError, match='Fewer than 2 controls at sites: c'):
+        zscore_matrix(data, group, 0, site=site)
+    with pytest.raises(ValueError, match='Fewer than 2 controls at sites: c'):
+        ZscoreReference(0).partial_fit(data, group, site=site).transform(data, site=site)
+
+    group[site == 'c'] = 1
+    with pytest.raises(ValueError, match='No controls at sites: c'):
+        zscore_matrix(data, group, 0, site=site)